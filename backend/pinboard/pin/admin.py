@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
     CustomUser, FriendshipRequest, Friendship, Board, Picture,
-    Pin, FollowStream, Like, Comment
+    Pin, FollowStream, Like, Comment, Tag
 )
 
 class FriendshipRequestAdmin(admin.ModelAdmin):
@@ -18,4 +18,5 @@ admin.site.register(Picture)
 admin.site.register(Pin)
 admin.site.register(FollowStream)
 admin.site.register(Like)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
+admin.site.register(Tag)
\ No newline at end of file
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PinConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pin'
+
+    def ready(self):
+        from . import signals  # noqa: F401  注册模型信号
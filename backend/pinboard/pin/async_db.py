@@ -0,0 +1,43 @@
+"""
+异步视图（pin/async_views.py）里的数据库调用
+
+Django 的异步 ORM（aget、async for 等）内部是 sync_to_async(thread_sensitive=True)，
+同一个事件循环里所有请求的查询都排队在同一个线程上执行。这里把同步的数据库调用放到
+线程池里，每个线程使用自己的连接，多个请求、同一个请求里互不依赖的查询可以同时等待数据库。
+
+PINBOARD_ASYNC_CONCURRENT_QUERIES=False 时退回到和异步 ORM 相同的单线程执行
+（测试在一个事务里运行，其他连接看不到测试数据）。
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+
+def concurrent():
+    return getattr(settings, 'PINBOARD_ASYNC_CONCURRENT_QUERIES', True)
+
+
+def _closing(func, args):
+    def call():
+        try:
+            return func(*args)
+        finally:
+            # 线程池里的连接不会在请求结束时关闭，按 CONN_MAX_AGE 处理
+            connection.close_if_unusable_or_obsolete()
+    return call
+
+
+async def run(func, *args):
+    """在线程池里执行一个同步的数据库调用"""
+    if not concurrent():
+        return await sync_to_async(func)(*args)
+    return await sync_to_async(_closing(func, args), thread_sensitive=False)()
+
+
+async def gather(*calls):
+    """并发执行互不依赖的 (func, *args) 调用，按顺序返回结果"""
+    if not concurrent():
+        return [await run(*call) for call in calls]
+    return await asyncio.gather(*(run(*call) for call in calls))
@@ -0,0 +1,135 @@
+"""
+最热的几个读接口的异步版本，在 ASGI 下运行（pinboard/asgi.py）
+
+DRF 的视图集只能同步执行，等待数据库时整个 worker 线程都被占住。这里用普通的
+Django 异步视图实现和同步接口完全相同的响应（响应体、游标响应头、ETag）：
+
+    /api/async/follow-streams/<id>/pictures/   对应 follow-streams/<id>/pictures/
+    /api/async/search/pins/                     对应 search/pins/
+    /api/async/boards/<id>/pins/                对应 boards/<id>/pins/
+
+数据库调用通过 pin/async_db.py 在线程池里执行（Django 的异步 ORM 把所有查询排在同一个
+线程上）；取到一页 Pin 之后，序列化需要的互不依赖的查询（各个关联对象的预取、当前用户
+点过赞的 Pin、当前用户的好友集合）并发执行。
+
+`python manage.py benchmark_async_reads` 在高并发下对比这些接口的同步和异步版本。
+"""
+import functools
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import async_db, batching, conditional, feed, search
+from .models import Board, FollowStream, Pin
+from .pagination import PIN_ORDERING, KeysetPagination, PinCursorPagination
+from .serializers import PinSerializer
+from .views import SearchViewSet
+
+
+async def aprime_pins(context, pins):
+    """batching.prime_pins 的异步版本"""
+    pins = batching.unprimed_pins(context, pins)
+    if not pins:
+        return
+    target_ids = {batching.like_target_id(pin) for pin in pins}
+    # 每个关系的预取各是一组查询，和点赞、好友集合一起并发执行
+    *_, friend_ids = await async_db.gather(
+        *((batching.prefetch_pin_relations, pins, lookup) for lookup in batching.pin_prefetches()),
+        (batching.prime_liked, context, target_ids),
+        (batching.viewer_friend_ids, context),
+    )
+    batching.prime_user_stats(context, batching.pin_user_ids(pins), friend_ids)
+    batching.mark_primed(context, pins)
+
+
+def _json(data, status=200, headers=None):
+    # 和 DRF 的 JSONRenderer 输出相同的字节
+    return HttpResponse(
+        JSONRenderer().render(data), status=status, headers=headers, content_type='application/json',
+    )
+
+
+def _error(exc):
+    response = _json({'detail': exc.detail}, status=exc.status_code)
+    if exc.status_code == 401:
+        response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def api_view(view):
+    """
+    把 Django 请求包装成 DRF 请求（认证、query_params），在线程里完成认证，
+    DRF 异常转换成和同步接口相同的错误响应
+    """
+    @require_GET
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request, authenticators=[cls() for cls in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            # 认证缓存未命中时要查库
+            await async_db.run(lambda: request.user)
+            return await view(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return _error(exc)
+    return wrapper
+
+
+async def _paginated_pins(request, paginator, pins):
+    context = {'request': request}
+    await aprime_pins(context, pins)
+    data = PinSerializer(pins, many=True, context=context).data
+    return _json(data, headers=paginator.get_cursor_headers())
+
+
+@api_view
+async def stream_pictures(request, pk):
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    # 查询集在事件循环上构建，只用 pk，不读 request.user 的其他字段
+    stream = await async_db.run(FollowStream.objects.filter(user_id=request.user.pk, pk=pk).first)
+    if stream is None:
+        raise exceptions.NotFound('No FollowStream matches the given query.')
+
+    async def render():
+        paginator = PinCursorPagination()
+        pins = await feed.apaginate_stream(stream, paginator, request)
+        return await _paginated_pins(request, paginator, pins)
+
+    return await conditional.aconditional_response(
+        request,
+        await conditional.aetag(
+            request, 'stream', stream.pk, stream.version,
+            conditional.likes_version('stream', stream.pk), request.get_full_path(),
+        ),
+        stream.updated_at, render,
+    )
+
+
+@api_view
+async def search_pins(request):
+    query = request.query_params.get('q', '').strip()
+    sort_by = request.query_params.get('sort_by', 'timestamp')
+    if not query:
+        return _json({"error": "Query parameter 'q' is required."}, status=400)
+
+    # 可用的索引按数据库缓存，第一次检查要查库
+    await async_db.gather((search.fts_available,), (search.trigram_available,))
+    pins = search.PIN_INDEX.filter(Pin.objects.with_related(), query)
+    pins, ordering = SearchViewSet()._rank(
+        search.PIN_INDEX, pins, query, sort_by, SearchViewSet.PIN_SORT_ORDERINGS.get(sort_by, PIN_ORDERING),
+    )
+    paginator = KeysetPagination(ordering=ordering)
+    return await _paginated_pins(request, paginator, await paginator.apaginate_queryset(pins, request))
+
+
+@api_view
+async def board_pins(request, pk):
+    if not await async_db.run(Board.objects.filter(pk=pk).exists):
+        raise exceptions.NotFound('No Board matches the given query.')
+    paginator = PinCursorPagination()
+    pins = await paginator.apaginate_queryset(Pin.objects.filter(board_id=pk).with_related(), request)
+    return await _paginated_pins(request, paginator, pins)
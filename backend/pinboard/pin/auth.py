@@ -0,0 +1,188 @@
+"""
+带缓存的 Token 认证
+
+DRF 的 TokenAuthentication 每个请求都要联表查一次 authtoken_token 和用户，是最频繁的查询。
+CachedTokenAuthentication 把 token -> 用户 id 放在进程内的 LRU 缓存里（最多
+PINBOARD_TOKEN_CACHE_SIZE 个，PINBOARD_TOKEN_CACHE_TIMEOUT 秒后重新查库）。
+
+作废是跨进程的：每个用户在共享的 Django 缓存（PINBOARD_TOKEN_CACHE_ALIAS，多进程部署时
+必须是 Redis / Memcached 这类共享后端）里有一个版本号，登出、修改密码、轮换 token 和用户资料
+变化时由 pin/signals.py 换掉它。命中本地条目时先比较版本号（一次缓存读取），不一致就重新查库，
+所以其他 worker 进程里的条目在下一个请求就失效。
+
+缓存里是用户的 CACHED_FIELDS（id、username、is_active、is_staff、is_superuser），request.user
+是只加载了这几个字段的 CustomUser 实例：按用户过滤、给外键赋值、比较是不是同一个用户、权限
+检查都不查库。点赞 / 取消点赞、按当前用户过滤的列表（我的 Board、关注流、好友请求、上传会话）
+这类响应里没有当前用户资料的接口，命中缓存时认证不查库。其他字段是延迟字段，第一次读到时
+一次查出剩下的字段（CustomUser.refresh_from_db），计数（用 F() 更新，不发信号）总是最新的；
+响应里序列化了当前用户的接口（创建 Board / Pin / 关注流、/api/users/me/）和 DRF 默认的认证
+一样查一次用户。这几个字段只在 save() 时变化，由 pin/signals.py 作废缓存。
+
+token 签发 PINBOARD_TOKEN_TTL 秒后过期（None 表示不过期），过期的 token 被删除，
+重新登录时签发新的。
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+KEY_PREFIX = 'pinboard:auth'
+# 缓存的用户字段，request.user 读这些字段不查库
+CACHED_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+_lock = threading.Lock()
+# token key -> (用户 id, CACHED_FIELDS 的值, token 过期时间, 缓存条目过期的 monotonic 时间, 用户的版本号)
+_entries = OrderedDict()
+# user_id -> token key，用户变化时按用户失效
+_keys = {}
+
+
+def cache_size():
+    return getattr(settings, 'PINBOARD_TOKEN_CACHE_SIZE', 10000)
+
+
+def cache_timeout():
+    return getattr(settings, 'PINBOARD_TOKEN_CACHE_TIMEOUT', 60)
+
+
+def _cache():
+    return caches[getattr(settings, 'PINBOARD_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def version(user_id):
+    """用户当前的版本号，不在缓存里（被淘汰）时生成一个新的"""
+    return _cache().get_or_set(_version_key(user_id), lambda: uuid.uuid4().hex, timeout=None)
+
+
+def expires_at(token):
+    ttl = getattr(settings, 'PINBOARD_TOKEN_TTL', None)
+    return None if ttl is None else token.created + timedelta(seconds=ttl)
+
+
+def _expired(expires):
+    return expires is not None and expires <= timezone.now()
+
+
+def _get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if entry[3] <= time.monotonic():
+            _discard(key)
+            return None
+        _entries.move_to_end(key)
+    # 其他进程作废了这个用户的 token 时版本号已经变了；缓存被清空时同样视为失效
+    if _cache().get(_version_key(entry[0])) != entry[4]:
+        with _lock:
+            _discard(key)
+        return None
+    return entry
+
+
+def _put(key, user, expires, user_version):
+    values = tuple(getattr(user, name) for name in CACHED_FIELDS)
+    entry = (user.pk, values, expires, time.monotonic() + cache_timeout(), user_version)
+    with _lock:
+        _discard(_keys.get(user.pk))
+        _entries[key] = entry
+        _keys[user.pk] = key
+        while len(_entries) > cache_size():
+            _discard(next(iter(_entries)))
+    return entry
+
+
+def _discard(key):
+    """删除一个条目（调用时持有 _lock）"""
+    entry = _entries.pop(key, None)
+    if entry is not None and _keys.get(entry[0]) == key:
+        del _keys[entry[0]]
+
+
+def _bump(user_id):
+    _cache().set(_version_key(user_id), uuid.uuid4().hex, timeout=None)
+    with _lock:
+        _discard(_keys.get(user_id))
+
+
+def invalidate_user(user_id):
+    """让所有进程里这个用户的缓存条目失效"""
+    _bump(user_id)
+    # 提交前并发的请求可能又按旧的数据库状态缓存了条目，提交后再换一次版本号
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _keys.clear()
+
+
+# --- 签发 -------------------------------------------------------------------
+
+def issue(user):
+    """登录：返回用户现有的有效 token，没有或已经过期时签发新的"""
+    token = Token.objects.filter(user=user).first()
+    if token is not None and not _expired(expires_at(token)):
+        return token
+    return rotate(user)
+
+
+def rotate(user):
+    """作废用户现有的 token 并签发新的"""
+    with transaction.atomic():
+        revoke(user)
+        return Token.objects.create(user=user)
+
+
+def revoke(user):
+    # 逐个删除以触发 post_delete 信号，清掉缓存条目
+    for token in Token.objects.filter(user=user):
+        token.delete()
+
+
+# --- 认证 -------------------------------------------------------------------
+
+def cached_user(values):
+    """只加载了 CACHED_FIELDS 的用户实例，其他字段读到时按主键查库"""
+    model = get_user_model()
+    loaded = dict(zip(CACHED_FIELDS, values))
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in loaded]
+    return model.from_db(router.db_for_read(model), names, [loaded[name] for name in names])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        user = None
+        entry = _get(key)
+        if entry is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            user = token.user
+            if not user.is_active:
+                raise exceptions.AuthenticationFailed('User inactive or deleted.')
+            entry = _put(key, user, expires_at(token), version(user.pk))
+
+        user_id, values, expires, _, _ = entry
+        if _expired(expires):
+            Token.objects.filter(key=key).delete()
+            invalidate_user(user_id)
+            raise exceptions.AuthenticationFailed('Token has expired.')
+        # 每个请求一个新的实例，视图对它的修改不会留在缓存里
+        return user or cached_user(values), Token(key=key, user_id=user_id)
@@ -0,0 +1,173 @@
+"""
+序列化时的批量预取工具
+
+PinSerializer / UserSerializer 里的 SerializerMethodField 如果直接查库，
+列表接口会变成 O(pins × users) 次查询。这里把同一个请求内需要的、
+和当前用户相关的数据（点过赞的 Pin、好友关系）一次性批量查出来，
+缓存在请求上，序列化字段只从缓存里读。点赞数、board/pin 数量是模型上的计数列。
+"""
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
+
+from . import friends, like_buffer
+from .models import Comment, Like, Pin
+
+
+# Board 摘要里的封面缩略图数量
+COVER_COUNT = 4
+
+
+def _new_cache():
+    return {'pins': set(), 'liked': {}, 'users': {}, 'covers': {}}
+
+
+def serialization_cache(context):
+    """
+    获取当前请求共享的缓存字典。
+    有 request 时挂在 request 上，这样同一个请求里的多个序列化器可以复用；
+    没有 request 时退回到序列化器自己的 context。
+    """
+    request = context.get('request')
+    if request is None:
+        return context.setdefault('_serialization_cache', _new_cache())
+    cache = getattr(request, '_serialization_cache', None)
+    if cache is None:
+        cache = request._serialization_cache = _new_cache()
+    return cache
+
+
+def _viewer(context):
+    request = context.get('request')
+    if request is not None and request.user.is_authenticated:
+        return request.user
+    return None
+
+
+def like_target_id(pin):
+    """点赞总是记在原始 Pin 上"""
+    return pin.origin_pin_id or pin.pin_id
+
+
+def like_target(pin):
+    return pin.origin_pin if pin.origin_pin_id else pin
+
+
+def viewer_friend_ids(context):
+    # 当前用户的好友集合有缓存（pin/friends.py），命中时不查库
+    viewer = _viewer(context)
+    return friends.friend_ids(viewer.pk) if viewer is not None else frozenset()
+
+
+def prime_user_stats(context, user_ids, friend_ids=None):
+    """
+    批量计算当前用户与这些用户的好友关系（is_friend），已缓存的用户跳过；
+    friend_ids 是已经查好的当前用户好友集合
+    """
+    cache = serialization_cache(context)['users']
+    missing = {user_id for user_id in user_ids if user_id is not None and user_id not in cache}
+    if not missing:
+        return cache
+
+    if friend_ids is None:
+        friend_ids = viewer_friend_ids(context)
+    for user_id in missing:
+        cache[user_id] = {'is_friend': user_id in friend_ids}
+    return cache
+
+
+def prime_liked(context, target_ids):
+    """当前用户点过赞的 Pin（点赞目标的 id），一次查询，已缓存的跳过"""
+    cache = serialization_cache(context)['liked']
+    unchecked = set(target_ids) - set(cache)
+    if unchecked:
+        liked = set()
+        viewer = _viewer(context)
+        if viewer is not None:
+            liked = set(Like.objects.filter(user=viewer, pin_id__in=unchecked).values_list('pin_id', flat=True))
+        for target_id in unchecked:
+            cache[target_id] = target_id in liked
+        if viewer is not None and like_buffer.enabled():
+            # 自己还在写缓冲里的点赞 / 取消点赞
+            overlay = like_buffer.overlay(viewer.pk, {target_id: cache[target_id] for target_id in unchecked})
+            cache.update(overlay)
+    return cache
+
+
+def user_stats(context, user):
+    return prime_user_stats(context, [user.pk])[user.pk]
+
+
+def prime_pins(context, pins):
+    """
+    为一批 Pin 预取序列化需要的所有数据。
+    对已经 select_related / prefetch_related 过的关系不会重复查询，
+    所以不管传入的 queryset 是怎么构造的，查询次数都是固定的。
+    """
+    pins = unprimed_pins(context, pins)
+    if not pins:
+        return
+    prefetch_pin_relations(pins)
+    prime_liked(context, {like_target_id(pin) for pin in pins})
+    prime_user_stats(context, pin_user_ids(pins))
+    mark_primed(context, pins)
+
+
+# prime_pins 的几个步骤，异步视图（pin/async_views.py）并发执行其中互不依赖的查询
+
+def unprimed_pins(context, pins):
+    primed = serialization_cache(context)['pins']
+    return [pin for pin in pins if pin.pin_id not in primed]
+
+
+def pin_prefetches():
+    return [
+        'user', 'picture__uploaded_by', 'picture__blob__variants', 'origin_pin__user',
+        Prefetch('comments', queryset=Comment.objects.select_related('user')),
+    ]
+
+
+def prefetch_pin_relations(pins, *lookups):
+    prefetch_related_objects(pins, *(lookups or pin_prefetches()))
+
+
+def pin_user_ids(pins):
+    """序列化这些 Pin 时会出现的用户（需要先 prefetch_pin_relations）"""
+    user_ids = set()
+    for pin in pins:
+        user_ids.add(pin.user_id)
+        user_ids.add(pin.picture.uploaded_by_id)
+        if pin.origin_pin is not None:
+            user_ids.add(pin.origin_pin.user_id)
+        user_ids.update(comment.user_id for comment in pin.comments.all())
+    return user_ids
+
+
+def mark_primed(context, pins):
+    serialization_cache(context)['pins'].update(pin.pin_id for pin in pins)
+
+
+def prime_board_covers(context, board_ids):
+    """
+    每个 Board 最新的 COVER_COUNT 张图片，用窗口函数一次查出整页 Board 的封面，
+    再一次预取缩略图
+    """
+    covers = serialization_cache(context)['covers']
+    missing = [board_id for board_id in board_ids if board_id not in covers]
+    if not missing:
+        return covers
+    for board_id in missing:
+        covers[board_id] = []
+    pins = (
+        Pin.objects.filter(board_id__in=missing)
+        .annotate(cover_rank=Window(
+            RowNumber(), partition_by=F('board_id'), order_by=[F('timestamp').desc(), F('pin_id').desc()],
+        ))
+        .filter(cover_rank__lte=COVER_COUNT)
+        .select_related('picture__blob')
+        .order_by('board_id', 'cover_rank')
+    )
+    pins = list(pins)
+    prefetch_related_objects([pin.picture for pin in pins if pin.picture.blob_id], 'blob__variants')
+    for pin in pins:
+        covers[pin.board_id].append(pin.picture)
+    return covers
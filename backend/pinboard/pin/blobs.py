@@ -0,0 +1,95 @@
+"""
+按内容去重的图片存储
+
+上传的文件按块计算 SHA-256（不会整个读进内存；Django 对大文件本身就使用临时文件），
+以摘要为键存成 ImageBlob。字节相同的图片共用同一个文件和同一套派生尺寸（pin/imaging.py），
+Picture.image_file 直接指向 blob 的文件。
+
+ImageBlob.ref_count 由 pin/counters.py 随 Picture 的创建、删除维护；最后一个引用它的
+Picture 被删除后，blob 连同文件和派生图片一起删除（见 pin/signals.py）。
+已有的图片用 `python manage.py dedupe_pictures` 迁移到 blob 存储。
+"""
+import hashlib
+import os
+
+from django.db import IntegrityError, transaction
+
+from .models import ImageBlob, Picture
+
+# 每次读取的块大小
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(file):
+    """按块计算文件内容的 SHA-256，返回 (hex 摘要, 字节数)，结束后文件指针回到开头"""
+    sha256 = hashlib.sha256()
+    size = 0
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        sha256.update(chunk)
+        size += len(chunk)
+    file.seek(0)
+    return sha256.hexdigest(), size
+
+
+def store(file):
+    """
+    返回内容与 file 相同的 ImageBlob，不存在时写入文件并新建。
+    并发上传同样内容时只有一个能插入成功，另一个删除自己写的文件后复用已有的 blob。
+    """
+    digest, size = content_digest(file)
+    blob = ImageBlob.objects.filter(digest=digest).first()
+    if blob is not None:
+        return blob
+
+    blob = ImageBlob(digest=digest, size=size)
+    blob.file.save(os.path.basename(file.name or digest), file, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        blob.file.delete(save=False)
+        return ImageBlob.objects.get(digest=digest)
+    return blob
+
+
+def attach(picture):
+    """
+    Picture 保存前调用：新上传的文件换成去重后的 blob 文件，
+    已经保存过的文件和外部 URL 图片不处理
+    """
+    upload = picture.image_file
+    if not upload or upload._committed:
+        return
+    blob = store(upload)
+    picture.blob = blob
+    picture.image_file = blob.file.name
+
+
+def release(blob_id):
+    """
+    Picture 删除后调用：blob 已经没有任何引用时删除它。
+    计数和实际引用都要为零才删除，计数偏差时宁可留下文件也不误删。
+    """
+    if blob_id is None:
+        return
+    for blob in ImageBlob.objects.filter(pk=blob_id, ref_count=0, pictures=None):
+        blob.delete()
+
+
+def adopt(picture):
+    """
+    把还没有 blob 的旧图片迁移到 blob 存储，返回 (blob, 是否删除了重复文件)。
+    内容第一次出现时直接接管原文件，不复制；之后内容相同的图片改为指向这个文件，
+    原来的重复文件在没有其他图片使用时删除。
+    """
+    name = picture.image_file.name
+    with picture.image_file.open('rb') as source:
+        digest, size = content_digest(source)
+    blob, created = ImageBlob.objects.get_or_create(digest=digest, defaults={'size': size, 'file': name})
+    Picture.objects.filter(pk=picture.pk).update(blob=blob, image_file=blob.file.name)
+    ImageBlob.objects.filter(pk=blob.pk).update(ref_count=blob.pictures.count())
+    removed = False
+    if not created and name != blob.file.name and not Picture.objects.filter(image_file=name).exists():
+        picture.image_file.storage.delete(name)
+        removed = True
+    return blob, removed
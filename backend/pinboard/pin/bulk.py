@@ -0,0 +1,232 @@
+"""
+批量写入：一次请求创建多个 Pin / Repin / 点赞，或者往关注流里加多个 Board
+
+整个数组先批量校验（外键用 in_bulk 一次查出），有效的条目在一个事务里
+bulk_create，返回每个条目的结果：
+
+    {"results": [{"index": 0, "status": "created", "pin_id": 12},
+                 {"index": 1, "status": "invalid", "errors": {...}}],
+     "summary": {"created": 1, "invalid": 1}}
+
+bulk_create 不发 post_save 信号，pin/signals.py 里对应的维护在这里显式完成：
+关注流时间线（pin/feed.py）、冗余计数（pin/counters.py）、搜索索引（pin/search.py）、
+响应缓存失效（pin/response_cache.py）和 ETag 版本戳（pin/conditional.py）。
+Board 加入关注流走 stream.boards.add()，一次插入，m2m_changed 信号照常触发。
+
+每个请求最多 PINBOARD_BULK_MAX_ITEMS 个条目。
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from . import conditional, counters, feed, response_cache, search
+from .models import Board, Like, Picture, Pin
+
+# bulk_create 每批的行数
+BATCH_SIZE = 500
+
+
+class BulkError(Exception):
+    """请求本身不合法（不是数组、条目太多），整个请求返回 400"""
+
+
+class PinItemSerializer(serializers.Serializer):
+    board = serializers.IntegerField()
+    picture = serializers.IntegerField()
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+class RepinItemSerializer(serializers.Serializer):
+    pin = serializers.IntegerField()
+    board = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True, allow_null=True)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
+def max_items():
+    return getattr(settings, 'PINBOARD_BULK_MAX_ITEMS', 5000)
+
+
+def items(data, key):
+    """请求体可以直接是数组，也可以是 {key: [...]}"""
+    values = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(values, list):
+        raise BulkError(f"'{key}' must be a list")
+    if len(values) > max_items():
+        raise BulkError(f"At most {max_items()} items can be written in one request")
+    return values
+
+
+def _pk(value):
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    return pk if pk > 0 else None
+
+
+def _report(results):
+    return {'results': results, 'summary': dict(Counter(result['status'] for result in results))}
+
+
+def _missing(index, field, pk):
+    return {'index': index, 'status': 'invalid', 'errors': {field: [f'Invalid pk "{pk}" - object does not exist.']}}
+
+
+def _validate(serializer_class, values):
+    """逐条校验格式（不查库），返回 (有效条目 [(index, data)], 每个条目的结果)"""
+    valid, results = [], [None] * len(values)
+    for index, value in enumerate(values):
+        serializer = serializer_class(data=value if isinstance(value, dict) else {})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+    return valid, results
+
+
+# --- Pin / Repin ------------------------------------------------------------
+
+def pins_created(pins):
+    """bulk_create 之后补上 Pin post_save 信号做的维护（pin.picture 需要已经加载）"""
+    if not pins:
+        return
+    feed.fan_out_pins(pins)
+    counters.recount(Pin, pins)
+    search.PIN_INDEX.index(pins)
+    board_ids = {pin.board_id for pin in pins}
+    response_cache.invalidate('board', board_ids)
+    response_cache.invalidate('user', {pin.user_id for pin in pins})
+    conditional.touch_boards(board_ids)
+
+
+def _insert_pins(entries, results):
+    """entries 是 [(index, Pin)]，在一个事务里写入并填好每个条目的结果"""
+    with transaction.atomic():
+        created = Pin.objects.bulk_create([pin for _, pin in entries], batch_size=BATCH_SIZE)
+        pins_created(created)
+    for (index, _), pin in zip(entries, created):
+        results[index] = {'index': index, 'status': 'created', 'pin_id': pin.pin_id}
+    return _report(results)
+
+
+def create_pins(user, values):
+    valid, results = _validate(PinItemSerializer, values)
+    boards = Board.objects.in_bulk({data['board'] for _, data in valid})
+    pictures = Picture.objects.in_bulk({data['picture'] for _, data in valid})
+
+    entries = []
+    for index, data in valid:
+        if data['board'] not in boards:
+            results[index] = _missing(index, 'board', data['board'])
+        elif data['picture'] not in pictures:
+            results[index] = _missing(index, 'picture', data['picture'])
+        else:
+            entries.append((index, Pin(
+                user=user, board=boards[data['board']], picture=pictures[data['picture']],
+                title=data.get('title'), description=data.get('description'),
+            )))
+    return _insert_pins(entries, results)
+
+
+def repin_pins(user, values, default_board_id=None):
+    """
+    和 PinViewSet.repin 相同的规则：总是转存原始 Pin，不能转存自己的 Pin，
+    没有指定 Board 时用请求里的 board，再没有就用原 Pin 的 Board
+    """
+    valid, results = _validate(RepinItemSerializer, values)
+    sources = Pin.objects.select_related('picture', 'origin_pin__picture').in_bulk({data['pin'] for _, data in valid})
+    board_ids = {data.get('board', default_board_id) for _, data in valid} - {None}
+    boards = Board.objects.in_bulk(board_ids)
+
+    entries = []
+    for index, data in valid:
+        pin = sources.get(data['pin'])
+        board_id = data.get('board', default_board_id)
+        if pin is None:
+            results[index] = _missing(index, 'pin', data['pin'])
+            continue
+        if board_id is not None and board_id not in boards:
+            results[index] = _missing(index, 'board', board_id)
+            continue
+        origin_pin = pin.origin_pin if pin.is_repin else pin
+        if origin_pin.user_id == user.pk:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': {'pin': ["You cannot repin your own pin."]}}
+            continue
+        entries.append((index, Pin(
+            user=user, origin_pin=origin_pin, picture=pin.picture,
+            title=data.get('title', pin.title), description=data.get('description', pin.description),
+            board_id=board_id if board_id is not None else pin.board_id,
+        )))
+    report = _insert_pins(entries, results)
+    # 原始 Pin 的 repin_count 变了
+    response_cache.invalidate('pin', {pin.origin_pin_id for _, pin in entries})
+    return report
+
+
+# --- 点赞 -------------------------------------------------------------------
+
+def likes_changed(likes):
+    """批量写入 / 删除点赞后补上 Like 信号做的维护（likes 只需要 pin_id）"""
+    if not likes:
+        return
+    target_ids = {like.pin_id for like in likes}
+    counters.recount(Like, likes)
+    response_cache.invalidate('pin', target_ids)
+    conditional.touch_like_targets(target_ids)
+
+
+def like_pins(user, values):
+    """点赞总是记在原始 Pin 上；已经点过赞的返回 already_liked，不算错误"""
+    pin_ids = [_pk(value) for value in values]
+    pins = Pin.objects.only('pin_id', 'origin_pin_id').in_bulk({pk for pk in pin_ids if pk is not None})
+    targets = {pk: pin.origin_pin_id or pin.pin_id for pk, pin in pins.items()}
+    liked = set(
+        Like.objects.filter(user=user, pin_id__in=set(targets.values())).values_list('pin_id', flat=True)
+    )
+
+    results, new_likes = [], []
+    for index, (value, pk) in enumerate(zip(values, pin_ids)):
+        if pk not in targets:
+            results.append(_missing(index, 'pin', value))
+            continue
+        target_id = targets[pk]
+        if target_id in liked:
+            results.append({'index': index, 'status': 'already_liked', 'pin_id': target_id})
+            continue
+        liked.add(target_id)
+        new_likes.append(Like(user=user, pin_id=target_id))
+        results.append({'index': index, 'status': 'liked', 'pin_id': target_id})
+
+    with transaction.atomic():
+        # 并发请求先插入的行被忽略，计数按实际行数重新计算
+        Like.objects.bulk_create(new_likes, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        likes_changed(new_likes)
+    return _report(results)
+
+
+# --- 关注流 -----------------------------------------------------------------
+
+def add_stream_boards(stream, values):
+    board_ids = [_pk(value) for value in values]
+    existing = set(Board.objects.filter(pk__in={pk for pk in board_ids if pk is not None}).values_list('pk', flat=True))
+    followed = set(stream.boards.filter(pk__in=existing).values_list('pk', flat=True))
+
+    results, added = [], []
+    for index, (value, pk) in enumerate(zip(values, board_ids)):
+        if pk not in existing:
+            results.append(_missing(index, 'board_id', value))
+        elif pk in followed:
+            results.append({'index': index, 'status': 'already_in_stream', 'board_id': pk})
+        else:
+            followed.add(pk)
+            added.append(pk)
+            results.append({'index': index, 'status': 'added', 'board_id': pk})
+
+    if added:
+        with transaction.atomic():
+            stream.boards.add(*added)
+    return _report(results)
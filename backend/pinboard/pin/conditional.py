@@ -0,0 +1,156 @@
+"""
+条件 GET（ETag / If-None-Match / If-Modified-Since）
+
+Board、FollowStream、Pin 上有 version / updated_at 版本戳。Pin、Comment、Like
+等写入时由 pin/signals.py 调用这里的 touch_* 用 F() 原子递增，轮询接口先只查
+版本戳（一条很小的查询）生成 ETag，客户端的缓存还有效时直接返回 304，
+不会执行 PinSerializer。
+
+点赞不递增数据库里的版本戳：点赞数显示在原始 Pin 和它所有的 Repin 上，热门 Pin 的一次点赞
+要更新大量 Board 和关注它们的流。点赞只换掉共享缓存（PINBOARD_RESPONSE_CACHE_ALIAS）里这些
+Board 和流的点赞版本号（一次 set_many，不写数据库），ETag 里带上它，读取时多一次缓存读取。
+
+ETag 是弱校验（W/）：包含当前用户和他的好友集合摘要（is_liked / is_friend 因人而异，
+好友关系变化不会递增任何版本戳），嵌套用户资料里的 pin_count 等不计入版本戳。
+只带 If-Modified-Since 的请求只按 updated_at 判断，看不到好友关系和点赞数的变化。
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from . import async_db, friends
+from .models import Board, FollowStream, Pin
+
+
+def _touch(model, pks):
+    pks = {pk for pk in pks if pk is not None}
+    if pks:
+        model.objects.filter(pk__in=pks).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def touch_streams(stream_ids):
+    _touch(FollowStream, stream_ids)
+
+
+def touch_boards(board_ids):
+    """Board 的内容变了，关注它的流也一起变"""
+    board_ids = {board_id for board_id in board_ids if board_id is not None}
+    if not board_ids:
+        return
+    _touch(Board, board_ids)
+    streams = FollowStream.boards.through.objects.filter(board_id__in=board_ids).values('followstream_id')
+    FollowStream.objects.filter(pk__in=streams).update(version=F('version') + 1, updated_at=timezone.now())
+
+
+def touch_pins(pin_ids):
+    _touch(Pin, pin_ids)
+
+
+def _cache():
+    # 和响应缓存用同一个缓存，多进程部署时是共享后端
+    return caches[getattr(settings, 'PINBOARD_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _likes_key(kind, pk):
+    return f'pinboard:conditional:likes:{kind}:{pk}'
+
+
+def _bump_likes(keys):
+    _cache().set_many({key: uuid.uuid4().hex[:12] for key in keys}, None)
+
+
+def touch_like_targets(pin_ids):
+    """点赞数显示在原始 Pin 和它所有 Repin 上：换掉这些 Pin 所在的 Board 和关注它们的流的点赞版本号"""
+    pin_ids = list(pin_ids)
+    if not pin_ids:
+        return
+    board_ids = set(
+        Pin.objects.filter(Q(pk__in=pin_ids) | Q(origin_pin_id__in=pin_ids)).values_list('board_id', flat=True)
+    )
+    stream_ids = FollowStream.boards.through.objects.filter(board_id__in=board_ids).values_list(
+        'followstream_id', flat=True,
+    )
+    keys = [_likes_key('board', pk) for pk in board_ids] + [_likes_key('stream', pk) for pk in set(stream_ids)]
+    if keys:
+        _bump_likes(keys)
+        # 提交前并发的读取可能按旧的点赞数算出了新的 ETag，提交后再换一次
+        transaction.on_commit(lambda: _bump_likes(keys))
+
+
+def likes_version(kind, pk):
+    """Board / 流的点赞版本号，被缓存淘汰时生成一个新的（不会和之前的 ETag 相同）"""
+    key = _likes_key(kind, pk)
+    cache = _cache()
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, uuid.uuid4().hex[:12], None)
+        value = cache.get(key)
+    return value
+
+
+def touch_like_target(pin_id):
+    touch_like_targets([pin_id])
+
+
+def touch_pictures(picture_ids):
+    touch_boards(Pin.objects.filter(picture_id__in=list(picture_ids)).values_list('board_id', flat=True))
+
+
+def _viewer(request):
+    if not request.user.is_authenticated:
+        return 0
+    # 好友集合有缓存，命中时不查库
+    return f'{request.user.pk}:{friends.fingerprint(request.user.pk)}'
+
+
+def _etag(viewer, parts):
+    raw = ':'.join(str(part) for part in (*parts, viewer))
+    return 'W/"%s"' % hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+
+def etag(request, kind, pk, version, *extra):
+    return _etag(_viewer(request), (kind, pk, version, *extra))
+
+
+async def aetag(request, kind, pk, version, *extra):
+    """etag 的异步版本，好友集合的缓存未命中时要查库"""
+    return _etag(await async_db.run(_viewer, request), (kind, pk, version, *extra))
+
+
+def conditional_response(request, etag, updated_at, render):
+    """
+    请求带的 If-None-Match / If-Modified-Since 仍然有效时返回 304，
+    否则调用 render() 生成响应并带上 ETag / Last-Modified
+    """
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    return _finish(response, etag, last_modified)
+
+
+async def aconditional_response(request, etag, updated_at, arender):
+    """conditional_response 的异步版本，arender 是返回响应的协程函数"""
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await arender()
+    return _finish(response, etag, last_modified)
+
+
+def _finish(response, etag, last_modified):
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # 每次使用前都要向服务器确认，响应和当前用户有关
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ['Authorization', 'Cookie'])
+    return response
@@ -0,0 +1,93 @@
+"""
+冗余计数列的维护
+
+Pin.like_count / comment_count / repin_count、CustomUser.board_count / pin_count、
+Board.pin_count、Tag.usage_count 和 ImageBlob.ref_count 在子记录创建、删除时用 F() 原子加减
+（见 pin/signals.py），读的时候不再 COUNT。Pin 移动到其他 Board 时由 moved() 调整 Board.pin_count。
+计数如果因为绕过信号的写入（例如 queryset.update、原生 SQL）出现偏差，
+用 `python manage.py reconcile_counters` 修复。批量写入（pin/bulk.py）用 recount() 直接重新计算。
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Board, Comment, CustomUser, ImageBlob, Like, Picture, PictureTag, Pin, Tag
+
+# (计数所在的模型, 计数字段, 被计数的子模型, 子模型指向计数模型的外键)
+COUNTERS = [
+    (Pin, 'like_count', Like, 'pin'),
+    (Pin, 'comment_count', Comment, 'pin'),
+    (Pin, 'repin_count', Pin, 'origin_pin'),
+    (CustomUser, 'board_count', Board, 'owner'),
+    (CustomUser, 'pin_count', Pin, 'user'),
+    (Board, 'pin_count', Pin, 'board'),
+    (Tag, 'usage_count', PictureTag, 'tag'),
+    (ImageBlob, 'ref_count', Picture, 'blob'),
+]
+
+
+def counters_for(child):
+    return [(model, field, fk) for model, field, child_model, fk in COUNTERS if child_model is child]
+
+
+def adjust(model, pk, field, delta):
+    """原子加减一个计数，减的时候不会减到负数"""
+    if pk is None:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def child_created(instance):
+    for model, field, fk in counters_for(type(instance)):
+        adjust(model, getattr(instance, f'{fk}_id'), field, 1)
+
+
+def child_deleted(instance):
+    for model, field, fk in counters_for(type(instance)):
+        adjust(model, getattr(instance, f'{fk}_id'), field, -1)
+
+
+def moved(instance, fk, previous_id):
+    """子记录的外键从 previous_id 改成了新的值（例如 Pin 换了 Board）"""
+    current_id = getattr(instance, f'{fk}_id')
+    if previous_id == current_id:
+        return
+    for model, field, counted_fk in counters_for(type(instance)):
+        if counted_fk == fk:
+            adjust(model, previous_id, field, -1)
+            adjust(model, current_id, field, 1)
+
+
+def actual_count(child, fk):
+    """按外键统计子记录数量的相关子查询"""
+    counts = (
+        child.objects.filter(**{fk: OuterRef('pk')})
+        .order_by().values(fk).annotate(total=Count('*')).values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount(child, instances):
+    """
+    bulk_create 不发信号：按实际行数重新计算这些子记录指向的计数，
+    一个计数一条 UPDATE，并发写入也不会让计数产生偏差
+    """
+    for model, field, fk in counters_for(child):
+        pks = {getattr(instance, f'{fk}_id') for instance in instances} - {None}
+        if pks:
+            model.objects.filter(pk__in=pks).update(**{field: actual_count(child, fk)})
+
+
+def reconcile(apply=True):
+    """
+    找出计数与实际行数不一致的记录并修复，返回 {'Pin.like_count': 偏差行数, ...}
+    """
+    drift = {}
+    for model, field, child, fk in COUNTERS:
+        wrong = model.objects.annotate(actual=actual_count(child, fk)).exclude(**{field: F('actual')})
+        drift[f'{model.__name__}.{field}'] = wrong.count()
+        if apply and drift[f'{model.__name__}.{field}']:
+            model.objects.filter(pk__in=wrong.values('pk')).update(**{field: actual_count(child, fk)})
+    return drift
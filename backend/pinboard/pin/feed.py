@@ -0,0 +1,154 @@
+"""
+关注流时间线（写扩散 + 热门 Board 读扩散的混合策略）
+
+- 普通 Board：Pin 创建时写入所有关注它的流的 FollowStreamEntry（写扩散）
+- 热门 Board（被超过 PINBOARD_FEED_FANOUT_LIMIT 个流关注）：标记为 fanout_on_read，
+  不写时间线，读关注流时实时查询它的 Pin，再和时间线归并
+
+维护入口都在 pin/signals.py 里：Pin 的 post_save 和 FollowStream.boards 的 m2m_changed。
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import async_db
+from .models import Board, FollowStream, FollowStreamEntry, Pin
+
+FollowStreamBoard = FollowStream.boards.through
+
+# 批量写入时间线时每批的行数
+BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    return getattr(settings, 'PINBOARD_FEED_FANOUT_LIMIT', 1000)
+
+
+def _entries_for(pins, stream_ids):
+    return [
+        FollowStreamEntry(stream_id=stream_id, pin_id=pin.pin_id, board_id=pin.board_id, timestamp=pin.timestamp)
+        for pin in pins
+        for stream_id in stream_ids
+    ]
+
+
+def fan_out_pin(pin):
+    """把新 Pin 写入所有关注其 Board 的流（热门 Board 跳过）"""
+    stream_ids = list(
+        FollowStreamBoard.objects.filter(board_id=pin.board_id, board__fanout_on_read=False)
+        .values_list('followstream_id', flat=True)
+    )
+    if stream_ids:
+        FollowStreamEntry.objects.bulk_create(
+            _entries_for([pin], stream_ids), batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+
+
+def fan_out_pins(pins):
+    """批量版本：按 Board 分组，每个 Board 查一次关注的流"""
+    by_board = {}
+    for pin in pins:
+        by_board.setdefault(pin.board_id, []).append(pin)
+    if not by_board:
+        return
+    streams_by_board = {}
+    rows = FollowStreamBoard.objects.filter(
+        board_id__in=list(by_board), board__fanout_on_read=False
+    ).values_list('board_id', 'followstream_id')
+    for board_id, stream_id in rows:
+        streams_by_board.setdefault(board_id, []).append(stream_id)
+    entries = []
+    for board_id, stream_ids in streams_by_board.items():
+        entries.extend(_entries_for(by_board[board_id], stream_ids))
+    FollowStreamEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def move_pin(pin):
+    """Pin 被移动到其他 Board 时，重新计算它出现在哪些流里"""
+    moved, _ = FollowStreamEntry.objects.filter(pin_id=pin.pin_id).exclude(board_id=pin.board_id).delete()
+    if moved:
+        fan_out_pin(pin)
+
+
+def update_hot_boards(board_ids):
+    """
+    关注数超过阈值的 Board 切换为读扩散，并清掉它已经写出去的时间线。
+    标记是单向的，降回写扩散需要 rebuild_follow_feeds 重新计算。
+    """
+    hot = list(
+        FollowStreamBoard.objects.filter(board_id__in=board_ids, board__fanout_on_read=False)
+        .values('board_id').annotate(followers=Count('followstream_id'))
+        .filter(followers__gt=fanout_limit()).values_list('board_id', flat=True)
+    )
+    if hot:
+        with transaction.atomic():
+            Board.objects.filter(board_id__in=hot).update(fanout_on_read=True)
+            FollowStreamEntry.objects.filter(board_id__in=hot).delete()
+    return hot
+
+
+def backfill_stream(stream_id, board_ids):
+    """流新关注了这些 Board：把它们已有的 Pin 补进时间线"""
+    pins = (
+        Pin.objects.filter(board_id__in=board_ids, board__fanout_on_read=False)
+        .only('pin_id', 'board_id', 'timestamp').iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for pin in pins:
+        batch.append(FollowStreamEntry(stream_id=stream_id, pin_id=pin.pin_id, board_id=pin.board_id, timestamp=pin.timestamp))
+        if len(batch) >= BATCH_SIZE:
+            FollowStreamEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FollowStreamEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def boards_added(stream_ids, board_ids):
+    hot = set(update_hot_boards(board_ids))
+    cold = [board_id for board_id in board_ids if board_id not in hot]
+    if cold:
+        for stream_id in stream_ids:
+            backfill_stream(stream_id, cold)
+
+
+def boards_removed(stream_ids, board_ids=None):
+    entries = FollowStreamEntry.objects.filter(stream_id__in=stream_ids)
+    if board_ids is not None:
+        entries = entries.filter(board_id__in=board_ids)
+    entries.delete()
+
+
+def rebuild_stream(stream):
+    """从头重建一个流的时间线"""
+    with transaction.atomic():
+        FollowStreamEntry.objects.filter(stream=stream).delete()
+        board_ids = list(stream.boards.values_list('board_id', flat=True))
+        backfill_stream(stream.stream_id, board_ids)
+
+
+def paginate_stream(stream, paginator, request):
+    """
+    关注流分页：时间线表和热门 Board 的 Pin 各取一页后归并，
+    返回已经预取好关联对象的 Pin 列表
+    """
+    hot_board_ids = list(stream.boards.filter(fanout_on_read=True).values_list('board_id', flat=True))
+    sources = [FollowStreamEntry.objects.filter(stream=stream)]
+    if hot_board_ids:
+        sources.append(Pin.objects.filter(board_id__in=hot_board_ids).only('pin_id', 'timestamp'))
+    rows = paginator.paginate_merged(sources, request)
+
+    pins = Pin.objects.with_related().in_bulk([row.pin_id for row in rows])
+    return [pins[row.pin_id] for row in rows if row.pin_id in pins]
+
+
+async def apaginate_stream(stream, paginator, request):
+    """paginate_stream 的异步版本（pin/async_views.py），时间线和热门 Board 的两页同时查询"""
+    hot_boards = stream.boards.filter(fanout_on_read=True).values_list('board_id', flat=True)
+    hot_board_ids = await async_db.run(list, hot_boards)
+    sources = [FollowStreamEntry.objects.filter(stream=stream)]
+    if hot_board_ids:
+        sources.append(Pin.objects.filter(board_id__in=hot_board_ids).only('pin_id', 'timestamp'))
+    rows = await paginator.apaginate_merged(sources, request)
+
+    pins = await async_db.run(Pin.objects.with_related().in_bulk, [row.pin_id for row in rows])
+    return [pins[row.pin_id] for row in rows if row.pin_id in pins]
@@ -0,0 +1,138 @@
+"""
+好友关系
+
+Friendship 每对好友只存一行，且 user1_id < user2_id（Friendship.save 负责排序，
+数据库用约束保证），所以“A 和 B 是否是好友”只有一种存法。
+
+每个用户的好友 id 集合缓存在 Django 缓存里（PINBOARD_FRIEND_CACHE_ALIAS），
+好友判断统一用 are_friends() / friend_ids()，缓存命中时是一次集合查找，不查库。
+Friendship 创建、删除时 pin/signals.py 让双方的缓存失效。
+
+用户发现（可能认识的人、共同好友）直接在 SQL 里做集合运算，不在 Python 里逐个
+遍历好友：共同好友是两个好友子查询的交集；可能认识的人按共同好友数量排序，
+一次聚合查询取前 PINBOARD_FRIEND_SUGGESTION_LIMIT 个，按用户缓存
+PINBOARD_FRIEND_SUGGESTION_TIMEOUT 秒（自己的好友关系变化时立即失效）。
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Q
+
+from .models import Friendship
+
+KEY_PREFIX = 'pinboard:friends'
+
+# 推荐结果：用户 id 和共同好友数量
+Suggestion = namedtuple('Suggestion', ['id', 'mutual_count'])
+
+
+def _cache():
+    return caches[getattr(settings, 'PINBOARD_FRIEND_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}:{user_id}'
+
+
+def _suggestions_key(user_id):
+    return f'{KEY_PREFIX}:suggestions:{user_id}'
+
+
+def ordered(user_a_id, user_b_id):
+    """一对好友的规范顺序 (较小的 id, 较大的 id)"""
+    return (user_a_id, user_b_id) if user_a_id < user_b_id else (user_b_id, user_a_id)
+
+
+def befriend(user_a, user_b):
+    """建立好友关系（已经是好友时不重复创建），返回 Friendship"""
+    user1_id, user2_id = ordered(user_a.pk, user_b.pk)
+    friendship, _ = Friendship.objects.get_or_create(user1_id=user1_id, user2_id=user2_id)
+    return friendship
+
+
+def friend_ids(user_id):
+    """用户的全部好友 id（frozenset），缓存未命中时一次查询"""
+    if user_id is None:
+        return frozenset()
+    cache = _cache()
+    ids = cache.get(_key(user_id))
+    if ids is None:
+        pairs = Friendship.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).values_list('user1_id', 'user2_id')
+        ids = frozenset(user2_id if user1_id == user_id else user1_id for user1_id, user2_id in pairs)
+        cache.set(_key(user_id), ids, getattr(settings, 'PINBOARD_FRIEND_CACHE_TIMEOUT', 60 * 60))
+    return ids
+
+
+def fingerprint(user_id):
+    """
+    好友集合的摘要（int 的 hash 与进程无关），放进条件 GET 的 ETag：
+    好友关系变化后 is_friend 会变，ETag 随之改变
+    """
+    ids = friend_ids(user_id)
+    return f'{len(ids)}.{hash(ids) & 0xffffffffffffffff:x}'
+
+
+def are_friends(user_a_id, user_b_id):
+    if user_a_id is None or user_b_id is None:
+        return False
+    return user_b_id in friend_ids(user_a_id)
+
+
+def friends_of(user_id, field='pk'):
+    """field 是 user_id 的好友的条件（两个方向的子查询，不把好友 id 展开成参数）"""
+    return (
+        Q(**{f'{field}__in': Friendship.objects.filter(user1_id=user_id).values('user2_id')})
+        | Q(**{f'{field}__in': Friendship.objects.filter(user2_id=user_id).values('user1_id')})
+    )
+
+
+def mutual_friends_q(user_a_id, user_b_id):
+    return friends_of(user_a_id) & friends_of(user_b_id)
+
+
+SUGGESTION_SQL = """
+    SELECT candidate, SUM(n) AS mutual_count FROM (
+        SELECT f.user2_id AS candidate, COUNT(*) AS n FROM {table} f
+        WHERE f.user1_id IN ({friends}) GROUP BY f.user2_id
+        UNION ALL
+        SELECT f.user1_id AS candidate, COUNT(*) AS n FROM {table} f
+        WHERE f.user2_id IN ({friends}) GROUP BY f.user1_id
+    ) fof
+    WHERE candidate <> %s AND candidate NOT IN ({friends})
+    GROUP BY candidate
+    ORDER BY mutual_count DESC, candidate
+    LIMIT %s
+"""
+
+
+def _compute_suggestions(user_id, limit):
+    table = connection.ops.quote_name(Friendship._meta.db_table)
+    # 好友的好友：两个方向的边都走 (user1, user2) 唯一索引或 user2 外键索引
+    friends = f'SELECT user2_id FROM {table} WHERE user1_id = %s UNION SELECT user1_id FROM {table} WHERE user2_id = %s'
+    sql = SUGGESTION_SQL.format(table=table, friends=friends)
+    params = [user_id, user_id] * 2 + [user_id] + [user_id, user_id] + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [Suggestion(candidate, int(count)) for candidate, count in cursor.fetchall()]
+
+
+def suggestions(user_id):
+    """
+    可能认识的人：不是好友、但和 user_id 有共同好友的用户，按共同好友数量从多到少，
+    返回 Suggestion 列表
+    """
+    cache = _cache()
+    result = cache.get(_suggestions_key(user_id))
+    if result is None:
+        result = _compute_suggestions(user_id, getattr(settings, 'PINBOARD_FRIEND_SUGGESTION_LIMIT', 500))
+        cache.set(_suggestions_key(user_id), result, getattr(settings, 'PINBOARD_FRIEND_SUGGESTION_TIMEOUT', 10 * 60))
+    return [Suggestion(*item) for item in result]
+
+
+def invalidate(*user_ids):
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    keys = [_key(user_id) for user_id in user_ids] + [_suggestions_key(user_id) for user_id in user_ids]
+    if keys:
+        _cache().delete_many(keys)
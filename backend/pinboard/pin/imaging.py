@@ -0,0 +1,142 @@
+"""
+上传图片的派生尺寸（缩略图 / 响应式图片）
+
+新的图片内容（ImageBlob，见 pin/blobs.py）写入后按 PINBOARD_IMAGE_VARIANT_WIDTHS
+生成多个宽度的 JPEG，Pillow 支持 WebP 时再额外生成 WebP。派生图片挂在 blob 上，
+重复上传的相同图片直接复用。生成放在进程内的线程池里执行（事务提交之后），
+POST /api/pictures/ 不用等待缩放完成；PictureSerializer 通过 srcset 暴露结果。
+已有图片用 `python manage.py generate_picture_variants` 补齐。
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from . import media
+from .models import ImageBlob, PictureVariant
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (236, 474, 736)
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+_executor = None
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'PINBOARD_IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS))
+
+
+def variant_formats():
+    formats = ['jpeg']
+    if features.check('webp'):
+        formats.append('webp')
+    return formats
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'PINBOARD_IMAGE_WORKERS', 2),
+            thread_name_prefix='picture-variants',
+        )
+    return _executor
+
+
+def _flatten(image):
+    """透明背景铺成白色再转 RGB，避免 JPEG 里出现黑底"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def generate_variants(blob, force=False):
+    """
+    为一个图片 blob 生成所有缺失的派生尺寸，返回新生成的数量。
+    不会放大：原图比目标宽度窄时跳过该宽度。
+    """
+    existing = set(blob.variants.values_list('width', 'format'))
+    if force:
+        for variant in blob.variants.all():
+            variant.delete()
+        existing = set()
+
+    with blob.file.open('rb') as source:
+        original = Image.open(source)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    stem = os.path.splitext(os.path.basename(blob.file.name))[0]
+    created = 0
+    for width in variant_widths():
+        if width >= original.width:
+            continue
+        height = max(1, round(original.height * width / original.width))
+        resized = None
+        for fmt in variant_formats():
+            if (width, fmt) in existing:
+                continue
+            if resized is None:
+                resized = _flatten(original).resize((width, height), Image.Resampling.LANCZOS)
+            variant = PictureVariant(blob=blob, width=width, height=height, format=fmt)
+            variant.image_file.save(f'{stem}_{width}w.{fmt}', ContentFile(_encode(resized, fmt)), save=False)
+            variant.save()
+            created += 1
+    return created
+
+
+def _run(blob_id):
+    try:
+        blob = ImageBlob.objects.filter(pk=blob_id).first()
+        if blob is not None:
+            generate_variants(blob)
+    except Exception:
+        logger.exception("Failed to generate variants for blob %s", blob_id)
+    finally:
+        # 工作线程有自己的数据库连接，任务结束后关闭
+        connection.close()
+
+
+def schedule_variants(blob):
+    """
+    事务提交后把生成任务交给线程池；PINBOARD_IMAGE_VARIANTS_ASYNC=False 时
+    同步执行（测试和命令行使用）
+    """
+    if not getattr(settings, 'PINBOARD_IMAGE_VARIANTS_ASYNC', True):
+        generate_variants(blob)
+        return
+    blob_id = blob.pk
+    transaction.on_commit(lambda: executor().submit(_run, blob_id))
+
+
+def srcset(picture, request=None):
+    """
+    {'jpeg': 'url 236w, url 474w', 'webp': ...}，可以直接用在 <img srcset> / <source srcset>。
+    使用已经 prefetch 的 blob__variants，不会额外查询。
+    """
+    if picture.blob_id is None:
+        return {}
+    result = {}
+    for variant in sorted(picture.blob.variants.all(), key=lambda v: v.width):
+        url = media.url(variant.image_file, request)
+        result.setdefault(variant.format, []).append(f'{url} {variant.width}w')
+    return {fmt: ', '.join(entries) for fmt, entries in result.items()}
@@ -0,0 +1,179 @@
+"""
+点赞的写缓冲（write-behind），默认关闭
+
+热门 Pin 被大量点赞时，每次点赞都是一次 INSERT 加上同一行 Pin 的计数 UPDATE，
+SQLite 只能一个一个写。打开 PINBOARD_LIKE_BUFFER 后，点赞 / 取消点赞只记在进程内的
+缓冲区里（同一个用户对同一个 Pin 的多次操作只保留最后的状态），后台线程每
+PINBOARD_LIKE_BUFFER_INTERVAL 秒把缓冲区在一个事务里批量写入 Like，并按实际行数
+重新计算计数；缓冲的条目超过 PINBOARD_LIKE_BUFFER_MAX_PENDING 时立即写入。
+
+读自己的写：操作的用户在写入数据库之前看到的也是自己的最新状态
+（接口返回值、序列化时的 is_liked，见 pin/batching.py），like_count 加上缓冲区里的差值。
+缓冲区在进程内，多进程部署时每个进程各自写入；进程退出时会写入剩余的条目，
+被强制杀死的进程会丢失最近一个间隔内的点赞。
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Like
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# 同一时间只有一个写入
+_flush_lock = threading.Lock()
+# (user_id, 点赞目标 id) -> [数据库里原来的状态, 最新的状态]
+_pending = {}
+# 点赞目标 id -> like_count 的差值
+_deltas = Counter()
+# 正在写入的批次，写完之前它的状态仍然有效
+_inflight = {}
+_inflight_deltas = Counter()
+_flusher = None
+
+
+def enabled():
+    return getattr(settings, 'PINBOARD_LIKE_BUFFER', False)
+
+
+def interval():
+    return getattr(settings, 'PINBOARD_LIKE_BUFFER_INTERVAL', 1.0)
+
+
+def max_pending():
+    return getattr(settings, 'PINBOARD_LIKE_BUFFER_MAX_PENDING', 10000)
+
+
+def _current(key):
+    """缓冲区里的最新状态，没有时返回 None（调用时持有 _lock）"""
+    entry = _pending.get(key) or _inflight.get(key)
+    return entry[1] if entry is not None else None
+
+
+def pending_state(user_id, target_id):
+    with _lock:
+        return _current((user_id, target_id))
+
+
+def pending_delta(target_id):
+    with _lock:
+        return _deltas[target_id] + _inflight_deltas[target_id]
+
+
+def overlay(user_id, liked):
+    """把这个用户还没写入的点赞状态覆盖到 {点赞目标 id: 是否点赞} 上"""
+    with _lock:
+        for target_id in liked:
+            state = _current((user_id, target_id))
+            if state is not None:
+                liked[target_id] = state
+    return liked
+
+
+def record(user_id, target_id, liked=None):
+    """
+    记录点赞（liked=True）、取消点赞（False）或切换（None），返回 (最新状态, 是否变化)
+    """
+    key = (user_id, target_id)
+    with _lock:
+        base = _current(key)
+    if base is None:
+        base = Like.objects.filter(user_id=user_id, pin_id=target_id).exists()
+
+    with _lock:
+        entry = _pending.get(key)
+        if entry is None:
+            # 正在写入的批次里有这个用户的操作时，以它的结果为准
+            inflight = _inflight.get(key)
+            start = inflight[1] if inflight is not None else base
+            entry = _pending[key] = [start, start]
+        previous = entry[1]
+        entry[1] = (not previous) if liked is None else liked
+        _deltas[target_id] += int(entry[1]) - int(previous)
+        state, size = entry[1], len(_pending)
+
+    if size >= max_pending():
+        flush()
+    else:
+        _ensure_flusher()
+    return state, state != previous
+
+
+def _write(batch):
+    """在一个事务里写入一批最终状态，只写和数据库原状态不同的条目"""
+    # 避免循环导入：bulk 通过 response_cache 间接导入了 batching
+    from . import bulk, likes
+
+    inserts, deletes = [], defaultdict(list)
+    for (user_id, target_id), (base, state) in batch.items():
+        if state and not base:
+            inserts.append(Like(user_id=user_id, pin_id=target_id))
+        elif base and not state:
+            deletes[target_id].append(user_id)
+    if not inserts and not deletes:
+        return
+    with transaction.atomic():
+        Like.objects.bulk_create(inserts, batch_size=bulk.BATCH_SIZE, ignore_conflicts=True)
+        for target_id, user_ids in deletes.items():
+            likes.delete_rows(target_id, user_ids)
+        bulk.likes_changed(inserts + [Like(pin_id=target_id) for target_id in deletes])
+
+
+def flush():
+    """把缓冲区写入数据库，返回写入的条目数"""
+    global _pending, _deltas, _inflight, _inflight_deltas
+    with _flush_lock:
+        with _lock:
+            batch, deltas = _pending, _deltas
+            _pending, _deltas = {}, Counter()
+            _inflight, _inflight_deltas = batch, deltas
+        try:
+            _write(batch)
+        except Exception:
+            logger.exception("Failed to flush %d buffered like(s)", len(batch))
+            # 放回缓冲区，下次再写；之后的操作保留最新状态，原状态以这一批为准
+            with _lock:
+                for key, (base, state) in batch.items():
+                    if key in _pending:
+                        _pending[key][0] = base
+                    else:
+                        _pending[key] = [base, state]
+                _deltas.update(deltas)
+            return 0
+        finally:
+            with _lock:
+                _inflight, _inflight_deltas = {}, Counter()
+    return len(batch)
+
+
+def _loop(stop):
+    while not stop.wait(interval()):
+        try:
+            flush()
+        finally:
+            # 后台线程有自己的数据库连接，每次写完关闭
+            connection.close()
+
+
+def _ensure_flusher():
+    """PINBOARD_LIKE_BUFFER_ASYNC=False 时不启动后台线程，由调用方 flush()（测试使用）"""
+    global _flusher
+    if _flusher is not None or not getattr(settings, 'PINBOARD_LIKE_BUFFER_ASYNC', True):
+        return
+    with _lock:
+        if _flusher is not None:
+            return
+        stop = threading.Event()
+        _flusher = threading.Thread(target=_loop, args=(stop,), name='like-buffer', daemon=True)
+        _flusher.start()
+
+    def shutdown():
+        stop.set()
+        flush()
+
+    atexit.register(shutdown)
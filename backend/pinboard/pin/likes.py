@@ -0,0 +1,105 @@
+"""
+幂等的点赞 / 取消点赞
+
+- like：直接 INSERT，(user, pin) 唯一约束冲突说明已经点过赞（包括并发的双击），
+  不再先 exists() 再 create()，也不会因为竞争变成 500
+- unlike：一条 DELETE，只有真正删到行的请求发 post_delete 信号（计数、缓存等维护都在
+  信号里，和其他删除 Like 的路径相同）；两个并发的取消只有一个删到行，计数不会被多减
+- toggle：先尝试取消，没有可取消的再点赞
+
+都返回操作后的状态 {'pin_id': 点赞目标, 'liked': bool, 'like_count': int}。
+点赞总是记在原始 Pin 上。打开 PINBOARD_LIKE_BUFFER 时写入改由 pin/like_buffer.py 批量完成，
+记入缓冲区时就让缓存的响应体和 ETag 失效（点赞数、is_liked 已经变了），不等写入数据库。
+"""
+from django.db import IntegrityError, connection, router, transaction
+from django.db.models.signals import post_delete
+
+from . import conditional, like_buffer, response_cache
+from .batching import like_target_id
+from .models import Like, Pin
+
+
+def state(target_id, liked):
+    like_count = Pin.objects.filter(pk=target_id).values_list('like_count', flat=True).first() or 0
+    if like_buffer.enabled():
+        # 还在写缓冲里的点赞（见 pin/like_buffer.py）
+        like_count = max(like_count + like_buffer.pending_delta(target_id), 0)
+    return {'pin_id': target_id, 'liked': liked, 'like_count': like_count}
+
+
+def _insert(user, target_id):
+    """插入点赞，返回是否新插入；post_save 信号负责计数和缓存"""
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, pin_id=target_id)
+    except IntegrityError:
+        return False
+    return True
+
+
+def delete_rows(target_id, user_ids):
+    """
+    一条 DELETE 删除这些用户对 target_id 的点赞，返回实际删除的行数，不发信号
+    （批量调用方像 bulk_create 一样自己用 bulk.likes_changed 维护）。
+    QuerySet.delete() 会先 SELECT 再删除并对查到的行发 post_delete，
+    并发时两个请求都会减一次计数，所以用 DELETE 的行数判断
+    """
+    user_ids = list(user_ids)
+    placeholders = ', '.join(['%s'] * len(user_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {connection.ops.quote_name(Like._meta.db_table)} "
+            f"WHERE pin_id = %s AND user_id IN ({placeholders})",
+            [target_id, *user_ids],
+        )
+        return cursor.rowcount
+
+
+def _delete(user, target_id):
+    """删除点赞，返回是否删到了行；删到时发 post_delete，Like 的维护都由信号完成"""
+    with transaction.atomic():
+        deleted = delete_rows(target_id, [user.pk]) > 0
+        if deleted:
+            like = Like(user_id=user.pk, pin_id=target_id)
+            post_delete.send(sender=Like, instance=like, using=router.db_for_write(Like), origin=like)
+    return deleted
+
+
+def _record(user, target_id, liked=None):
+    """记入写缓冲，返回 (最新状态, 是否变化)；写入数据库时 bulk.likes_changed 会再失效一次"""
+    current, changed = like_buffer.record(user.pk, target_id, liked)
+    if changed:
+        response_cache.invalidate('pin', [target_id])
+        conditional.touch_like_targets([target_id])
+    return current, changed
+
+
+def like(user, pin):
+    """返回 (状态, 是否新点赞)"""
+    target_id = like_target_id(pin)
+    if like_buffer.enabled():
+        _, created = _record(user, target_id, True)
+    else:
+        created = _insert(user, target_id)
+    return state(target_id, True), created
+
+
+def unlike(user, pin):
+    target_id = like_target_id(pin)
+    if like_buffer.enabled():
+        _record(user, target_id, False)
+    else:
+        _delete(user, target_id)
+    return state(target_id, False)
+
+
+def toggle(user, pin):
+    target_id = like_target_id(pin)
+    if like_buffer.enabled():
+        liked, _ = _record(user, target_id)
+        return state(target_id, liked)
+    if _delete(user, target_id):
+        return state(target_id, False)
+    # 没有可取消的点赞：点赞（并发的另一个请求刚点过也是“已点赞”）
+    _insert(user, target_id)
+    return state(target_id, True)
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from pin.models import Board, CustomUser, FollowStream, Picture, Pin
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "在高并发下对比热点读接口的同步（WSGI，线程）和异步（ASGI，协程）版本的延迟和吞吐量。"
+        "两者都在进程内运行，使用临时创建的数据，结束后删除"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=32, help='并发客户端数（同步版本的线程数）')
+        parser.add_argument('--requests', type=int, default=20, help='每个客户端发送的请求数')
+        parser.add_argument('--pins', type=int, default=2000)
+        parser.add_argument('--db-latency', type=float, default=2.0,
+                            help='每条查询额外等待的毫秒数，模拟网络上的数据库服务器（0 表示不模拟）')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        user = CustomUser.objects.create(username=f'bench-{tag}')
+        token = Token.objects.create(user=user)
+        board = Board.objects.create(board_name=f'bench {tag}', owner=user)
+        picture = Picture.objects.create(external_url='https://example.com/bench.jpg', tags='bench', uploaded_by=user)
+        for start in range(0, options['pins'], BATCH_SIZE):
+            for _ in range(start, min(start + BATCH_SIZE, options['pins'])):
+                Pin.objects.create(user=user, board=board, picture=picture, title=f'bench pin {tag}')
+        stream = FollowStream.objects.create(user=user, stream_name='bench')
+        stream.boards.add(board)
+
+        paths = [
+            f'follow-streams/{stream.pk}/pictures/',
+            f'search/pins/?q={tag}',
+            f'boards/{board.pk}/pins/',
+        ]
+        headers = {'Authorization': f'Token {token.key}'}
+        latency = options['db_latency'] / 1000
+
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install(sender, connection, **kwargs):
+            # 连接关闭后重新打开时同一个 DatabaseWrapper 会再次触发
+            if delay not in connection.execute_wrappers:
+                connection.execute_wrappers.append(delay)
+
+        if latency:
+            connection_created.connect(install)
+            connection.execute_wrappers.append(delay)
+        try:
+            # 测试客户端的 Host 是 testserver
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for path in paths:
+                    self.stdout.write(path.split('?')[0])
+                    self.report('sync (WSGI threads)', self.run_sync(f'/api/{path}', headers, options))
+                    self.report('async (ASGI)', asyncio.run(self.run_async(f'/api/async/{path}', headers, options)))
+        finally:
+            if latency:
+                connection_created.disconnect(install)
+                connection.execute_wrappers.remove(delay)
+            user.delete()
+
+    def report(self, label, result):
+        timings, elapsed, errors = result
+        timings.sort()
+        self.stdout.write(
+            f"  {label:<20} median {timings[len(timings) // 2] * 1000:7.1f} ms"
+            f"  p95 {timings[int(len(timings) * 0.95)] * 1000:7.1f} ms"
+            f"  {len(timings) / elapsed:7.0f} requests/s  errors={errors}"
+        )
+
+    def run_sync(self, url, headers, options):
+        timings, errors, lock = [], [0], threading.Lock()
+
+        def client():
+            api = Client(headers=headers)
+            try:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    response = api.get(url)
+                    with lock:
+                        timings.append(time.perf_counter() - started)
+                        errors[0] += response.status_code != 200
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client) for _ in range(options['clients'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, time.perf_counter() - started, errors[0]
+
+    async def run_async(self, url, headers, options):
+        timings, errors = [], [0]
+
+        async def client():
+            api = AsyncClient()
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                response = await api.get(url, headers=headers)
+                timings.append(time.perf_counter() - started)
+                errors[0] += response.status_code != 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['clients'])))
+        return timings, time.perf_counter() - started, errors[0]
@@ -0,0 +1,98 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from pin import friends
+from pin.models import CustomUser, Friendship
+
+BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "在合成的好友关系图上测量“可能认识的人”和共同好友的耗时。"
+        "数据写在一个事务里，结束后回滚，不会留在数据库中"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--edges-per-user', type=int, default=10,
+                            help='每个新用户连接的已有用户数（优先连接，度数呈幂律分布）')
+        parser.add_argument('--hub-friends', type=int, default=5000, help='额外的一个“大 V”用户的好友数量')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        prefix = f'bench{rng.randrange(10 ** 8)}_'
+        CustomUser.objects.bulk_create(
+            (CustomUser(username=f'{prefix}{i}', password='!') for i in range(options['users'] + 1)),
+            batch_size=BATCH_SIZE,
+        )
+        ids = list(CustomUser.objects.filter(username__startswith=prefix).order_by('id').values_list('id', flat=True))
+        hub, ids = ids[0], ids[1:]
+
+        # 优先连接：从已有边的端点里随机选，度数高的用户更容易被选中
+        pairs, endpoints = set(), []
+        for index, user_id in enumerate(ids):
+            for _ in range(min(options['edges_per_user'], index)):
+                other = rng.choice(endpoints) if endpoints and rng.random() < 0.8 else ids[rng.randrange(index)]
+                if other != user_id:
+                    pairs.add(friends.ordered(user_id, other))
+                    endpoints.extend((user_id, other))
+        for other in rng.sample(ids, min(options['hub_friends'], len(ids))):
+            pairs.add(friends.ordered(hub, other))
+        Friendship.objects.bulk_create(
+            (Friendship(user1_id=a, user2_id=b) for a, b in pairs), batch_size=BATCH_SIZE,
+        )
+        self.stdout.write(
+            f"generated {len(ids) + 1} users / {len(pairs)} friendships in {time.perf_counter() - started:.1f}s"
+        )
+
+        typical = ids[len(ids) // 2]
+        for label, user_id in (('typical user', typical), ('hub user', hub)):
+            self.measure(label, user_id, ids, rng, options['repeat'])
+
+    def measure(self, label, user_id, ids, rng, repeat):
+        # 共同好友对比的是推荐列表里的第一个人，保证交集不为空
+        candidates = friends.suggestions(user_id)
+        other = candidates[0].id if candidates else rng.choice(ids)
+        cases = [
+            ('people-you-may-know (cold)', lambda: (friends.invalidate(user_id), friends.suggestions(user_id))[1]),
+            ('people-you-may-know (cached)', lambda: friends.suggestions(user_id)),
+            ('mutual friends (page of 50)', lambda: list(
+                CustomUser.objects.filter(friends.mutual_friends_q(user_id, other)).order_by('username', 'id')[:50]
+            )),
+            ('are_friends (cached)', lambda: friends.are_friends(user_id, other)),
+        ]
+        self.stdout.write(f"{label} ({len(friends.friend_ids(user_id))} friends):")
+        for name, run in cases:
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    result = run()
+                    timings.append(time.perf_counter() - started)
+            size = len(result) if hasattr(result, '__len__') else result
+            self.stdout.write(
+                f"  {name:<32} median {sorted(timings)[len(timings) // 2] * 1000:8.2f} ms"
+                f"  {len(captured)} queries  result={size}"
+            )
+        # 缓存不随事务回滚，清掉合成用户的条目
+        friends.invalidate(user_id, other)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from pin import blobs
+from pin.models import ImageBlob, Picture
+
+
+class Command(BaseCommand):
+    help = "把还没有去重的上传图片迁移到按内容存储的 blob，删除重复文件和没有引用的 blob"
+
+    def handle(self, *args, **options):
+        pictures = Picture.objects.filter(blob__isnull=True).exclude(Q(image_file='') | Q(image_file__isnull=True))
+        linked = removed = failed = 0
+        for picture in pictures.iterator():
+            try:
+                _, deleted = blobs.adopt(picture)
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"Picture {picture.picture_id}: {e}")
+                continue
+            linked += 1
+            removed += deleted
+
+        pruned = 0
+        for blob in ImageBlob.objects.filter(pictures=None):
+            blob.delete()
+            pruned += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Linked {linked} picture(s), removed {removed} duplicate file(s), "
+            f"pruned {pruned} unreferenced blob(s), {failed} failed"
+        ))
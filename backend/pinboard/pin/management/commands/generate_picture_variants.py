@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from pin import imaging
+from pin.models import ImageBlob
+
+
+class Command(BaseCommand):
+    help = "为已有的上传图片补齐缩略图 / 响应式尺寸"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--picture', type=int, action='append', dest='pictures',
+                            help='只处理指定的 picture_id（可重复）')
+        parser.add_argument('--force', action='store_true', help='删除已有的派生图片后重新生成')
+
+    def handle(self, *args, **options):
+        # 派生图片按内容共享，每个 blob 只生成一次
+        blobs = ImageBlob.objects.all()
+        if options['pictures']:
+            blobs = blobs.filter(pictures__picture_id__in=options['pictures']).distinct()
+        created = failed = 0
+        for blob in blobs.iterator():
+            try:
+                created += imaging.generate_variants(blob, force=options['force'])
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f"Blob {blob.digest[:12]}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {created} variant(s), {failed} image(s) failed"))
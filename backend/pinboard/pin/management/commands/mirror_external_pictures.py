@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pin import mirror
+from pin.models import Picture
+
+
+class Command(BaseCommand):
+    help = "把外部图片镜像到本地（需要 PINBOARD_MIRROR_EXTERNAL_IMAGES），并按磁盘预算淘汰"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--revalidate', action='store_true', help='已经镜像的图片也向源站重新验证')
+
+    def handle(self, *args, **options):
+        if not mirror.enabled():
+            raise CommandError("PINBOARD_MIRROR_EXTERNAL_IMAGES is disabled")
+        urls = (
+            Picture.objects.exclude(external_url__isnull=True).exclude(external_url='')
+            .values_list('external_url', flat=True).distinct()
+        )
+        cached = failed = 0
+        for url in urls.iterator():
+            record = mirror.visit(url, force=options['revalidate'])
+            if record.status == 'failed':
+                failed += 1
+                self.stderr.write(f"{url}: {record.error}")
+            else:
+                cached += 1
+        evicted = mirror.enforce_budget()
+        self.stdout.write(self.style.SUCCESS(
+            f"Mirrored {cached} URL(s), {failed} failed, {evicted} evicted over budget"
+        ))
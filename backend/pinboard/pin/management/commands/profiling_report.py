@@ -0,0 +1,57 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from pin import profiling
+
+
+class Command(BaseCommand):
+    help = (
+        "汇总 ProfilingMiddleware 记录的各接口开销（PINBOARD_PROFILING_DIR 下所有进程的文件），"
+        "列出最慢和查询最多的接口"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--max-age', type=float, default=None,
+                            help='忽略这么多秒之前写的文件（已经退出的进程）')
+        parser.add_argument('--json', action='store_true', help='输出 JSON，便于脚本处理')
+        parser.add_argument('--reset', action='store_true', help='输出后删除已经汇总的文件')
+
+    def handle(self, *args, **options):
+        # 当前进程（例如在 shell 里调用）还没写出的记录也算上
+        profiling.flush()
+        rows = profiling.summarize(profiling.load(max_age=options['max_age']))
+        top = options['top']
+        slowest = sorted(rows, key=lambda row: row['p95_ms'], reverse=True)[:top]
+        heaviest = sorted(rows, key=lambda row: (row['queries'], row['max_queries']), reverse=True)[:top]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'slowest': slowest, 'query_heaviest': heaviest}, indent=2))
+        elif not rows:
+            self.stdout.write("No requests recorded (is PINBOARD_PROFILING enabled?)")
+        else:
+            self.table("Slowest endpoints (p95 total time)", slowest)
+            self.table("Query-heaviest endpoints (mean queries per request)", heaviest)
+
+        if options['reset']:
+            directory = profiling.profiling_dir()
+            for name in os.listdir(directory) if os.path.isdir(directory) else []:
+                if name.endswith('.json'):
+                    os.remove(os.path.join(directory, name))
+            profiling.reset()
+
+    def table(self, title, rows):
+        self.stdout.write(title)
+        self.stdout.write(
+            f"  {'endpoint':<44} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"
+            f" {'queries':>8} {'max q':>6} {'db ms':>7} {'ser ms':>7} {'bytes':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"  {row['endpoint']:<44} {row['count']:>7} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}"
+                f" {row['max_ms']:>8.1f} {row['queries']:>8.1f} {row['max_queries']:>6} {row['db_ms']:>7.1f}"
+                f" {row['serialize_ms']:>7.1f} {row['bytes']:>8}"
+            )
+        self.stdout.write("")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from pin import feed
+from pin.models import Board, FollowStream
+
+
+class Command(BaseCommand):
+    help = "重新计算热门 Board 标记，并从头重建关注流的预计算时间线"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stream', type=int, action='append', dest='streams',
+                            help='只重建指定的 stream_id（可重复），默认重建全部')
+
+    def handle(self, *args, **options):
+        # 按当前关注数重新划分写扩散 / 读扩散的 Board（标记可以在这里降回去）
+        hot_ids = list(
+            Board.objects.annotate(followers=Count('followed_by_streams'))
+            .filter(followers__gt=feed.fanout_limit()).values_list('board_id', flat=True)
+        )
+        Board.objects.exclude(board_id__in=hot_ids).filter(fanout_on_read=True).update(fanout_on_read=False)
+        Board.objects.filter(board_id__in=hot_ids).update(fanout_on_read=True)
+        self.stdout.write(f"{len(hot_ids)} board(s) use fan-out on read")
+
+        streams = FollowStream.objects.all()
+        if options['streams']:
+            streams = streams.filter(stream_id__in=options['streams'])
+        total = 0
+        for stream in streams.iterator():
+            feed.rebuild_stream(stream)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} follow stream timeline(s)"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from pin import search
+
+
+class Command(BaseCommand):
+    help = "重建 Pin / Picture / Board / User 的 FTS5 全文搜索索引"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The FTS5 search index is only used with SQLite; other databases use the fallback search.")
+        for index in search.INDEXES:
+            with transaction.atomic():
+                total = index.rebuild()
+            self.stdout.write(f"{index.table}: {total} document(s)")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
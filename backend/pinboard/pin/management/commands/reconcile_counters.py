@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from pin import counters
+
+
+class Command(BaseCommand):
+    help = "检查并修复 Pin / CustomUser 上的冗余计数列"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只报告偏差，不修改数据')
+
+    def handle(self, *args, **options):
+        drift = counters.reconcile(apply=not options['dry_run'])
+        for name, rows in drift.items():
+            self.stdout.write(f"{name}: {rows} row(s) out of sync")
+        if options['dry_run']:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Repaired {sum(drift.values())} counter value(s)"))
@@ -0,0 +1,195 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from pin import auth, synthetic
+from pin.models import Board, CustomUser, FollowStream, Pin
+
+ENDPOINTS = ['search_pins', 'stream_pictures', 'board_pins', 'get_friends', 'like_pin', 'repin']
+
+
+class Rollback(Exception):
+    pass
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "在几个规模的合成数据集上测量热点接口（搜索、关注流、Board 的 Pin、好友列表、点赞、转存）"
+        "的耗时和查询条数，输出 JSON，--compare 和之前的结果对比找出回归。"
+        "每个规模的数据在一个事务里生成和测量，结束后回滚；在空数据库上运行的结果才可以互相比较"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='100,1000', help='逗号分隔的用户数')
+        parser.add_argument('--repeat', type=int, default=10, help='每个接口请求的次数（第一次在清空缓存后）')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='把结果写到这个 JSON 文件')
+        parser.add_argument('--compare', help='之前 --output 写出的 JSON，和它对比')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='中位数耗时比基准慢这个比例以上算作回归（查询条数增加总是回归）')
+        parser.add_argument('--fail-on-regression', action='store_true', help='有回归时以非零状态退出')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        if options['repeat'] < 1 or not scales:
+            raise CommandError("--scales and --repeat must be positive")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        result = {
+            'commit': _git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            # 写接口也在回滚的事务里测量，没有提交的开销
+            'note': 'measured inside a rolled-back transaction; times in milliseconds',
+            'scales': {},
+        }
+        # 测试客户端的 Host 是 testserver；点赞直接写库，不经过写缓冲
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], PINBOARD_LIKE_BUFFER=False):
+            for scale in scales:
+                result['scales'][str(scale)] = self.run_scale(scale, options)
+                self.report(scale, result['scales'][str(scale)])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(result, file, indent=2)
+        if baseline is not None:
+            regressions = self.compare(baseline, result, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"{len(regressions)} regression(s)")
+
+    def run_scale(self, scale, options):
+        measured = {}
+        try:
+            with transaction.atomic():
+                existing = Pin.objects.count()
+                started = time.perf_counter()
+                dataset = synthetic.generate(scale, seed=options['seed'], prefix=f'bench-{scale}-')
+                generate_s = time.perf_counter() - started
+                for name, request in self.requests(dataset, options['repeat']):
+                    measured[name] = self.measure(request, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # 缓存不随事务回滚；回滚后主键会被重新使用
+            cache.clear()
+            auth.clear()
+        return {
+            'existing_pins': existing,
+            'rows': dataset['rows'],
+            'generate_s': round(generate_s, 2),
+            'endpoints': measured,
+        }
+
+    def requests(self, dataset, repeat):
+        """[(接口, 第 i 次请求的函数)]；写接口每次作用在不同的 Pin 上"""
+        stream = FollowStream.objects.get(pk=dataset['stream_ids'][0])
+        viewer = stream.user
+        client = Client(headers={'Authorization': f'Token {auth.issue(viewer).key}'})
+        board = Board.objects.filter(owner=viewer).first()
+        # 热门的原创 Pin 里当前用户没有点过赞、也不是自己的
+        targets = list(
+            Pin.objects.filter(pk__in=dataset['pin_ids'], origin_pin=None).exclude(user=viewer)
+            .exclude(likes_received__user=viewer).values_list('pk', flat=True)[:repeat * 2]
+        )
+        if len(targets) < repeat * 2:
+            raise CommandError("Dataset is too small for --repeat; use a larger scale")
+        hub = CustomUser.objects.get(pk=dataset['user_ids'][0])
+        return [
+            ('search_pins', lambda i: client.get('/api/search/pins/', {'q': dataset['words'][0]})),
+            ('stream_pictures', lambda i: client.get(f'/api/follow-streams/{stream.pk}/pictures/')),
+            ('board_pins', lambda i: client.get(f"/api/boards/{dataset['board_ids'][0]}/pins/")),
+            ('get_friends', lambda i: client.get(f'/api/users/{hub.pk}/friends/')),
+            ('like_pin', lambda i: client.post(f'/api/pins/{targets[i]}/like/')),
+            ('repin', lambda i: client.post(f'/api/pins/{targets[repeat + i]}/repin/', {'board': board.pk})),
+        ]
+
+    def measure(self, request, repeat):
+        timings, queries, statuses = [], [], set()
+
+        def count(execute, sql, params, many, context):
+            queries[-1] += 1
+            return execute(sql, params, many, context)
+
+        cache.clear()
+        auth.clear()
+        for i in range(repeat):
+            queries.append(0)
+            with connection.execute_wrapper(count):
+                started = time.perf_counter()
+                response = request(i)
+                timings.append((time.perf_counter() - started) * 1000)
+            statuses.add(response.status_code)
+        # 第一次请求在清空缓存之后，单独记录
+        warm = timings[1:] or timings
+        return {
+            'status': max(statuses),
+            'cold_ms': round(timings[0], 2),
+            'cold_queries': queries[0],
+            'median_ms': round(_percentile(warm, 0.5), 2),
+            'p95_ms': round(_percentile(warm, 0.95), 2),
+            'mean_ms': round(sum(warm) / len(warm), 2),
+            'queries': _percentile(queries[1:] or queries, 0.5),
+        }
+
+    def report(self, scale, data):
+        rows = ', '.join(f'{count} {table}' for table, count in data['rows'].items())
+        self.stdout.write(f"{scale} users ({rows}; generated in {data['generate_s']:.1f}s)")
+        for name, stats in data['endpoints'].items():
+            self.stdout.write(
+                f"  {name:<16} {stats['status']:>3}  median {stats['median_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms"
+                f"  {stats['queries']:>3} queries  cold {stats['cold_ms']:8.2f} ms / {stats['cold_queries']} queries"
+            )
+
+    def compare(self, baseline, result, threshold):
+        """对比两次运行里都有的规模和接口，返回回归列表"""
+        regressions = []
+        self.stdout.write(f"Compared with {baseline.get('commit') or 'baseline'}:")
+        for scale, data in result['scales'].items():
+            before = baseline.get('scales', {}).get(scale)
+            if before is None:
+                continue
+            for name, stats in data['endpoints'].items():
+                old = before['endpoints'].get(name)
+                if old is None:
+                    continue
+                ratio = stats['median_ms'] / old['median_ms'] if old['median_ms'] else 1.0
+                regressed = ratio > 1 + threshold or stats['queries'] > old['queries']
+                if regressed:
+                    regressions.append((scale, name))
+                line = (
+                    f"  {scale:>7} {name:<16} {old['median_ms']:8.2f} -> {stats['median_ms']:8.2f} ms ({ratio:5.2f}x)"
+                    f"  {old['queries']} -> {stats['queries']} queries"
+                )
+                self.stdout.write(self.style.ERROR(f"{line}  REGRESSION") if regressed else line)
+        return regressions
@@ -0,0 +1,92 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from pin import like_buffer
+from pin.models import Board, CustomUser, Like, Picture, Pin
+
+
+class Command(BaseCommand):
+    help = (
+        "多个并发客户端对同一个 Pin 反复点赞 / 取消 / 切换，检查没有错误响应、"
+        "like_count 和 Like 行数一致。使用临时创建的用户和 Pin，结束后删除"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=50, help='每个客户端发送的请求数')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--buffer', action='store_true', help='打开点赞写缓冲（PINBOARD_LIKE_BUFFER）')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        owner = CustomUser.objects.create(username=f'stress-{tag}-owner')
+        board = Board.objects.create(board_name='stress', owner=owner)
+        picture = Picture.objects.create(external_url='https://example.com/stress.jpg', uploaded_by=owner)
+        pin = Pin.objects.create(user=owner, board=board, picture=picture, title='stress')
+        # 每个用户两个客户端，模拟同一个用户的并发双击
+        users = [CustomUser.objects.create(username=f'stress-{tag}-{i}') for i in range(max(1, options['clients'] // 2))]
+        try:
+            with override_settings(PINBOARD_LIKE_BUFFER=options['buffer']):
+                started = time.perf_counter()
+                statuses, timings = self.run(pin, users, options)
+                elapsed = time.perf_counter() - started
+                if options['buffer']:
+                    like_buffer.flush()
+        finally:
+            like_rows = Like.objects.filter(pin=pin).count()
+            pin.refresh_from_db()
+            CustomUser.objects.filter(pk__in=[user.pk for user in users] + [owner.pk]).delete()
+
+        timings.sort()
+        self.stdout.write(f"responses: {dict(statuses)}")
+        self.stdout.write(
+            f"latency: median {timings[len(timings) // 2] * 1000:.1f} ms, "
+            f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} ms"
+        )
+        self.stdout.write(f"throughput: {len(timings) / elapsed:.0f} requests/s")
+        self.stdout.write(f"like_count={pin.like_count} like rows={like_rows}")
+        errors = sum(count for status, count in statuses.items() if status >= 400)
+        if errors or pin.like_count != like_rows:
+            self.stderr.write(self.style.ERROR("FAILED: errors or counter drift"))
+        else:
+            self.stdout.write(self.style.SUCCESS("OK: no errors, no lost updates"))
+
+    def run(self, pin, users, options):
+        statuses, timings, lock = Counter(), [], threading.Lock()
+        barrier = threading.Barrier(options['clients'])
+
+        def client(user, seed):
+            rng = random.Random(seed)
+            # 开发配置的 ALLOWED_HOSTS 只允许 localhost
+            api = APIClient(HTTP_HOST='localhost')
+            api.force_authenticate(user)
+            barrier.wait()
+            try:
+                for _ in range(options['requests']):
+                    action = rng.choice(['like', 'like', 'unlike', 'toggle-like'])
+                    started = time.perf_counter()
+                    response = api.post(f'/api/pins/{pin.pin_id}/{action}/')
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        statuses[response.status_code] += 1
+                        timings.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=client, args=(users[index % len(users)], options['seed'] + index))
+            for index in range(options['clients'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses, timings
@@ -0,0 +1,199 @@
+"""
+上传图片（MEDIA_ROOT 下的文件）的生产环境发送
+
+去重后的图片和派生尺寸按内容摘要命名（pictures/ab/cd/<sha256>.jpg、
+pictures/variants/<sha256>_236w.webp，见 pin/blobs.py、pin/imaging.py），同一个地址的内容
+永远不会变，这些文件带 `Cache-Control: immutable` 和一年的 max-age；还没有迁移到 blob 存储的
+旧文件（`python manage.py dedupe_pictures`）只缓存 PINBOARD_MEDIA_MAX_AGE 秒，之后用 ETag /
+Last-Modified 重新验证。
+
+PINBOARD_MEDIA_SENDFILE 决定谁来发送文件内容：
+
+- None：Django 用 FileResponse 发送。WSGI 服务器提供 wsgi.file_wrapper 时（gunicorn 等）
+  由服务器用 sendfile 零拷贝发送；支持单个范围的 Range / If-Range 请求
+- 'x-accel-redirect'：只返回响应头，nginx 从 PINBOARD_MEDIA_ACCEL_PREFIX 这个 internal
+  location 发送文件，范围请求也由 nginx 处理
+- 'x-sendfile'：同上，Apache mod_xsendfile / lighttpd 按文件的绝对路径发送
+"""
+import mimetypes
+import os
+import re
+import urllib.parse
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# Python 发送文件时每次读取的块大小（FileResponse 默认 4KB）
+BLOCK_SIZE = 64 * 1024
+# 按内容摘要命名的文件
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}(_|\.|$)')
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def sendfile_mode():
+    return getattr(settings, 'PINBOARD_MEDIA_SENDFILE', None)
+
+
+def accel_prefix():
+    return getattr(settings, 'PINBOARD_MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+
+def max_age():
+    return getattr(settings, 'PINBOARD_MEDIA_MAX_AGE', 60 * 60)
+
+
+def immutable_max_age():
+    return getattr(settings, 'PINBOARD_MEDIA_IMMUTABLE_MAX_AGE', 365 * 24 * 60 * 60)
+
+
+def is_immutable(name):
+    return bool(_CONTENT_ADDRESSED.match(os.path.basename(name)))
+
+
+def url(file, request=None):
+    """文件字段的地址，有 request 时返回完整 URL"""
+    if not file:
+        return None
+    result = file.url
+    return request.build_absolute_uri(result) if request is not None else result
+
+
+def etag(stat):
+    # 和 nginx 相同的形式：修改时间-大小
+    return '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parse_range(header, size):
+    """
+    解析 Range 头，返回 (start, end)（包含 end），不是单个字节范围时返回 None（发送整个文件），
+    范围无法满足时抛出 ValueError
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # bytes=-N：最后 N 个字节
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        if last and int(last) < start:
+            return None  # 语法无效，忽略
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_matches(request, etag_value, last_modified):
+    """If-Range 和当前文件一致时才按范围发送，否则发送整个文件"""
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag_value
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class _FileRange:
+    """
+    只读出文件 [start, start + length) 的部分。fileno() / tell() 留给 WSGI 服务器：
+    gunicorn 的 file_wrapper 从当前位置 sendfile Content-Length 个字节
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _offload(path, fullpath, content_type):
+    response = HttpResponse(content_type=content_type)
+    if sendfile_mode() == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = accel_prefix().rstrip('/') + '/' + urllib.parse.quote(path)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+def _stream(request, fullpath, size, etag_value, last_modified, content_type):
+    start, end = 0, size - 1
+    partial = False
+    if 'Range' in request.headers and size and _if_range_matches(request, etag_value, last_modified):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            (start, end), partial = byte_range, True
+
+    file = open(fullpath, 'rb')
+    response = FileResponse(
+        _FileRange(file, start, end - start + 1) if partial else file,
+        status=206 if partial else 200, content_type=content_type,
+    )
+    response.block_size = BLOCK_SIZE
+    response['Content-Length'] = end - start + 1 if size else 0
+    if partial:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404('File not found.')
+    if not os.path.isfile(fullpath):
+        raise Http404('File not found.')
+
+    etag_value = etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag_value, last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+        if sendfile_mode():
+            response = _offload(path, fullpath, content_type)
+        else:
+            response = _stream(request, fullpath, stat.st_size, etag_value, last_modified, content_type)
+
+    response['ETag'] = etag_value
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if response.status_code == 416:
+        return response
+    if is_immutable(path):
+        patch_cache_control(response, public=True, max_age=immutable_max_age(), immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age())
+    return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0007_alter_pin_origin_pin'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['-timestamp', '-pin_id'], name='pin_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['board', '-timestamp', '-pin_id'], name='pin_board_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['user', '-timestamp', '-pin_id'], name='pin_user_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def build_timelines(apps, schema_editor):
+    # 已有的关注流写入时间线（和 rebuild_follow_feeds 相同），否则升级后在重建之前都是空的
+    Board = apps.get_model('pin', 'Board')
+    FollowStream = apps.get_model('pin', 'FollowStream')
+    FollowStreamEntry = apps.get_model('pin', 'FollowStreamEntry')
+    Pin = apps.get_model('pin', 'Pin')
+    FollowStreamBoard = FollowStream.boards.through
+
+    limit = getattr(settings, 'PINBOARD_FEED_FANOUT_LIMIT', 1000)
+    hot = list(
+        FollowStreamBoard.objects.values('board_id').annotate(followers=Count('followstream_id'))
+        .filter(followers__gt=limit).values_list('board_id', flat=True)
+    )
+    Board.objects.filter(pk__in=hot).update(fanout_on_read=True)
+
+    streams_by_board = {}
+    follows = FollowStreamBoard.objects.exclude(board_id__in=hot).values_list('board_id', 'followstream_id')
+    for board_id, stream_id in follows:
+        streams_by_board.setdefault(board_id, []).append(stream_id)
+    pins = Pin.objects.filter(board_id__in=list(streams_by_board)).values_list('pk', 'board_id', 'timestamp')
+    batch = []
+    for pin_id, board_id, timestamp in pins.iterator(chunk_size=BATCH_SIZE):
+        for stream_id in streams_by_board[board_id]:
+            batch.append(FollowStreamEntry(stream_id=stream_id, pin_id=pin_id, board_id=board_id, timestamp=timestamp))
+        if len(batch) >= BATCH_SIZE:
+            FollowStreamEntry.objects.bulk_create(batch)
+            batch = []
+    FollowStreamEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0008_pin_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='fanout_on_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='FollowStreamEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stream_entries', to='pin.board')),
+                ('pin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stream_entries', to='pin.pin')),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='pin.followstream')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stream', '-timestamp', '-pin'], name='entry_stream_timestamp_idx'), models.Index(fields=['stream', 'board'], name='entry_stream_board_idx')],
+                'unique_together': {('stream', 'pin')},
+            },
+        ),
+        migrations.RunPython(build_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    # 为已有数据计算一次计数
+    Pin = apps.get_model('pin', 'Pin')
+    CustomUser = apps.get_model('pin', 'CustomUser')
+    Like = apps.get_model('pin', 'Like')
+    Comment = apps.get_model('pin', 'Comment')
+    Board = apps.get_model('pin', 'Board')
+
+    def count(child, fk):
+        rows = (
+            child.objects.filter(**{fk: OuterRef('pk')})
+            .order_by().values(fk).annotate(total=Count('*')).values('total')
+        )
+        return Coalesce(Subquery(rows), 0)
+
+    Pin.objects.update(
+        like_count=count(Like, 'pin'),
+        comment_count=count(Comment, 'pin'),
+        repin_count=count(Pin, 'origin_pin'),
+    )
+    CustomUser.objects.update(
+        board_count=count(Board, 'owner'),
+        pin_count=count(Pin, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0009_follow_stream_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='board_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='pin_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pin',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pin',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pin',
+            name='repin_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['-like_count', '-pin_id'], name='pin_like_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['-comment_count', '-pin_id'], name='pin_comment_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['-repin_count', '-pin_id'], name='pin_repin_count_idx'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations, transaction
+from django.db.utils import OperationalError
+
+# FTS5 倒排索引表，rowid 等于对应模型的主键（见 pin/search.py）
+TABLES = {
+    'pin_search_pin': (
+        "title, tags",
+        "SELECT p.pin_id, COALESCE(p.title, ''), COALESCE(pic.tags, '') "
+        "FROM pin_pin p JOIN pin_picture pic ON pic.picture_id = p.picture_id",
+    ),
+    'pin_search_picture': (
+        "tags",
+        "SELECT picture_id, COALESCE(tags, '') FROM pin_picture",
+    ),
+    'pin_search_board': (
+        "board_name, descriptor",
+        "SELECT board_id, COALESCE(board_name, ''), COALESCE(descriptor, '') FROM pin_board",
+    ),
+    'pin_search_user': (
+        "username",
+        "SELECT id, username FROM pin_customuser",
+    ),
+}
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for table, (columns, select) in TABLES.items():
+                schema_editor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                    f"{columns}, tokenize='unicode61 remove_diacritics 2')"
+                )
+                schema_editor.execute(f"INSERT INTO {table} (rowid, {columns}) {select}")
+    except OperationalError:
+        # SQLite 没有编译 FTS5，搜索会退回到 icontains
+        pass
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0010_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:39
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TAG_SEPARATORS = re.compile(r'[\s,，;；#]+')
+
+
+def split_existing_tags(apps, schema_editor):
+    # 把已有图片的 tags 字符串拆成 Tag / PictureTag（规则同 pin/tags.py 的 parse_tags）
+    Picture = apps.get_model('pin', 'Picture')
+    Tag = apps.get_model('pin', 'Tag')
+    PictureTag = apps.get_model('pin', 'PictureTag')
+
+    links = []
+    for picture_id, text in Picture.objects.exclude(tags__isnull=True).values_list('picture_id', 'tags'):
+        names = []
+        for token in TAG_SEPARATORS.split(text):
+            name = token.strip().lower()[:64]
+            if name and name not in names:
+                names.append(name)
+        links.extend((picture_id, name) for name in names)
+    if not links:
+        return
+
+    Tag.objects.bulk_create([Tag(name=name) for name in {name for _, name in links}], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.values_list('name', 'tag_id'))
+    PictureTag.objects.bulk_create(
+        [PictureTag(picture_id=picture_id, tag_id=tag_ids[name]) for picture_id, name in links],
+        ignore_conflicts=True,
+    )
+    usage = {}
+    for _, name in links:
+        usage[name] = usage.get(name, 0) + 1
+    for name, count in usage.items():
+        Tag.objects.filter(name=name).update(usage_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0011_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('tag_id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('usage_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PictureTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('picture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='picture_tags', to='pin.picture')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='picture_tags', to='pin.tag')),
+            ],
+            options={
+                'unique_together': {('tag', 'picture')},
+            },
+        ),
+        migrations.RunPython(split_existing_tags, migrations.RunPython.noop),
+    ]
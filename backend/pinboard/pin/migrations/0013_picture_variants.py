@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0012_normalized_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PictureVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('jpeg', 'JPEG'), ('webp', 'WebP')], max_length=10)),
+                ('image_file', models.ImageField(upload_to='pictures/variants/')),
+                ('picture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='pin.picture')),
+            ],
+            options={
+                'unique_together': {('picture', 'width', 'format')},
+            },
+        ),
+    ]
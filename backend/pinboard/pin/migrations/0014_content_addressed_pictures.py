@@ -0,0 +1,58 @@
+import django.db.models.deletion
+import pin.models
+from django.db import migrations, models
+
+
+def drop_picture_variants(apps, schema_editor):
+    # 派生图片改为挂在 blob 上；旧记录直接丢弃，执行 dedupe_pictures 之后
+    # 用 generate_picture_variants 重新生成
+    apps.get_model('pin', 'PictureVariant').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0013_picture_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('blob_id', models.AutoField(primary_key=True, serialize=False)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('file', models.ImageField(upload_to=pin.models.blob_upload_to)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='picture',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pictures', to='pin.imageblob'),
+        ),
+        migrations.RunPython(drop_picture_variants, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='picturevariant',
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name='picturevariant',
+            name='picture',
+        ),
+        migrations.AddField(
+            model_name='picturevariant',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='pin.imageblob'),
+        ),
+        migrations.AlterField(
+            model_name='picturevariant',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='pin.imageblob'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='picturevariant',
+            unique_together={('blob', 'width', 'format')},
+        ),
+    ]
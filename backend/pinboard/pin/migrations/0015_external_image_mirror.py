@@ -0,0 +1,34 @@
+# Generated by Django 5.1.15 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0014_content_addressed_pictures'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='picture',
+            name='external_url',
+            field=models.URLField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='MirroredImage',
+            fields=[
+                ('mirror_id', models.AutoField(primary_key=True, serialize=False)),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('url', models.URLField(max_length=2048)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('cached', 'Cached'), ('failed', 'Failed'), ('evicted', 'Evicted')], default='pending', max_length=10)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('fetched_time', models.DateTimeField(blank=True, null=True)),
+                ('last_access', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('blob', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='mirrors', to='pin.imageblob')),
+            ],
+        ),
+    ]
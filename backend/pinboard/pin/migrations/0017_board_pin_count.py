@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_board_pin_count(apps, schema_editor):
+    Board = apps.get_model('pin', 'Board')
+    Pin = apps.get_model('pin', 'Pin')
+    rows = Pin.objects.filter(board=OuterRef('pk')).order_by().values('board').annotate(total=Count('*')).values('total')
+    Board.objects.update(pin_count=Coalesce(Subquery(rows), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0016_version_stamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='board',
+            name='pin_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_board_pin_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def canonicalize_friendships(apps, schema_editor):
+    """把 user1 > user2 的记录翻转成 user1 < user2，翻转后重复的和自己加自己的记录删除"""
+    Friendship = apps.get_model('pin', 'Friendship')
+    Friendship.objects.filter(user1=F('user2')).delete()
+    for friendship in Friendship.objects.filter(user1__gt=F('user2')):
+        duplicate = Friendship.objects.filter(user1_id=friendship.user2_id, user2_id=friendship.user1_id)
+        if duplicate.exists():
+            friendship.delete()
+        else:
+            Friendship.objects.filter(pk=friendship.pk).update(user1_id=friendship.user2_id, user2_id=friendship.user1_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0017_board_pin_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_friendships, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(condition=models.Q(user1__lt=models.F('user2')), name='friendship_ordered_pair'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, transaction
+from django.db.utils import DatabaseError
+
+# PostgreSQL 上搜索退回到 icontains，Django 生成的条件是 UPPER("col"::text) LIKE UPPER(%s)，
+# 对同样的表达式建 pg_trgm 的 GIN 索引后，'%词%' 这种前后都有通配符的匹配也能走索引（见 pin/search.py）
+INDEXES = {
+    'pin_pin_title_trgm': ('pin_pin', 'title'),
+    'pin_picture_tags_trgm': ('pin_picture', 'tags'),
+    'pin_board_board_name_trgm': ('pin_board', 'board_name'),
+    'pin_board_descriptor_trgm': ('pin_board', 'descriptor'),
+    'pin_customuser_username_trgm': ('pin_customuser', 'username'),
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError:
+        # 没有权限安装扩展，搜索仍然可用，只是不走索引
+        return
+    for name, (table, column) in INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0018_friendship_ordered_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin', '0019_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['pin', '-timestamp'], name='comment_pin_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendshiprequest',
+            index=models.Index(fields=['receiver', 'status'], name='friendreq_receiver_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendshiprequest',
+            index=models.Index(fields=['sender', 'status'], name='friendreq_sender_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='picture',
+            index=models.Index(fields=['-upload_time', '-picture_id'], name='picture_upload_time_idx'),
+        ),
+    ]
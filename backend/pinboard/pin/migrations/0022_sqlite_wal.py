@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# WAL 是数据库文件本身的属性，切换一次以后一直有效。不放在每个连接的 init_command 里：
+# 只是连上数据库（例如 makemigrations --check）不应该改写数据库文件。
+# PRAGMA journal_mode 不能在事务里执行，这个迁移不使用事务。
+
+
+def set_journal_mode(schema_editor, mode):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode = {mode}')
+
+
+def enable_wal(apps, schema_editor):
+    set_journal_mode(schema_editor, 'WAL')
+
+
+def disable_wal(apps, schema_editor):
+    set_journal_mode(schema_editor, 'DELETE')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('pin', '0021_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.RunPython(enable_wal, disable_wal),
+    ]
@@ -0,0 +1,367 @@
+"""
+external_url 图片的本地镜像
+
+打开 PINBOARD_MIRROR_EXTERNAL_IMAGES 后，外部图片由后台线程下载一次，按内容存成
+ImageBlob（和上传的图片共用去重存储和缩略图，见 pin/blobs.py、pin/imaging.py），
+引用同一个 URL 的 Picture 都指向这个 blob，PictureSerializer 返回本地地址。
+
+- 下载有超时（PINBOARD_MIRROR_TIMEOUT）和大小限制（PINBOARD_MIRROR_MAX_BYTES），
+  只接受 http(s) 的图片，默认拒绝内网地址：每次连接（包括重定向）都检查解析出的地址，
+  并直接连接检查过的地址
+- 后台任务数量有上限（PINBOARD_MIRROR_QUEUE_LIMIT），同一个 URL 同时只下载一次
+- 镜像占用（按原图大小）超过 PINBOARD_MIRROR_DISK_BUDGET 时按最近访问时间淘汰，
+  被淘汰的图片退回到外部地址，下次被访问时重新下载
+- 超过 PINBOARD_MIRROR_REVALIDATE_AFTER 的镜像用 ETag / Last-Modified 条件请求重新验证
+
+`python manage.py mirror_external_pictures` 可以一次性镜像或重新验证所有外部图片。
+"""
+import datetime
+import hashlib
+import http.client
+import ipaddress
+import logging
+import mimetypes
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import blobs, counters, response_cache
+from .models import ImageBlob, MirroredImage, Picture
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'pinboard-mirror/1.0'
+CHUNK_SIZE = 64 * 1024
+# 小于这个大小的下载留在内存里，更大的写到临时文件
+SPOOL_SIZE = 1024 * 1024
+# 同一个 URL 的访问记录最多这么久写一次数据库
+TOUCH_INTERVAL = 60 * 60
+
+_executor = None
+_in_flight = set()
+_lock = threading.Lock()
+
+
+class MirrorError(Exception):
+    pass
+
+
+def enabled():
+    return getattr(settings, 'PINBOARD_MIRROR_EXTERNAL_IMAGES', False)
+
+
+def timeout():
+    return getattr(settings, 'PINBOARD_MIRROR_TIMEOUT', 10)
+
+
+def max_bytes():
+    return getattr(settings, 'PINBOARD_MIRROR_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def disk_budget():
+    return getattr(settings, 'PINBOARD_MIRROR_DISK_BUDGET', 1024 * 1024 * 1024)
+
+
+def revalidate_after():
+    return datetime.timedelta(seconds=getattr(settings, 'PINBOARD_MIRROR_REVALIDATE_AFTER', 24 * 60 * 60))
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def serves_locally(picture):
+    """外部图片已经镜像到本地，可以返回本地地址"""
+    return enabled() and picture.blob_id is not None
+
+
+# --- 调度 -------------------------------------------------------------------
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'PINBOARD_MIRROR_WORKERS', 2),
+            thread_name_prefix='picture-mirror',
+        )
+    return _executor
+
+
+def _run(url):
+    try:
+        visit(url)
+    except Exception:
+        logger.exception("Failed to mirror %s", url)
+    finally:
+        with _lock:
+            _in_flight.discard(url)
+        connection.close()
+
+
+def schedule(url):
+    """
+    事务提交后在后台处理这个 URL；队列已满或者同一个 URL 正在处理时直接放弃，
+    之后的访问会再次触发。PINBOARD_MIRROR_ASYNC=False 时同步执行（测试使用）
+    """
+    if not enabled() or not url:
+        return
+    if not getattr(settings, 'PINBOARD_MIRROR_ASYNC', True):
+        visit(url)
+        return
+
+    def submit():
+        with _lock:
+            if url in _in_flight or len(_in_flight) >= getattr(settings, 'PINBOARD_MIRROR_QUEUE_LIMIT', 100):
+                return
+            _in_flight.add(url)
+        executor().submit(_run, url)
+
+    transaction.on_commit(submit)
+
+
+def observe(picture):
+    """
+    序列化外部图片时调用：记录访问时间（LRU 用），需要时触发下载或重新验证。
+    用缓存限流，每个 URL 每 TOUCH_INTERVAL 最多调度一次，读接口本身不写数据库
+    """
+    if not enabled() or not picture.external_url:
+        return
+    if cache.add(f'pinboard:mirror:seen:{url_hash(picture.external_url)}', 1, timeout=TOUCH_INTERVAL):
+        schedule(picture.external_url)
+
+
+# --- 下载 -------------------------------------------------------------------
+
+def _check_url(url):
+    # 第一个地址和每次重定向的目标都要检查
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise MirrorError("Only http(s) URLs can be mirrored")
+
+
+def _allowed(ip):
+    return ip.is_global or getattr(settings, 'PINBOARD_MIRROR_ALLOW_PRIVATE', False)
+
+
+def _connect(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    解析主机名、检查地址，然后连接到检查过的那个地址，不再重新解析
+    （DNS rebinding 没有机会在检查和连接之间换成内网地址）
+    """
+    host, port = address
+    try:
+        addresses = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except OSError as e:
+        raise MirrorError(f"Cannot resolve host: {e}")
+    ips = [ipaddress.ip_address(info[4][0]) for info in addresses]
+    if not ips or not all(_allowed(ip) for ip in ips):
+        raise MirrorError("Refusing to fetch a private address")
+    return socket.create_connection((str(ips[0]), port), timeout, source_address)
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect
+
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection):
+    # TLS 仍然按主机名校验证书、发送 SNI
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect
+
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_CheckedHTTPConnection, req)
+
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_CheckedHTTPSConnection, req, context=self._context)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def _opener():
+    # 不使用环境变量里的代理：连接必须直接发往检查过的地址
+    return urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler, _CheckedRedirectHandler,
+    )
+
+
+def _filename(url, content_type):
+    name = os.path.basename(urllib.parse.urlsplit(url).path) or 'image'
+    if not os.path.splitext(name)[1]:
+        name += mimetypes.guess_extension(content_type) or ''
+    return name
+
+
+def download(record):
+    """
+    下载 record.url，返回 (File, etag, last_modified)；源站返回 304 时返回 None。
+    内容边下载边写入临时文件，超过大小或时间限制时中止。
+    """
+    _check_url(record.url)
+    request = urllib.request.Request(record.url, headers={'User-Agent': USER_AGENT})
+    if record.blob_id is not None:
+        if record.etag:
+            request.add_header('If-None-Match', record.etag)
+        if record.last_modified:
+            request.add_header('If-Modified-Since', record.last_modified)
+    try:
+        response = _opener().open(request, timeout=timeout())
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise MirrorError(f"HTTP {e.code}")
+    except (urllib.error.URLError, OSError) as e:
+        raise MirrorError(str(getattr(e, 'reason', e)))
+
+    deadline = time.monotonic() + timeout()
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        with response:
+            content_type = response.headers.get_content_type()
+            if not content_type.startswith('image/'):
+                raise MirrorError(f"Not an image: {content_type}")
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > max_bytes():
+                raise MirrorError("Image is too large")
+            total = 0
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > max_bytes():
+                    raise MirrorError("Image is too large")
+                if time.monotonic() > deadline:
+                    raise MirrorError("Download timed out")
+                buffer.write(chunk)
+            etag = response.headers.get('ETag', '')[:255]
+            last_modified = response.headers.get('Last-Modified', '')[:64]
+        buffer.seek(0)
+        try:
+            Image.open(buffer).verify()
+        except Exception:
+            raise MirrorError("Not a valid image")
+        buffer.seek(0)
+    except MirrorError:
+        buffer.close()
+        raise
+    except OSError as e:
+        buffer.close()
+        raise MirrorError(str(e))
+    return File(buffer, name=_filename(record.url, content_type)), etag, last_modified
+
+
+# --- 镜像记录 ----------------------------------------------------------------
+
+def _repoint(pictures, blob):
+    """让这些图片指向 blob（None 表示退回外部地址），同时维护 blob 的引用计数"""
+    for picture_id, old_blob_id in pictures.values_list('picture_id', 'blob_id'):
+        updated = Picture.objects.filter(pk=picture_id, blob_id=old_blob_id).update(
+            blob=blob, image_file=blob.file.name if blob else ''
+        )
+        if not updated:
+            continue
+        # queryset.update 不发信号，缓存的响应里的图片地址要手动失效
+        response_cache.invalidate('picture', [picture_id])
+        if blob is not None:
+            counters.adjust(ImageBlob, blob.pk, 'ref_count', 1)
+        if old_blob_id is not None:
+            counters.adjust(ImageBlob, old_blob_id, 'ref_count', -1)
+            blobs.release(old_blob_id)
+
+
+def link(record):
+    """引用这个 URL 的图片都指向镜像的 blob"""
+    if record.blob_id is None:
+        return
+    _repoint(Picture.objects.filter(external_url=record.url).exclude(blob_id=record.blob_id), record.blob)
+
+
+def evict(record):
+    """删除镜像，图片退回外部地址；blob 没有其他引用时文件随之删除"""
+    _repoint(Picture.objects.filter(external_url=record.url, blob_id=record.blob_id), None)
+    record.blob = None
+    record.status = 'evicted'
+    record.save(update_fields=['blob', 'status'])
+
+
+def enforce_budget():
+    """从最近访问的开始累计占用，超出预算的部分全部淘汰，返回淘汰的数量"""
+    used, evicted = 0, 0
+    records = (
+        MirroredImage.objects.filter(blob__isnull=False).select_related('blob')
+        .order_by('-last_access', '-mirror_id')
+    )
+    for record in records:
+        used += record.blob.size
+        if used > disk_budget():
+            evict(record)
+            evicted += 1
+    return evicted
+
+
+def refresh(record):
+    """下载或重新验证一个镜像"""
+    now = timezone.now()
+    try:
+        result = download(record)
+    except MirrorError as e:
+        # 重新验证失败时继续使用已有的镜像
+        record.status = 'cached' if record.blob_id else 'failed'
+        record.error = str(e)[:255]
+        record.fetched_time = now
+        record.save(update_fields=['status', 'error', 'fetched_time'])
+        return record
+
+    if result is not None:
+        file, record.etag, record.last_modified = result
+        with file:
+            record.blob = blobs.store(file)
+    record.status = 'cached'
+    record.error = ''
+    record.fetched_time = now
+    record.save()
+    link(record)
+    enforce_budget()
+    return record
+
+
+def visit(url, force=False):
+    """
+    记录一次访问；还没有镜像、上次下载失败或镜像过期时（重新）下载。
+    force=True 时不管是否过期都重新验证。
+    """
+    record, _ = MirroredImage.objects.get_or_create(url_hash=url_hash(url), defaults={'url': url})
+    now = timezone.now()
+    MirroredImage.objects.filter(pk=record.pk).update(last_access=now)
+    record.last_access = now
+
+    fresh = record.fetched_time is not None and now - record.fetched_time < revalidate_after()
+    if fresh and not force and (record.blob_id is not None or record.status == 'failed'):
+        # 下载失败的 URL 也等到过期后再重试
+        link(record)
+        return record
+    return refresh(record)
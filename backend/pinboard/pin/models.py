@@ -1,17 +1,33 @@
+import os
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser # Import AbstractUser
 from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
 
 class CustomUser(AbstractUser):
     # AbstractUser 已经包含了 username, email, password, first_name, last_name, is_staff, is_active, date_joined 等字段
     # 你可以在这里添加额外的字段
     profile_info = models.TextField(blank=True, null=True, verbose_name="个人简介")
+    # 冗余计数，由 pin/counters.py 在写入时用 F() 原子更新
+    board_count = models.PositiveIntegerField(default=0)
+    pin_count = models.PositiveIntegerField(default=0)
     # 如果需要，你还可以添加其他字段，比如头像等
     # profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
 
     def __str__(self):
         return self.username
 
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # 认证缓存给出的 request.user 只加载了几个字段（pin/auth.py），读到一个延迟字段时
+        # 把其余延迟字段一起读出来，序列化整个用户只查一次
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
 class FriendshipRequest(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -25,6 +41,13 @@ class FriendshipRequest(models.Model):
     request_time = models.DateTimeField(auto_now_add=True)
     response_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # 收到 / 发出的待处理请求
+            models.Index(fields=['receiver', 'status'], name='friendreq_receiver_status_idx'),
+            models.Index(fields=['sender', 'status'], name='friendreq_sender_status_idx'),
+        ]
+
     def __str__(self):
         return f"Request from {self.sender.username} to {self.receiver.username} ({self.status})"
 
@@ -39,9 +62,15 @@ class Friendship(models.Model):
 
     class Meta:
         unique_together = ('user1', 'user2') # Enforces that a pair of users is unique
-        # Consider adding a constraint to ensure user1_id < user2_id to avoid duplicate pairs
-        # e.g. (1,2) and (2,1) representing the same friendship.
-        # This can be done at the database level or in the save method.
+        constraints = [
+            # 每对好友只存一行：(1,2) 和 (2,1) 是同一个好友关系，统一存成 user1 < user2
+            models.CheckConstraint(condition=models.Q(user1__lt=models.F('user2')), name='friendship_ordered_pair'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.user1_id is not None and self.user2_id is not None and self.user1_id > self.user2_id:
+            self.user1_id, self.user2_id = self.user2_id, self.user1_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Friendship between {self.user1.username} and {self.user2.username}"
@@ -53,24 +82,168 @@ class Board(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='boards', on_delete=models.CASCADE) # [cite: 8]
     allow_friends_comment = models.BooleanField(default=True) # [cite: 24]
     create_time = models.DateTimeField(auto_now_add=True)
+    # 被大量关注流关注的 Board 不做写扩散，读关注流时再实时合并它的 Pin
+    fanout_on_read = models.BooleanField(default=False)
+    # 冗余计数，由 pin/counters.py 维护，Board 列表的摘要直接读取
+    pin_count = models.PositiveIntegerField(default=0)
+    # 版本戳：Board 详情里的 Pin、评论变化时由 pin/conditional.py 递增，用来生成 ETag（点赞见 likes_version）
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return self.board_name
 
+def blob_upload_to(instance, filename):
+    # 按内容摘要分目录存放：pictures/ab/cd/abcd....jpg
+    ext = os.path.splitext(filename)[1].lower()
+    digest = instance.digest
+    return f'pictures/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+class ImageBlob(models.Model):
+    """
+    按内容（SHA-256）去重后的上传文件。字节相同的图片共用一个文件和一套派生尺寸，
+    ref_count 是引用它的 Picture 数量，归零后文件被删除（见 pin/blobs.py）
+    """
+    blob_id = models.AutoField(primary_key=True)
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.ImageField(upload_to=blob_upload_to)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.digest[:12]} ({self.ref_count} refs)"
+
 class Picture(models.Model):
     picture_id = models.AutoField(primary_key=True)
     # Instead of blob_data, we use ImageField to store the image file.
     # 'upload_to' specifies a subdirectory within MEDIA_ROOT.
     image_file = models.ImageField(upload_to='pictures/') # Stores path to image
     # url can be derived from image_file.url attribute at runtime, or store external URL if applicable
-    external_url = models.URLField(blank=True, null=True) # If picture is from the web [cite: 3, 29]
+    external_url = models.URLField(blank=True, null=True, db_index=True) # If picture is from the web [cite: 3, 29]
     tags = models.CharField(max_length=255, blank=True, null=True) # [cite: 29]
     uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='uploaded_pictures', on_delete=models.CASCADE)
     upload_time = models.DateTimeField(auto_now_add=True)
+    # 上传文件实际存放的去重 blob，image_file 与 blob.file 指向同一个文件；外部 URL 图片为空
+    blob = models.ForeignKey(ImageBlob, related_name='pictures', null=True, blank=True, on_delete=models.PROTECT)
+
+    class Meta:
+        indexes = [
+            # 图片列表和标签搜索按上传时间倒序
+            models.Index(fields=['-upload_time', '-picture_id'], name='picture_upload_time_idx'),
+        ]
 
     def __str__(self):
         return f"Picture {self.picture_id} by {self.uploaded_by.username}"
 
+class MirroredImage(models.Model):
+    """
+    external_url 图片的本地镜像（见 pin/mirror.py）。按 URL 记录一次下载的结果，
+    下载到的内容存成 ImageBlob，引用这个 URL 的 Picture 都指向它
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('cached', 'Cached'),
+        ('failed', 'Failed'),
+        ('evicted', 'Evicted'),
+    ]
+    mirror_id = models.AutoField(primary_key=True)
+    # URL 可能很长，唯一索引建在它的 SHA-256 上
+    url_hash = models.CharField(max_length=64, unique=True)
+    url = models.URLField(max_length=2048)
+    blob = models.ForeignKey(ImageBlob, related_name='mirrors', null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # 源站的缓存校验头，重新验证时用条件请求
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    fetched_time = models.DateTimeField(null=True, blank=True)
+    # 最近一次被访问的时间，超出磁盘预算时按它淘汰（LRU）
+    last_access = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Mirror of {self.url} ({self.status})"
+
+class PictureVariant(models.Model):
+    """上传图片的缩略图 / 响应式尺寸版本，由 pin/imaging.py 异步生成，同一内容的图片共用"""
+    FORMAT_CHOICES = [
+        ('jpeg', 'JPEG'),
+        ('webp', 'WebP'),
+    ]
+    blob = models.ForeignKey(ImageBlob, related_name='variants', on_delete=models.CASCADE)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    image_file = models.ImageField(upload_to='pictures/variants/')
+
+    class Meta:
+        unique_together = ('blob', 'width', 'format')
+
+    def __str__(self):
+        return f"Blob {self.blob_id} {self.width}w {self.format}"
+
+class UploadSession(models.Model):
+    """
+    分块上传一张图片（见 pin/uploads.py）：客户端按偏移量逐块 PUT，received 是已经写入的字节数，
+    断线后从这里继续；finalize 之后 picture 指向创建出的图片，重复 finalize 返回同一张
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('finalizing', 'Finalizing'),
+        ('complete', 'Complete'),
+    ]
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='upload_sessions', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    tags = models.CharField(max_length=255, blank=True, null=True)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    # 收到文件头后嗅探出的格式和尺寸
+    format = models.CharField(max_length=10, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    picture = models.ForeignKey(Picture, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    created_time = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} by {self.user_id} ({self.received}/{self.size})"
+
+class Tag(models.Model):
+    tag_id = models.AutoField(primary_key=True)
+    # 规范化后的标签（小写、去掉首尾空白），唯一索引同时用作前缀查询
+    name = models.CharField(max_length=64, unique=True)
+    # 使用该标签的图片数量，由 pin/counters.py 维护
+    usage_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+class PictureTag(models.Model):
+    # 标签 → 图片的倒排索引：唯一索引 (tag, picture) 让按标签查图片走索引
+    picture = models.ForeignKey(Picture, related_name='picture_tags', on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, related_name='picture_tags', on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('tag', 'picture')
+
+    def __str__(self):
+        return f"Picture {self.picture_id} tagged {self.tag_id}"
+
+class PinQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        预先加载序列化 Pin 时用到的关联对象，避免 PinSerializer 对每个 Pin 单独发查询
+        （点赞数直接读原始 Pin 上的 like_count 计数列）
+        """
+        return (
+            self.select_related('user', 'picture__uploaded_by', 'picture__blob', 'origin_pin__user')
+            .prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.select_related('user')),
+                'picture__blob__variants',
+            )
+        )
+
 class Pin(models.Model):
     pin_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255, blank=True, null=True)
@@ -82,7 +255,29 @@ class Pin(models.Model):
     
     # 新增字段: 如果为None表示这是原创Pin，否则表示这是一个Repin
     origin_pin = models.ForeignKey('self', related_name='repins', on_delete=models.CASCADE, null=True, blank=True)
-    
+
+    # 冗余计数，由 pin/counters.py 在写入时用 F() 原子更新，排序时可以直接走索引
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    repin_count = models.PositiveIntegerField(default=0)
+    # 评论的版本戳，get-comments 用它生成 ETag（见 pin/conditional.py）
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    objects = PinQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # 游标分页按 (timestamp, pin_id) 倒序定位，需要对应的复合索引
+            models.Index(fields=['-timestamp', '-pin_id'], name='pin_timestamp_id_idx'),
+            models.Index(fields=['board', '-timestamp', '-pin_id'], name='pin_board_timestamp_idx'),
+            models.Index(fields=['user', '-timestamp', '-pin_id'], name='pin_user_timestamp_idx'),
+            # 搜索结果按计数排序
+            models.Index(fields=['-like_count', '-pin_id'], name='pin_like_count_idx'),
+            models.Index(fields=['-comment_count', '-pin_id'], name='pin_comment_count_idx'),
+            models.Index(fields=['-repin_count', '-pin_id'], name='pin_repin_count_idx'),
+        ]
+
     @property
     def is_repin(self):
         return self.origin_pin is not None
@@ -107,10 +302,34 @@ class FollowStream(models.Model):
     # The FollowStreamBoard table is a many-to-many relationship.
     # We can define it using ManyToManyField in Django.
     boards = models.ManyToManyField(Board, related_name='followed_by_streams') # [cite: 13]
+    # 版本戳：关注的 Board 有变化或关注列表变化时递增（见 pin/conditional.py）
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.stream_name} by {self.user.username}"
 
+class FollowStreamEntry(models.Model):
+    """
+    关注流的预计算时间线（写扩散）：Pin 创建时写入所有关注它所在 Board 的流，
+    读关注流时按 (timestamp, pin_id) 直接从这张表分页，不再扫描所有 Board 的 Pin
+    """
+    stream = models.ForeignKey(FollowStream, related_name='entries', on_delete=models.CASCADE)
+    pin = models.ForeignKey(Pin, related_name='stream_entries', on_delete=models.CASCADE)
+    # 冗余 Pin 的 board 和 timestamp，移除 Board 和按时间分页都不需要再关联 Pin 表
+    board = models.ForeignKey(Board, related_name='stream_entries', on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('stream', 'pin')
+        indexes = [
+            models.Index(fields=['stream', '-timestamp', '-pin'], name='entry_stream_timestamp_idx'),
+            models.Index(fields=['stream', 'board'], name='entry_stream_board_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pin {self.pin_id} in stream {self.stream_id}"
+
 class Like(models.Model):
     # user_id and pin_id are the primary key according to your schema.
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='likes_given', on_delete=models.CASCADE)
@@ -133,5 +352,11 @@ class Comment(models.Model):
     # 只需要一个 pin 外键，不再需要分开 pin 和 repin
     pin = models.ForeignKey(Pin, related_name='comments', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Pin 的评论按时间倒序
+            models.Index(fields=['pin', '-timestamp'], name='comment_pin_timestamp_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.user.username} on Pin {self.pin.pin_id}"
\ No newline at end of file
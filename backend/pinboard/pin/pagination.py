@@ -0,0 +1,204 @@
+"""
+基于游标的 keyset 分页
+
+OFFSET 分页越往后越慢，并且在有新 Pin 插入时会跳过或重复数据。
+这里用排序键（默认 (timestamp, pin_id)）的最后一个值作为游标，
+下一页直接用 WHERE 条件从索引上定位，所以翻到多深代价都一样。
+
+为了兼容现有前端（直接把 response.data 当作数组使用），响应体仍然是列表，
+下一页的游标放在 `Link` 和 `X-Next-Cursor` 响应头里。
+"""
+import base64
+import datetime
+import functools
+import json
+from types import SimpleNamespace
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import async_db
+
+# 各类列表的默认排序键，最后一个字段必须唯一，保证游标位置是确定的
+PIN_ORDERING = ('-timestamp', '-pin_id')
+BOARD_ORDERING = ('-create_time', '-board_id')
+USER_ORDERING = ('username', 'id')
+
+
+class KeysetPagination(BasePagination):
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    # 前端一直使用 limit 参数指定每页数量
+    page_size_query_param = 'limit'
+    ordering = PIN_ORDERING
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, values):
+        # 时间保留完整的微秒精度，否则相同毫秒内的 Pin 会被跳过
+        values = [{'dt': value.isoformat()} if isinstance(value, datetime.datetime) else value for value in values]
+        raw = json.dumps(values, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        position = []
+        for value in values:
+            if isinstance(value, dict):
+                value = parse_datetime(value.get('dt') or '')
+                if value is None:
+                    raise NotFound(self.invalid_cursor_message)
+            position.append(value)
+        return position
+
+    def keyset_filter(self, position):
+        """
+        构造 "排在 position 之后" 的条件，例如排序 (-timestamp, -pin_id) 时：
+        timestamp < t OR (timestamp = t AND pin_id < id)
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def _field_value(obj, field):
+        return getattr(obj, field.lstrip('-'))
+
+    def _compare(self, a, b):
+        for field in self.ordering:
+            x, y = self._field_value(a, field), self._field_value(b, field)
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if field.startswith('-') else result
+        return 0
+
+    def _page_queryset(self, queryset, position, size):
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+        # 多取一条用来判断是否还有下一页
+        return queryset[:size + 1]
+
+    def _slice(self, queryset, position, size):
+        return list(self._page_queryset(queryset, position, size))
+
+    async def _aslice(self, queryset, position, size):
+        return await async_db.run(self._slice, queryset, position, size)
+
+    def _finish_page(self, results, size):
+        self.has_next = len(results) > size
+        results = results[:size]
+        self.next_position = None
+        if self.has_next and results:
+            self.next_position = [self._field_value(results[-1], field) for field in self.ordering]
+        return results
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        return self._finish_page(self._slice(queryset, position, size), size)
+
+    def paginate_merged(self, querysets, request):
+        """
+        对多个排序键相同的 queryset 做归并分页（例如关注流里预计算的时间线
+        和热门 Board 的实时查询），每个来源最多取一页再在内存里合并
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        results = []
+        for queryset in querysets:
+            results.extend(self._slice(queryset, position, size))
+        results.sort(key=functools.cmp_to_key(self._compare))
+        return self._finish_page(results, size)
+
+    # 异步视图（pin/async_views.py）使用的版本，查询在线程池里执行（见 pin/async_db.py）
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        return self._finish_page(await self._aslice(queryset, position, size), size)
+
+    async def apaginate_merged(self, querysets, request):
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        pages = await async_db.gather(*((self._slice, queryset, position, size) for queryset in querysets))
+        results = [obj for page in pages for obj in page]
+        results.sort(key=functools.cmp_to_key(self._compare))
+        return self._finish_page(results, size)
+
+    def paginate_list(self, items, request):
+        """
+        对已经按 ordering 排好序的内存列表分页（例如缓存的推荐结果），
+        游标格式和 queryset 分页相同
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+        if position is not None:
+            marker = SimpleNamespace(**{field.lstrip('-'): value for field, value in zip(self.ordering, position)})
+            items = [item for item in items if self._compare(item, marker) > 0]
+        return self._finish_page(list(items[:size + 1]), size)
+
+    def get_next_cursor(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_cursor_headers(self):
+        headers = {}
+        cursor = self.get_next_cursor()
+        if cursor is not None:
+            headers['Link'] = f'<{self.get_next_link()}>; rel="next"'
+            headers['X-Next-Cursor'] = cursor
+        return headers
+
+    def get_paginated_response(self, data):
+        return Response(data, headers=self.get_cursor_headers())
+
+    def get_paginated_response_schema(self, schema):
+        return schema
+
+
+class PinCursorPagination(KeysetPagination):
+    ordering = PIN_ORDERING
@@ -0,0 +1,302 @@
+"""
+按接口统计 SQL 和序列化开销（PINBOARD_PROFILING 打开时生效）
+
+ProfilingMiddleware 对每个请求记录：查询条数、数据库总耗时、DRF 序列化（serializer.data）耗时、
+总耗时和响应大小。结果：
+
+- 写进响应的 Server-Timing 头（浏览器开发者工具的 Timing 面板可以直接看到）：
+  `db;dur=3.1;desc="4 queries", serialize;dur=1.2, total;dur=9.8`
+- 按接口（请求方法 + URL 名，例如 `GET pin-list`、`POST pin-like`）累积到进程内的滚动窗口，
+  每个接口保留最近 PINBOARD_PROFILING_WINDOW 个请求
+- 每 PINBOARD_PROFILING_FLUSH_INTERVAL 秒把本进程的窗口写到 PINBOARD_PROFILING_DIR 下的
+  `<主机名>-<pid>.json`，`python manage.py profiling_report` 合并所有进程的文件，
+  列出最慢和查询最多的接口
+
+查询通过每个数据库连接上的 execute_wrapper 计数（异步视图在线程池里执行的查询也算在发起它的
+请求上，contextvars 会带到线程里，所以同一个记录可能被几个线程同时更新，更新时持有记录的锁）。
+wrapper 和 serializer.data 的计时在第一个被记录的请求时才装上，PINBOARD_PROFILING 关闭的进程
+不受影响；装上之后没有正在记录的请求时只多一次 ContextVar 读取。记录本身是几次 perf_counter
+和一次 deque.append，可以在生产环境常开。
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的记录；没有在记录时为 None
+_current = contextvars.ContextVar('pinboard_profiling', default=None)
+_lock = threading.Lock()
+# 接口 -> [累计请求数, deque((总耗时, 数据库耗时, 查询条数, 序列化耗时, 响应字节数), ...)]，耗时单位毫秒
+_endpoints = {}
+_next_flush = 0.0
+_installed = False
+
+
+def enabled():
+    return getattr(settings, 'PINBOARD_PROFILING', False)
+
+
+def window():
+    return getattr(settings, 'PINBOARD_PROFILING_WINDOW', 500)
+
+
+def flush_interval():
+    return getattr(settings, 'PINBOARD_PROFILING_FLUSH_INTERVAL', 10)
+
+
+def profiling_dir():
+    return getattr(settings, 'PINBOARD_PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiling'))
+
+
+class Record:
+    __slots__ = ('queries', 'db', 'serialize', 'depth', 'lock')
+
+    def __init__(self):
+        # 异步视图的查询在线程池的几个线程里同时计数
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        # 嵌套的 serializer.data（ListSerializer 调用父类）只计一次
+        self.depth = 0
+
+
+# --- 采集 -------------------------------------------------------------------
+
+def _count_query(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with record.lock:
+            record.db += elapsed
+            record.queries += 1
+
+
+def _connection_created(sender, connection, **kwargs):
+    # 连接关闭后重新打开时同一个 DatabaseWrapper 会再次触发
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def _timed(prop):
+    getter = prop.fget
+
+    @functools.wraps(getter)
+    def data(self):
+        record = _current.get()
+        if record is None:
+            return getter(self)
+        with record.lock:
+            outermost = not record.depth
+            record.depth += 1
+        started = time.perf_counter()
+        try:
+            return getter(self)
+        finally:
+            elapsed = time.perf_counter() - started
+            with record.lock:
+                record.depth -= 1
+                if outermost:
+                    record.serialize += elapsed
+
+    return property(data)
+
+
+def install():
+    """
+    中间件记录请求前调用：第一次时给之后打开的数据库连接装上计数 wrapper、给 serializer.data 计时，
+    每次都给当前线程已经打开的连接补上 wrapper（装上之前打开的持久连接）
+    """
+    global _installed
+    if not _installed:
+        with _lock:
+            if not _installed:
+                connection_created.connect(_connection_created)
+                serializers.Serializer.data = _timed(serializers.Serializer.data)
+                serializers.ListSerializer.data = _timed(serializers.ListSerializer.data)
+                atexit.register(flush)
+                _installed = True
+    for connection in connections.all(initialized_only=True):
+        _connection_created(None, connection)
+
+
+def endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.view_name if match else '<unresolved>'}"
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+def server_timing(record, total):
+    return (
+        f'db;dur={record.db * 1000:.1f};desc="{record.queries} queries", '
+        f'serialize;dur={record.serialize * 1000:.1f}, total;dur={total * 1000:.1f}'
+    )
+
+
+def observe(key, total, record, size):
+    global _next_flush
+    sample = (round(total * 1000, 2), round(record.db * 1000, 2), record.queries, round(record.serialize * 1000, 2), size)
+    with _lock:
+        entry = _endpoints.get(key)
+        if entry is None:
+            entry = _endpoints[key] = [0, deque(maxlen=window())]
+        entry[0] += 1
+        entry[1].append(sample)
+        # 第一个请求只定下第一次写文件的时间
+        now = time.monotonic()
+        due = now >= _next_flush > 0
+        if due or not _next_flush:
+            _next_flush = now + flush_interval()
+    if due:
+        try:
+            flush()
+        except OSError:
+            # 统计写不出去不能影响请求本身
+            logger.exception("Failed to write profiling data")
+
+
+class ProfilingMiddleware:
+    """放在 MIDDLEWARE 的最前面，总耗时包含其他中间件"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not enabled():
+            return self.get_response(request)
+        install()
+        record, started = Record(), time.perf_counter()
+        token = _current.set(record)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, record, started)
+
+    async def __acall__(self, request):
+        if not enabled():
+            return await self.get_response(request)
+        install()
+        record, started = Record(), time.perf_counter()
+        token = _current.set(record)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, record, started)
+
+    def _finish(self, request, response, record, started):
+        total = time.perf_counter() - started
+        response['Server-Timing'] = server_timing(record, total)
+        observe(endpoint(request), total, record, response_size(response))
+        return response
+
+
+# --- 汇总 -------------------------------------------------------------------
+
+def snapshot():
+    """本进程的窗口：{接口: {'count': 累计请求数, 'samples': [[总耗时, 数据库耗时, 查询数, 序列化耗时, 字节数], ...]}}"""
+    with _lock:
+        return {key: {'count': count, 'samples': [list(s) for s in samples]} for key, (count, samples) in _endpoints.items()}
+
+
+def reset():
+    global _next_flush
+    with _lock:
+        _endpoints.clear()
+        _next_flush = 0.0
+
+
+def flush():
+    """把本进程的窗口写到 PINBOARD_PROFILING_DIR（先写临时文件再改名，读的一方不会读到半个文件）"""
+    endpoints = snapshot()
+    if not endpoints:
+        return
+    directory = profiling_dir()
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, f'{socket.gethostname()}-{os.getpid()}.json')
+    temporary = f'{filename}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump({'pid': os.getpid(), 'written': time.time(), 'endpoints': endpoints}, file)
+    os.replace(temporary, filename)
+
+
+def load(directory=None, max_age=None):
+    """合并目录下所有进程写出的窗口，max_age 秒之前写的文件（已经退出的进程）跳过"""
+    directory = directory or profiling_dir()
+    merged = {}
+    if not os.path.isdir(directory):
+        return merged
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(directory, name)) as file:
+            written = json.load(file)
+        if max_age is not None and written['written'] < time.time() - max_age:
+            continue
+        for key, data in written['endpoints'].items():
+            entry = merged.setdefault(key, {'count': 0, 'samples': []})
+            entry['count'] += data['count']
+            entry['samples'].extend(data['samples'])
+    return merged
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(endpoints):
+    """每个接口一行统计，耗时单位毫秒"""
+    rows = []
+    for key, data in endpoints.items():
+        samples = data['samples']
+        if not samples:
+            continue
+        totals, dbs, queries, serialize, sizes = zip(*samples)
+        n = len(samples)
+        rows.append({
+            'endpoint': key,
+            'count': data['count'],
+            'window': n,
+            'p50_ms': _percentile(totals, 0.5),
+            'p95_ms': _percentile(totals, 0.95),
+            'max_ms': max(totals),
+            'db_ms': round(sum(dbs) / n, 2),
+            'queries': round(sum(queries) / n, 1),
+            'max_queries': max(queries),
+            'serialize_ms': round(sum(serialize) / n, 2),
+            'bytes': round(sum(sizes) / n),
+        })
+    return rows
@@ -0,0 +1,143 @@
+"""
+读多写少接口的响应缓存（Board 详情、Pin 详情、按用户名查用户）
+
+缓存的是所有用户共享的响应体，is_liked / is_friend 这类和当前用户相关的字段
+每次读取时再批量查询填回（compose），所以缓存不会按用户拆分。
+
+失效方式是依赖版本号：响应体里出现的每个对象（pin / board / picture / user）
+在缓存里都有一个版本号，缓存的响应体同时记下渲染时这些版本号的值；读取时
+只要有一个对象的版本号变了就重新渲染。pin/signals.py 在 Pin、Like、Comment、
+Board、Picture、CustomUser 写入时删除对应对象的版本号，所以一次写入只让
+真正包含这个对象的响应失效，不需要知道它被哪些 Board / Pin 引用。写入在事务里时，
+提交后再删除一次版本号，提交前并发读取缓存的旧响应体不会一直留到过期。
+
+使用 Django 缓存框架（PINBOARD_RESPONSE_CACHE_ALIAS），默认是进程内的 locmem；
+多进程部署时换成 FileBasedCache 或其他共享后端，否则失效只对当前进程可见。
+PINBOARD_RESPONSE_CACHE_TIMEOUT 是兜底的过期时间。
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .batching import prime_liked, prime_user_stats
+
+KEY_PREFIX = 'pinboard:response'
+
+# 响应体里的对象 → 版本号的类型：(类型, 主键字段, 用来识别的另一个字段)
+DEPENDENCY_FIELDS = [
+    ('pin', 'pin_id', 'pin_id'),
+    ('board', 'board_id', 'board_name'),
+    ('picture', 'picture_id', 'picture_id'),
+    ('user', 'id', 'username'),
+]
+
+
+def enabled():
+    return getattr(settings, 'PINBOARD_RESPONSE_CACHE', True)
+
+
+def timeout():
+    return getattr(settings, 'PINBOARD_RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def _cache():
+    return caches[getattr(settings, 'PINBOARD_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(kind, pk):
+    return f'{KEY_PREFIX}:version:{kind}:{pk}'
+
+
+def _walk(node, visit):
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, visit)
+    elif isinstance(node, dict):
+        visit(node)
+        for value in node.values():
+            _walk(value, visit)
+
+
+def dependencies(data):
+    """响应体里出现的所有对象，例如 {'pin:3', 'user:7'}"""
+    found = set()
+
+    def visit(node):
+        for kind, pk_field, marker in DEPENDENCY_FIELDS:
+            if pk_field in node and marker in node:
+                found.add(f'{kind}:{node[pk_field]}')
+
+    _walk(data, visit)
+    return found
+
+
+def _versions(cache, deps):
+    """读取这些对象的版本号，没有的生成一个新的"""
+    keys = {dep: _version_key(*dep.split(':', 1)) for dep in deps}
+    current = cache.get_many(list(keys.values()))
+    versions = {}
+    for dep, key in keys.items():
+        if key not in current:
+            # 版本号本身不过期；被淘汰了也只是让依赖它的响应重新渲染
+            cache.add(key, uuid.uuid4().hex[:12], None)
+            current[key] = cache.get(key)
+        versions[dep] = current[key]
+    return versions
+
+
+def _delete_versions(keys):
+    _cache().delete_many(keys)
+
+
+def invalidate(kind, pks):
+    """这些对象变化了，包含它们的缓存响应全部失效"""
+    keys = [_version_key(kind, pk) for pk in pks if pk is not None]
+    if keys:
+        _delete_versions(keys)
+        # 在事务里调用时，提交前并发的读取可能又按旧的行渲染、缓存了响应，提交后再失效一次
+        transaction.on_commit(lambda: _delete_versions(keys))
+
+
+def compose(data, request):
+    """把和当前用户相关的字段填回共享的响应体，整个响应两次查询"""
+    pins, users = [], []
+
+    def visit(node):
+        if 'is_liked' in node and 'pin_id' in node:
+            pins.append(node)
+        if 'is_friend' in node and 'id' in node:
+            users.append(node)
+
+    _walk(data, visit)
+    context = {'request': request}
+    if pins:
+        liked = prime_liked(context, {pin['origin_pin'] or pin['pin_id'] for pin in pins})
+        for pin in pins:
+            pin['is_liked'] = liked[pin['origin_pin'] or pin['pin_id']]
+    if users:
+        stats = prime_user_stats(context, {user['id'] for user in users})
+        for user in users:
+            user['is_friend'] = stats[user['id']]['is_friend']
+    return data
+
+
+def cached_response(kind, key, request, render):
+    """
+    返回 kind/key 对应的响应体，缓存失效时调用 render() 重新渲染。
+    缓存键包含 scheme 和 host，因为响应体里的图片地址是绝对 URL。
+    """
+    if not enabled():
+        return render()
+    cache = _cache()
+    body_key = f'{KEY_PREFIX}:{kind}:{key}:{request.scheme}://{request.get_host()}'
+    entry = cache.get(body_key)
+    if entry is not None:
+        versions, data = entry
+        if _versions(cache, versions) == versions:
+            return compose(data, request)
+
+    data = render()
+    cache.set(body_key, (_versions(cache, dependencies(data)), data), timeout())
+    return compose(data, request)
@@ -0,0 +1,203 @@
+"""
+全文搜索索引
+
+SQLite 上使用 FTS5 虚拟表做倒排索引（表由 0011 迁移创建），支持前缀匹配和
+bm25 相关度排序；索引由 pin/signals.py 在 Pin / Picture / Board / CustomUser
+写入时增量更新，`python manage.py rebuild_search_index` 可以整体重建。
+
+PostgreSQL 上退回到 icontains，由 0019 迁移创建的 pg_trgm 三元组 GIN 索引加速
+（UPPER(col) LIKE UPPER('%词%') 可以走索引），sort_by=relevance 按 similarity() 排序。
+其他数据库或 SQLite 没有编译 FTS5 时同样退回到 icontains，这时 sort_by=relevance 按时间排序。
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Board, CustomUser, Picture, Pin
+
+# 每批写入索引的行数
+BATCH_SIZE = 500
+
+_available = {}
+
+
+class SearchIndex:
+    def __init__(self, table, model, columns, fallback_lookups, document, related=()):
+        self.table = table
+        self.model = model
+        self.columns = columns
+        # 生成文档需要的关联对象，重建索引时 select_related
+        self.related = related
+        # 没有 FTS5 时每个列对应的 icontains 查询字段
+        self.fallback_lookups = fallback_lookups
+        self.document = document
+
+    # --- 写索引 -------------------------------------------------------------
+
+    def create_sql(self):
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            f"{', '.join(self.columns)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def index(self, objects):
+        """插入或替换这些对象的索引文档"""
+        if not fts_available():
+            return
+        rows = [(obj.pk, *[value or '' for value in self.document(obj)]) for obj in objects]
+        if not rows:
+            return
+        placeholders = ', '.join(['%s'] * (len(self.columns) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) VALUES ({placeholders})", rows
+            )
+
+    def remove(self, pks):
+        if not fts_available() or not pks:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in pks])
+
+    def rebuild(self):
+        """建表（如果不存在）、清空后按批重新写入全部文档，返回写入的数量"""
+        with connection.cursor() as cursor:
+            cursor.execute(self.create_sql())
+            cursor.execute(f"DELETE FROM {self.table}")
+        reset_availability()
+        queryset = self.model.objects.select_related(*self.related).order_by()
+        total, batch = 0, []
+        for obj in queryset.iterator(chunk_size=BATCH_SIZE):
+            batch.append(obj)
+            if len(batch) >= BATCH_SIZE:
+                self.index(batch)
+                total, batch = total + len(batch), []
+        self.index(batch)
+        return total + len(batch)
+
+    # --- 查询 ---------------------------------------------------------------
+
+    def _match(self, query, columns):
+        match = build_match_query(query)
+        if match and columns:
+            match = f"{{{' '.join(columns)}}} : ({match})"
+        return match
+
+    def _pk_column(self):
+        return f'"{self.model._meta.db_table}"."{self.model._meta.pk.column}"'
+
+    def filter(self, queryset, query, columns=None):
+        """按关键字过滤 queryset；columns 限定只匹配某些列（例如只搜 tags）"""
+        columns = columns or self.columns
+        if not fts_available():
+            condition = Q()
+            for column in columns:
+                condition |= Q(**{f'{self.fallback_lookups[column]}__icontains': query})
+            return queryset.filter(condition).distinct()
+        match = self._match(query, columns)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [match])
+        )
+
+    def annotate_relevance(self, queryset, query, columns=None):
+        """
+        附加 relevance 注解（越小越相关：bm25，PostgreSQL 上是负的三元组相似度），
+        两者都不可用时返回 None，调用方应退回到默认排序
+        """
+        if trigram_available():
+            return self._annotate_similarity(queryset, query, columns or self.columns)
+        if not fts_available():
+            return None
+        match = self._match(query, columns or self.columns)
+        if not match:
+            return None
+        return queryset.annotate(relevance=RawSQL(
+            f"SELECT bm25({self.table}) FROM {self.table} "
+            f"WHERE {self.table} MATCH %s AND {self.table}.rowid = {self._pk_column()}",
+            [match],
+        ))
+
+    def _annotate_similarity(self, queryset, query, columns):
+        scores = [
+            Func(Coalesce(F(self.fallback_lookups[column]), Value('')), Value(query), function='similarity', output_field=FloatField())
+            for column in columns
+        ]
+        score = Greatest(*scores) if len(scores) > 1 else scores[0]
+        return queryset.annotate(relevance=score * -1)
+
+
+def build_match_query(query):
+    """
+    把用户输入转换成安全的 FTS5 查询：每个词都做前缀匹配，多个词之间是 AND。
+    用户输入里的 FTS5 语法字符（引号、括号、*、:）都会被丢弃。
+    """
+    tokens = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def fts_available():
+    """当前数据库是否可以使用 FTS5 索引（结果按数据库缓存）"""
+    if getattr(settings, 'PINBOARD_SEARCH_BACKEND', 'fts5') != 'fts5' or connection.vendor != 'sqlite':
+        return False
+    key = connection.settings_dict['NAME']
+    if key not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", [PIN_INDEX.table]
+            )
+            _available[key] = cursor.fetchone()[0] > 0
+    return _available[key]
+
+
+def trigram_available():
+    """当前数据库是否是装了 pg_trgm 扩展的 PostgreSQL（结果按数据库缓存）"""
+    if connection.vendor != 'postgresql':
+        return False
+    key = ('pg_trgm', connection.settings_dict['NAME'])
+    if key not in _available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_extension WHERE extname = 'pg_trgm'")
+            _available[key] = cursor.fetchone()[0] > 0
+    return _available[key]
+
+
+def reset_availability():
+    _available.clear()
+
+
+PIN_INDEX = SearchIndex(
+    table='pin_search_pin', model=Pin, columns=('title', 'tags'),
+    fallback_lookups={'title': 'title', 'tags': 'picture__tags'},
+    document=lambda pin: (pin.title, pin.picture.tags),
+    related=('picture',),
+)
+PICTURE_INDEX = SearchIndex(
+    table='pin_search_picture', model=Picture, columns=('tags',),
+    fallback_lookups={'tags': 'tags'},
+    document=lambda picture: (picture.tags,),
+)
+BOARD_INDEX = SearchIndex(
+    table='pin_search_board', model=Board, columns=('board_name', 'descriptor'),
+    fallback_lookups={'board_name': 'board_name', 'descriptor': 'descriptor'},
+    document=lambda board: (board.board_name, board.descriptor),
+)
+USER_INDEX = SearchIndex(
+    table='pin_search_user', model=CustomUser, columns=('username',),
+    fallback_lookups={'username': 'username'},
+    document=lambda user: (user.username,),
+)
+
+INDEXES = [PIN_INDEX, PICTURE_INDEX, BOARD_INDEX, USER_INDEX]
+
+
+def reindex_picture(picture):
+    """图片的 tags 变化时，引用它的 Pin 文档也要更新"""
+    PICTURE_INDEX.index([picture])
+    PIN_INDEX.index(Pin.objects.filter(picture=picture).select_related('picture'))
@@ -2,15 +2,42 @@ from rest_framework import serializers, viewsets
 from django.contrib.auth.models import User # Assuming default user
 from .models import (
     CustomUser, FriendshipRequest, Friendship, Board, Picture,
-    Pin, FollowStream, Like, Comment
+    Pin, FollowStream, Like, Comment, Tag, UploadSession
 )
 from django.db.models import Q
+from . import like_buffer, media, mirror
+from .imaging import srcset
+from .batching import (
+    like_target, like_target_id, prime_board_covers, prime_pins, prime_user_stats, serialization_cache, user_stats
+)
+
+
+class SparseFieldsMixin:
+    """
+    支持只返回部分字段：序列化器接受 fields=[...]（来自 ?fields=a,b 查询参数），
+    不认识的字段名直接忽略
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # 先批量计算整页用户的统计信息，再逐个序列化
+        users = list(data.all() if hasattr(data, 'all') else data)
+        prime_user_stats(self.context, [user.pk for user in users])
+        return [self.child.to_representation(user) for user in users]
+
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, min_length=8)
     is_friend = serializers.SerializerMethodField()
-    board_count = serializers.SerializerMethodField()
-    pin_count = serializers.SerializerMethodField()
+    board_count = serializers.IntegerField(read_only=True)
+    pin_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = CustomUser
@@ -18,16 +45,11 @@ class UserSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'password': {'write_only': True},
         }
+        list_serializer_class = UserListSerializer
 
     def get_is_friend(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            # 检查好友关系
-            is_friend = Friendship.objects.filter(
-                (Q(user1=request.user, user2=obj) | Q(user1=obj, user2=request.user))
-            ).exists()
-            return is_friend
-        return False
+        # 好友关系从请求级缓存中读取，列表序列化时已经批量查好
+        return user_stats(self.context, obj)['is_friend']
 
     def create(self, validated_data):
         return CustomUser.objects.create_user(
@@ -36,11 +58,13 @@ class UserSerializer(serializers.ModelSerializer):
             password=validated_data['password'],
             profile_info=validated_data.get('profile_info', '')
         )
-    
-    def get_board_count(self, obj):
-        return Board.objects.filter(owner=obj).count()
-    def get_pin_count(self, obj):
-        return Pin.objects.filter(user=obj).count()
+
+    def update(self, instance, validated_data):
+        # 密码要哈希后保存
+        password = validated_data.pop('password', None)
+        if password is not None:
+            instance.set_password(password)
+        return super().update(instance, validated_data)
 
 
 class FriendshipRequestSerializer(serializers.ModelSerializer):
@@ -66,10 +90,11 @@ class FriendshipSerializer(serializers.ModelSerializer):
 class PictureSerializer(serializers.ModelSerializer):
     uploaded_by = UserSerializer(read_only=True)
     image_url = serializers.SerializerMethodField()  # 使用 SerializerMethodField 动态生成完整 URL
+    srcset = serializers.SerializerMethodField()  # 缩略图 / 响应式尺寸，按格式分组
 
     class Meta:
         model = Picture
-        fields = ['picture_id', 'image_file', 'image_url', 'external_url', 'tags', 'uploaded_by', 'upload_time']
+        fields = ['picture_id', 'image_file', 'image_url', 'srcset', 'external_url', 'tags', 'uploaded_by', 'upload_time']
         read_only_fields = ['uploaded_by', 'upload_time']  # Set by server
         extra_kwargs = {
             'image_file': {'required': False},  # 使图片文件字段为可选
@@ -82,17 +107,24 @@ class PictureSerializer(serializers.ModelSerializer):
         """
         request = self.context.get('request')  # 从上下文中获取 request
 
-        # 如果存在外部URL，直接返回
+        # 如果存在外部URL，直接返回；开启本地镜像后，已经镜像的图片返回本地文件（见 pin/mirror.py）
         if obj.external_url:
-            return obj.external_url
+            mirror.observe(obj)
+            if not mirror.serves_locally(obj):
+                return obj.external_url
 
-        # 否则返回上传的图片文件URL
-        if obj.image_file and request:
-            return request.build_absolute_uri(obj.image_file.url)  # 构建完整的 URL
-        elif obj.image_file:
-            return obj.image_file.url  # 如果没有 request，返回相对路径
+        # 否则返回上传的图片文件URL：去重后的文件按内容摘要命名，地址不变内容就不变，
+        # 可以永久缓存（见 pin/media.py）；没有 request 时返回相对路径，没有图片时返回 None
+        return media.url(obj.image_file, request)
 
-        return None  # 如果没有图片，返回None
+    def get_srcset(self, obj):
+        """
+        {'jpeg': 'url 236w, url 474w, ...', 'webp': ...}；派生尺寸还没生成完时为空，
+        客户端退回到 image_url
+        """
+        if obj.external_url and not mirror.serves_locally(obj):
+            return {}
+        return srcset(obj, self.context.get('request'))
 
 class CommentSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -101,6 +133,14 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user', 'timestamp']
 
+class PinListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # 整页 Pin 一次性预取，查询次数不随 Pin 数量增长
+        pins = list(data.all() if hasattr(data, 'all') else data)
+        prime_pins(self.context, pins)
+        return [self.child.to_representation(pin) for pin in pins]
+
+
 class PinSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     picture = serializers.PrimaryKeyRelatedField(queryset=Picture.objects.all())
@@ -119,18 +159,22 @@ class PinSerializer(serializers.ModelSerializer):
             'title', 'is_liked', 'origin_pin', 'is_repin', 'origin_pin_detail'
         ]
         read_only_fields = ['user', 'timestamp', 'is_repin']
+        list_serializer_class = PinListSerializer
+
+    def to_representation(self, instance):
+        # 单个 Pin 也走批量预取，评论里的用户统计不会逐条查询
+        prime_pins(self.context, [instance])
+        return super().to_representation(instance)
 
     def get_likes_received(self, obj):
-        target_pin = obj.origin_pin if obj.is_repin else obj
-        return target_pin.likes_received.count()
+        # 如果是 repin，返回原始 Pin 的点赞数（计数列），加上还在写缓冲里的点赞
+        if like_buffer.enabled():
+            return max(like_target(obj).like_count + like_buffer.pending_delta(like_target_id(obj)), 0)
+        return like_target(obj).like_count
 
     def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            # 如果是 repin，检查原始 Pin 的点赞情况
-            target_pin = obj.origin_pin if obj.is_repin else obj
-            return Like.objects.filter(user=request.user, pin=target_pin).exists()
-        return False
+        # 如果是 repin，检查原始 Pin 的点赞情况
+        return serialization_cache(self.context)['liked'][like_target_id(obj)]
 
     def get_origin_pin_detail(self, obj):
         """获取原始Pin的详细信息"""
@@ -143,7 +187,7 @@ class PinSerializer(serializers.ModelSerializer):
                 # 如果能够访问，返回详细信息
                 return {
                     'pin_id': origin_pin_id,
-                    'user': UserSerializer(origin_pin_user).data,
+                    'user': UserSerializer(origin_pin_user, context=self.context).data,
                     'title': obj.origin_pin.title,
                     'description': obj.origin_pin.description,
                     'timestamp': obj.origin_pin.timestamp,
@@ -157,29 +201,104 @@ class PinSerializer(serializers.ModelSerializer):
                 return None
         return None
 
-class BoardSerializer(serializers.ModelSerializer):
+class BoardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     pins = PinSerializer(many=True, read_only=True) # Show pins on this board
 
     class Meta:
         model = Board
-        fields = '__all__'
-        read_only_fields = ['owner', 'create_time']
+        # 内部的关注流扩散策略标记和 ETag 版本戳
+        exclude = ['fanout_on_read', 'version', 'updated_at']
+        read_only_fields = ['owner', 'create_time', 'pin_count']
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username']
+
 
+class BoardSummaryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # 整页 Board 的封面一次查出
+        boards = list(data.all() if hasattr(data, 'all') else data)
+        if 'cover_images' in self.child.fields or 'cover_image' in self.child.fields:
+            prime_board_covers(self.context, [board.board_id for board in boards])
+        return [self.child.to_representation(board) for board in boards]
 
-class FollowStreamSerializer(serializers.ModelSerializer):
+
+class BoardSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Board 列表用的摘要：Pin 数量和封面缩略图，不嵌套 Pin / 评论"""
+    owner = UserSummarySerializer(read_only=True)
+    cover_image = serializers.SerializerMethodField()
+    cover_images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Board
+        fields = [
+            'board_id', 'board_name', 'descriptor', 'owner', 'allow_friends_comment', 'create_time',
+            'pin_count', 'cover_image', 'cover_images',
+        ]
+        list_serializer_class = BoardSummaryListSerializer
+
+    def _thumbnail(self, picture):
+        """最小的缩略图，没有缩略图时用原图"""
+        request = self.context.get('request')
+        if picture.external_url and not mirror.serves_locally(picture):
+            return picture.external_url
+        if picture.blob_id is not None:
+            variants = [v for v in picture.blob.variants.all() if v.format == 'jpeg']
+            if variants:
+                return media.url(min(variants, key=lambda v: v.width).image_file, request)
+        return media.url(picture.image_file, request)
+
+    def get_cover_images(self, obj):
+        pictures = prime_board_covers(self.context, [obj.board_id])[obj.board_id]
+        return [url for url in map(self._thumbnail, pictures) if url]
+
+    def get_cover_image(self, obj):
+        covers = self.get_cover_images(obj)
+        return covers[0] if covers else None
+
+
+class FollowStreamSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     boards = BoardSerializer(many=True, read_only=True) # Or just board_ids
 
     class Meta:
         model = FollowStream
-        fields = '__all__'
+        exclude = ['version', 'updated_at']  # ETag 版本戳
         read_only_fields = ['user']
 
 
+class FollowStreamSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """关注流列表用的摘要：只返回关注的 Board id"""
+    board_ids = serializers.PrimaryKeyRelatedField(source='boards', many=True, read_only=True)
+
+    class Meta:
+        model = FollowStream
+        fields = ['stream_id', 'stream_name', 'user', 'board_ids']
+
+
 class LikeSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = Like
         fields = '__all__'
-        read_only_fields = ['user', 'timestamp']
\ No newline at end of file
+        read_only_fields = ['user', 'timestamp']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'upload_id', 'filename', 'tags', 'size', 'received', 'format', 'width', 'height', 'status', 'picture',
+            'created_time',
+        ]
+        read_only_fields = ['received', 'format', 'width', 'height', 'status', 'picture', 'created_time']
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['tag_id', 'name', 'usage_count']
@@ -0,0 +1,332 @@
+"""
+模型信号：
+- 保持关注流时间线（pin/feed.py）与 Pin、FollowStream.boards 同步
+- 维护 Pin / CustomUser 上的冗余计数（pin/counters.py）
+- 增量更新全文搜索索引（pin/search.py）
+- 把 Picture.tags 拆分成规范化标签（pin/tags.py）
+- 上传图片按内容去重（pin/blobs.py），新内容生成缩略图（pin/imaging.py）
+- 外部图片的本地镜像（pin/mirror.py）
+- 让包含变化对象的缓存响应失效（pin/response_cache.py）
+- 递增 Board / FollowStream / Pin 的 ETag 版本戳（pin/conditional.py）
+- 好友关系变化时让双方的好友集合缓存失效（pin/friends.py）
+- token 或用户变化时清掉认证缓存（pin/auth.py）
+- 删除分块上传会话时删除收到一半的文件（pin/uploads.py）
+"""
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import (
+    auth, blobs, conditional, counters, feed, friends, imaging, mirror, response_cache, search, tags, uploads
+)
+from .models import (
+    Board, Comment, CustomUser, FollowStream, FollowStreamEntry, Friendship, ImageBlob, Like, Picture,
+    PictureTag, PictureVariant, Pin, UploadSession
+)
+
+
+@receiver(post_save, sender=Pin)
+def pin_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata
+        return
+    if created:
+        # 新建 Pin 和 Repin 都写入关注流时间线
+        feed.fan_out_pin(instance)
+    else:
+        feed.move_pin(instance)
+
+
+@receiver(m2m_changed, sender=FollowStream.boards.through)
+def stream_boards_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse=True 时 instance 是 Board，pk_set 是 FollowStream 的 id
+    if reverse:
+        stream_ids, board_ids = pk_set, {instance.pk}
+    else:
+        stream_ids, board_ids = {instance.pk}, pk_set
+
+    if action == 'post_add' and pk_set:
+        feed.boards_added(list(stream_ids), list(board_ids))
+    elif action == 'post_remove' and pk_set:
+        feed.boards_removed(list(stream_ids), list(board_ids))
+    elif action == 'post_clear':
+        if reverse:
+            FollowStreamEntry.objects.filter(board=instance).delete()
+        else:
+            feed.boards_removed([instance.pk])
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Pin)
+@receiver(post_save, sender=Board)
+@receiver(post_save, sender=PictureTag)
+@receiver(post_save, sender=Picture)
+def counted_child_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.child_created(instance)
+
+
+@receiver(post_delete, sender=Like)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Pin)
+@receiver(post_delete, sender=Board)
+@receiver(post_delete, sender=PictureTag)
+@receiver(post_delete, sender=Picture)
+def counted_child_deleted(sender, instance, **kwargs):
+    counters.child_deleted(instance)
+
+
+@receiver(post_save, sender=Pin)
+def pin_board_count_moved(sender, instance, created, raw=False, **kwargs):
+    # Pin 换了 Board：原来的 Board 少一个，新的多一个（修改前的 Board 由 pin_moving 记下）
+    if not created and not raw:
+        for previous_id in getattr(instance, '_previous_board_ids', ()):
+            counters.moved(instance, 'board', previous_id)
+
+
+# 只有这些字段变化时才需要更新对应的搜索文档
+SEARCH_FIELDS = {
+    Pin: {'title', 'picture', 'picture_id'},
+    Picture: {'tags'},
+    Board: {'board_name', 'descriptor'},
+    CustomUser: {'username'},
+}
+
+
+def _search_fields_touched(sender, update_fields):
+    return update_fields is None or bool(SEARCH_FIELDS[sender] & set(update_fields))
+
+
+@receiver(post_save, sender=Pin)
+@receiver(post_save, sender=Board)
+@receiver(post_save, sender=CustomUser)
+def searchable_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    # 登录时更新 last_login 之类的写入不需要重建文档
+    if raw or not _search_fields_touched(sender, update_fields):
+        return
+    index = {Pin: search.PIN_INDEX, Board: search.BOARD_INDEX, CustomUser: search.USER_INDEX}[sender]
+    index.index([instance])
+
+
+@receiver(post_save, sender=Picture)
+def picture_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or not _search_fields_touched(sender, update_fields):
+        return
+    # 上传和修改图片时同步 Tag / PictureTag
+    tags.sync_picture_tags(instance)
+    search.reindex_picture(instance)
+
+
+@receiver(post_delete, sender=Pin)
+@receiver(post_delete, sender=Picture)
+@receiver(post_delete, sender=Board)
+@receiver(post_delete, sender=CustomUser)
+def searchable_deleted(sender, instance, **kwargs):
+    index = {
+        Pin: search.PIN_INDEX, Picture: search.PICTURE_INDEX,
+        Board: search.BOARD_INDEX, CustomUser: search.USER_INDEX,
+    }[sender]
+    index.remove([instance.pk])
+
+
+@receiver(pre_save, sender=Picture)
+def picture_uploading(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    # 已有的图片换了文件时，原来的 blob 少一个引用（和 pin_moving 一样先记下修改前的值）
+    if instance.pk is not None and (update_fields is None or {'image_file', 'blob'} & set(update_fields)):
+        instance._previous_blob_ids = set(
+            Picture.objects.filter(pk=instance.pk).values_list('blob_id', flat=True)
+        )
+    # 在 FileField 写文件之前换成去重后的 blob 文件
+    blobs.attach(instance)
+
+
+@receiver(post_save, sender=Picture)
+def picture_blob_moved(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    for previous_id in getattr(instance, '_previous_blob_ids', ()):
+        counters.moved(instance, 'blob', previous_id)
+        if previous_id != instance.blob_id:
+            blobs.release(previous_id)
+    instance._previous_blob_ids = set()
+
+
+@receiver(post_save, sender=Picture)
+def external_picture_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.external_url:
+        mirror.schedule(instance.external_url)
+
+
+@receiver(post_delete, sender=Picture)
+def picture_released(sender, instance, **kwargs):
+    # 注册在 counted_child_deleted 之后，这时 ref_count 已经减过
+    blobs.release(instance.blob_id)
+
+
+@receiver(post_save, sender=ImageBlob)
+def blob_stored(sender, instance, created, raw=False, **kwargs):
+    # 只有第一次出现的内容需要生成派生尺寸
+    if created and not raw:
+        imaging.schedule_variants(instance)
+
+
+@receiver(post_delete, sender=ImageBlob)
+def blob_deleted(sender, instance, **kwargs):
+    # 事务回滚时文件还要用，提交后再删
+    name, storage = instance.file.name, instance.file.storage
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_delete, sender=PictureVariant)
+def picture_variant_deleted(sender, instance, **kwargs):
+    # 派生图片只属于这一行，删除记录时一并删除文件；和 blob_deleted 一样提交后再删，回滚时文件还在
+    name, storage = instance.image_file.name, instance.image_file.storage
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_deleted(sender, instance, **kwargs):
+    # 删除后 instance 的主键被清空，先算出文件路径
+    filename = uploads.path(instance)
+    transaction.on_commit(lambda: uploads.remove_file(filename))
+
+
+# 出现在缓存响应里的 CustomUser 字段，登录更新 last_login 不需要失效
+USER_RESPONSE_FIELDS = {'username', 'email', 'profile_info', 'date_joined'}
+
+
+@receiver(post_save, sender=Pin)
+@receiver(post_delete, sender=Pin)
+def pin_changed(sender, instance, **kwargs):
+    # Board 详情列出了它的 Pin，用户的 pin_count 也变了
+    response_cache.invalidate('pin', [instance.pk])
+    response_cache.invalidate('board', [instance.board_id])
+    response_cache.invalidate('user', [instance.user_id])
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def pin_child_changed(sender, instance, **kwargs):
+    # 点赞数和评论列表；repin 的响应里也有原始 Pin，会一起失效
+    response_cache.invalidate('pin', [instance.pin_id])
+
+
+@receiver(post_save, sender=Board)
+@receiver(post_delete, sender=Board)
+def board_changed(sender, instance, **kwargs):
+    response_cache.invalidate('board', [instance.pk])
+    response_cache.invalidate('user', [instance.owner_id])
+
+
+@receiver(post_save, sender=Picture)
+@receiver(post_delete, sender=Picture)
+def picture_changed(sender, instance, **kwargs):
+    response_cache.invalidate('picture', [instance.pk])
+
+
+@receiver(post_save, sender=PictureVariant)
+def picture_variant_saved(sender, instance, **kwargs):
+    # 新生成的缩略图会出现在所有使用这个 blob 的图片的 srcset 里
+    response_cache.invalidate('picture', instance.blob.pictures.values_list('picture_id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or USER_RESPONSE_FIELDS & set(update_fields):
+        response_cache.invalidate('user', [instance.pk])
+
+
+@receiver(pre_save, sender=Pin)
+def pin_moving(sender, instance, raw=False, **kwargs):
+    # 记下修改前所在的 Board，Pin 被移走时原来的 Board 也要更新版本戳和 pin_count
+    if not raw and instance.pk is not None:
+        instance._previous_board_ids = set(Pin.objects.filter(pk=instance.pk).values_list('board_id', flat=True))
+
+
+@receiver(post_save, sender=Pin)
+@receiver(post_delete, sender=Pin)
+def pin_stamped(sender, instance, raw=False, **kwargs):
+    if not raw:
+        conditional.touch_boards({instance.board_id} | getattr(instance, '_previous_board_ids', set()))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_stamped(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    conditional.touch_pins([instance.pin_id])
+    conditional.touch_boards(Pin.objects.filter(pk=instance.pin_id).values_list('board_id', flat=True))
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def like_stamped(sender, instance, raw=False, **kwargs):
+    if not raw:
+        conditional.touch_like_target(instance.pin_id)
+
+
+@receiver(post_save, sender=Board)
+def board_stamped(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        conditional.touch_boards([instance.pk])
+
+
+@receiver(pre_delete, sender=Board)
+def board_deleting(sender, instance, **kwargs):
+    # 删除后 FollowStream.boards 的关联行已经没有了，只能在删除前更新关注它的流
+    conditional.touch_boards([instance.pk])
+
+
+@receiver(m2m_changed, sender=FollowStream.boards.through)
+def stream_boards_stamped(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        conditional.touch_streams([instance.pk])
+    elif action == 'pre_clear':
+        conditional.touch_boards([instance.pk])
+    else:
+        conditional.touch_streams(pk_set or [])
+
+
+@receiver(post_save, sender=Picture)
+def picture_stamped(sender, instance, created, raw=False, **kwargs):
+    # 新上传的图片还没有被 Pin 引用
+    if not created and not raw:
+        conditional.touch_pictures([instance.pk])
+
+
+@receiver(post_save, sender=PictureVariant)
+def picture_variant_stamped(sender, instance, **kwargs):
+    conditional.touch_pictures(instance.blob.pictures.values_list('picture_id', flat=True))
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def friendship_changed(sender, instance, **kwargs):
+    user_ids = (instance.user1_id, instance.user2_id)
+    friends.invalidate(*user_ids)
+    # 提交前并发读取可能又缓存了旧的集合，提交后再失效一次
+    transaction.on_commit(lambda: friends.invalidate(*user_ids))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    auth.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def authenticated_user_changed(sender, instance, **kwargs):
+    # 缓存里的用户字段（username、is_active 等）已经过期
+    auth.invalidate_user(instance.pk)
@@ -0,0 +1,204 @@
+"""
+合成数据集：给定用户数，按固定的随机种子生成结构接近真实使用的数据
+
+- 好友关系：优先连接，度数呈幂律分布（少数人好友很多）
+- Board：每个用户 1～4 个；用户的活跃度按 Zipf 分布，少数用户的 Board 上有大部分原创 Pin
+- Pin 的标题和图片标签从同一个词表按 Zipf 分布取词，搜索常见词和罕见词的结果数相差很大
+- Repin：转存热门 Pin，也转存别人的转存（转存链，按仓库的规则都记在原始 Pin 上）
+- 点赞、评论集中在热门 Pin 上；一半用户有一个关注流，关注的 Board 按热度选择
+
+所有行都用 bulk_create 批量写入，绕过的信号维护（计数、关注流时间线、全文索引、标签）
+由 pin/bulk.py、pin/counters.py 的批量版本补上。用户名以 prefix 开头，方便清理。
+`python manage.py generate_dataset` 把数据写进数据库，`python manage.py run_benchmarks` 在
+回滚的事务里生成并测量。
+"""
+import itertools
+import random
+from collections import Counter
+
+from . import bulk, counters, feed, search
+from .models import (
+    Board, Comment, CustomUser, FollowStream, Friendship, Like, Picture, PictureTag, Pin, Tag
+)
+from .friends import ordered
+from .tags import parse_tags
+
+BATCH_SIZE = 1000
+WORDS = [
+    'sunset', 'beach', 'recipe', 'garden', 'travel', 'cat', 'coffee', 'design', 'mountain', 'city',
+    'vintage', 'wedding', 'quilt', 'bread', 'forest', 'poster', 'kitchen', 'watercolor', 'hiking', 'minimal',
+    'autumn', 'cake', 'street', 'portrait', 'lake', 'ceramic', 'tattoo', 'bicycle', 'library', 'neon',
+    'origami', 'lighthouse', 'succulent', 'typography', 'aurora', 'fjord', 'mosaic', 'bonsai', 'calligraphy', 'zeppelin',
+]
+# 数据集的默认形状：每个用户的平均数量
+DEFAULTS = {
+    'friends_per_user': 8,
+    'pins_per_user': 10,
+    'repin_ratio': 0.3,
+    'likes_per_user': 20,
+    'comments_per_user': 3,
+    'boards_per_stream': 10,
+}
+
+
+def _cumulative(n, exponent=1.1):
+    """Zipf 分布的累计权重，用于 random.choices(cum_weights=...)"""
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def _words(rng, cumulative, count):
+    return list(dict.fromkeys(rng.choices(WORDS, cum_weights=cumulative, k=count)))
+
+
+def _friend_pairs(rng, user_ids, per_user):
+    # 优先连接：从已有边的端点里随机选，度数高的用户更容易被选中
+    pairs, endpoints = set(), []
+    edges = max(1, per_user // 2)
+    for index, user_id in enumerate(user_ids):
+        for _ in range(min(edges, index)):
+            other = rng.choice(endpoints) if endpoints and rng.random() < 0.8 else user_ids[rng.randrange(index)]
+            if other != user_id:
+                pairs.add(ordered(user_id, other))
+                endpoints.extend((user_id, other))
+    return pairs
+
+
+def generate(users, seed=1, prefix='synth-', **shape):
+    """
+    生成 users 个用户及其数据，返回 {'rows': 各表写入的行数, 'user_ids', 'stream_ids',
+    'board_ids'（有 Pin 的 Board，按 Pin 数从多到少）, 'pin_ids'（原创 Pin，按热度从高到低）,
+    'words'（按频率从高到低）}
+    """
+    shape = {**DEFAULTS, **shape}
+    rng = random.Random(seed)
+    word_weights = _cumulative(len(WORDS))
+
+    created = CustomUser.objects.bulk_create(
+        [CustomUser(username=f'{prefix}{i}', password='!') for i in range(users)], batch_size=BATCH_SIZE,
+    )
+    user_ids = [user.pk for user in created]
+    search.USER_INDEX.index(created)
+
+    pairs = _friend_pairs(rng, user_ids, shape['friends_per_user'])
+    Friendship.objects.bulk_create(
+        [Friendship(user1_id=a, user2_id=b) for a, b in pairs], batch_size=BATCH_SIZE,
+    )
+
+    boards = Board.objects.bulk_create([
+        Board(owner_id=user_id, board_name=' '.join(_words(rng, word_weights, 2)), descriptor='synthetic')
+        for user_id in user_ids
+        for _ in range(rng.randint(1, 4))
+    ], batch_size=BATCH_SIZE)
+    counters.recount(Board, boards)
+    search.BOARD_INDEX.index(boards)
+    boards_by_owner = {}
+    for board in boards:
+        boards_by_owner.setdefault(board.owner_id, []).append(board)
+
+    # 关注流在 Pin 之前建好，写入 Pin 时直接写扩散到时间线；被关注的 Board 按热度选择，和用户的活跃度无关
+    popular_boards = rng.sample(boards, len(boards))
+    board_weights = _cumulative(len(popular_boards))
+    streams = FollowStream.objects.bulk_create([
+        FollowStream(user_id=user_id, stream_name='synthetic') for user_id in user_ids if rng.random() < 0.5
+    ], batch_size=BATCH_SIZE)
+    follows = {
+        (stream.pk, board.pk)
+        for stream in streams
+        for board in rng.choices(popular_boards, cum_weights=board_weights, k=shape['boards_per_stream'])
+    }
+    feed.FollowStreamBoard.objects.bulk_create(
+        [feed.FollowStreamBoard(followstream_id=stream_id, board_id=board_id) for stream_id, board_id in follows],
+        batch_size=BATCH_SIZE,
+    )
+    feed.update_hot_boards({board_id for _, board_id in follows})
+
+    # 少数用户贡献了大部分 Pin，各自放在自己的 Board 上
+    active_users = rng.sample(user_ids, len(user_ids))
+    owners = rng.choices(active_users, cum_weights=_cumulative(users, 1.0), k=users * shape['pins_per_user'])
+    pictures = Picture.objects.bulk_create([
+        Picture(
+            external_url=f'https://example.com/{prefix}{i}.jpg', uploaded_by_id=owner,
+            tags=', '.join(_words(rng, word_weights, rng.randint(1, 3))),
+        )
+        for i, owner in enumerate(owners)
+    ], batch_size=BATCH_SIZE)
+    _tag_pictures(pictures)
+    search.PICTURE_INDEX.index(pictures)
+
+    originals = Pin.objects.bulk_create([
+        Pin(
+            user_id=picture.uploaded_by_id, board=rng.choice(boards_by_owner[picture.uploaded_by_id]),
+            picture=picture, title=' '.join(_words(rng, word_weights, rng.randint(1, 3))),
+        )
+        for picture in pictures
+    ], batch_size=BATCH_SIZE)
+    bulk.pins_created(originals)
+
+    popular_pins = rng.sample(originals, len(originals))
+    pin_weights = _cumulative(len(popular_pins))
+    repins = []
+    for _ in range(int(len(originals) * shape['repin_ratio'])):
+        # 三成转存的是别人的转存，记在同一个原始 Pin 上
+        source = rng.choice(repins) if repins and rng.random() < 0.3 else rng.choices(popular_pins, cum_weights=pin_weights)[0]
+        origin = source.origin_pin or source
+        user_id = rng.choice(user_ids)
+        if user_id == origin.user_id:
+            continue
+        repins.append(Pin(
+            user_id=user_id, board=rng.choice(boards_by_owner[user_id]), picture=origin.picture,
+            origin_pin=origin, title=source.title,
+        ))
+    repins = Pin.objects.bulk_create(repins, batch_size=BATCH_SIZE)
+    bulk.pins_created(repins)
+
+    likes = {
+        (user_id, pin.pk)
+        for user_id, pin in zip(
+            rng.choices(user_ids, k=users * shape['likes_per_user']),
+            rng.choices(popular_pins, cum_weights=pin_weights, k=users * shape['likes_per_user']),
+        )
+    }
+    likes = Like.objects.bulk_create(
+        [Like(user_id=user_id, pin_id=pin_id) for user_id, pin_id in likes], batch_size=BATCH_SIZE,
+    )
+    bulk.likes_changed(likes)
+
+    commented = popular_pins + repins
+    comments = Comment.objects.bulk_create([
+        Comment(user_id=rng.choice(user_ids), pin=pin, content=' '.join(_words(rng, word_weights, 5)))
+        for pin in rng.choices(commented, cum_weights=_cumulative(len(commented)), k=users * shape['comments_per_user'])
+    ], batch_size=BATCH_SIZE)
+    counters.recount(Comment, comments)
+
+    return {
+        'rows': {
+            'users': len(user_ids), 'friendships': len(pairs), 'boards': len(boards), 'follow_streams': len(streams),
+            'stream_follows': len(follows), 'pictures': len(pictures), 'pins': len(originals),
+            'repins': len(repins), 'likes': len(likes), 'comments': len(comments),
+        },
+        'user_ids': user_ids,
+        'board_ids': [board_id for board_id, _ in Counter(pin.board_id for pin in originals).most_common()],
+        'stream_ids': [stream.pk for stream in streams],
+        'pin_ids': [pin.pk for pin in popular_pins],
+        'words': WORDS,
+    }
+
+
+def _tag_pictures(pictures):
+    """批量版本的 tags.sync_picture_tags"""
+    names = {picture.pk: parse_tags(picture.tags) for picture in pictures}
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in set(itertools.chain(*names.values()))], ignore_conflicts=True,
+    )
+    tag_ids = dict(Tag.objects.filter(name__in=set(itertools.chain(*names.values()))).values_list('name', 'tag_id'))
+    picture_tags = PictureTag.objects.bulk_create([
+        PictureTag(picture_id=picture_id, tag_id=tag_ids[name])
+        for picture_id, picture_names in names.items()
+        for name in picture_names
+    ], batch_size=BATCH_SIZE)
+    counters.recount(PictureTag, picture_tags)
+
+
+def delete(prefix='synth-'):
+    """删除 prefix 开头的合成用户，Board、Pin、点赞等随之级联删除"""
+    return CustomUser.objects.filter(username__startswith=prefix).delete()
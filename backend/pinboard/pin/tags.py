@@ -0,0 +1,56 @@
+"""
+图片标签的规范化
+
+Picture.tags 仍然保存用户输入的原始字符串（用于显示），上传或修改时
+（Picture 的 post_save，见 pin/signals.py）把它切分成规范化的标签写入
+Tag / PictureTag，标签搜索和自动补全都走这两张表的索引。
+"""
+import re
+
+from django.db import transaction
+
+from .models import PictureTag, Tag
+
+# 逗号（中英文）、分号、空白和 # 都视为标签分隔符
+TAG_SEPARATORS = re.compile(r'[\s,，;；#]+')
+MAX_TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def parse_tags(text):
+    """'Art, #Sky  art' -> ['art', 'sky']（小写、去重、保持顺序）"""
+    names = []
+    for token in TAG_SEPARATORS.split(text or ''):
+        name = token.strip().lower()[:MAX_TAG_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def sync_picture_tags(picture):
+    """让图片的 PictureTag 与 picture.tags 字符串保持一致"""
+    names = parse_tags(picture.tags)
+    with transaction.atomic():
+        # 逐条删除 / 创建，Tag.usage_count 由信号增减
+        PictureTag.objects.filter(picture=picture).exclude(tag__name__in=names).delete()
+        if not names:
+            return
+        Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        existing = set(PictureTag.objects.filter(picture=picture).values_list('tag_id', flat=True))
+        for tag in Tag.objects.filter(name__in=names):
+            if tag.tag_id not in existing:
+                PictureTag.objects.create(picture=picture, tag=tag)
+
+
+def prefix_range(prefix):
+    """
+    前缀查询转换成范围查询 name >= prefix AND name < prefix + U+10FFFF，
+    可以直接使用 name 的唯一索引
+    """
+    return {'name__gte': prefix, 'name__lt': prefix + '\U0010ffff'}
+
+
+def suggest(prefix, limit=10):
+    prefix = prefix.strip().lower()
+    if not prefix:
+        return Tag.objects.none()
+    return Tag.objects.filter(usage_count__gt=0, **prefix_range(prefix)).order_by('-usage_count', 'name')[:limit]
@@ -1,3 +1,1890 @@
-from django.test import TestCase
+import contextvars
+import importlib
+import ipaddress
+import json
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from unittest import mock
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image, features
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import (
+    async_db, auth, counters, friends, imaging, like_buffer, likes, mirror, profiling, response_cache, search,
+    synthetic, tags, uploads,
+)
+from .models import (
+    CustomUser, Friendship, FriendshipRequest, Board, ImageBlob, MirroredImage, Picture, PictureVariant, Pin, FollowStream,
+    Like, Comment, Tag, UploadSession, FollowStreamEntry
+)
+
+
+def make_user(username):
+    # 测试里不需要真正的密码哈希，直接创建可以让用例快很多
+    return CustomUser.objects.create(username=username)
+
+
+def make_pin(user, board, **kwargs):
+    picture = Picture.objects.create(image_file='pictures/test.jpg', tags='test', uploaded_by=user)
+    return Pin.objects.create(user=user, board=board, picture=picture, title='pin', **kwargs)
+
+
+class PinSerializationQueryCountTests(TestCase):
+    """列表接口的查询次数不应该随 Pin 数量增长"""
+
+    # 单页的查询上限（不含认证），与页大小无关
+    QUERY_CEILING = 10
+
+    def setUp(self):
+        self.viewer = make_user('viewer')
+        self.owner = make_user('owner')
+        Friendship.objects.create(user1=self.viewer, user2=self.owner)
+        self.board = Board.objects.create(board_name='board', owner=self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def add_pins(self, count):
+        for i in range(count):
+            author = make_user(f'author{CustomUser.objects.count()}')
+            pin = make_pin(self.owner, self.board)
+            Comment.objects.create(user=author, pin=pin, content='nice')
+            Like.objects.create(user=author, pin=pin)
+            if i % 2:
+                Like.objects.create(user=self.viewer, pin=pin)
+            repinner = make_user(f'repinner{pin.pin_id}')
+            Pin.objects.create(user=repinner, board=self.board, picture=pin.picture, origin_pin=pin)
+
+    def count_queries(self, url):
+        # 每次都从冷缓存开始计数（好友集合、响应体缓存）
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured), response
+
+    def test_board_pins_query_count_is_constant(self):
+        url = f'/api/boards/{self.board.board_id}/pins/'
+        self.add_pins(2)
+        small, _ = self.count_queries(url)
+        self.add_pins(20)
+        large, response = self.count_queries(url)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.QUERY_CEILING)
+        self.assertEqual(len(response.data), 44)
+
+    def test_pin_list_and_board_detail_query_count_is_constant(self):
+        for url in ('/api/pins/', f'/api/boards/{self.board.board_id}/'):
+            Pin.objects.all().delete()
+            self.add_pins(2)
+            small, _ = self.count_queries(url)
+            self.add_pins(15)
+            large, _ = self.count_queries(url)
+            self.assertEqual(small, large, url)
+            self.assertLessEqual(large, self.QUERY_CEILING, url)
+
+    def test_batched_fields_match_per_object_values(self):
+        self.add_pins(3)
+        _, response = self.count_queries(f'/api/boards/{self.board.board_id}/pins/')
+        for item in response.data:
+            pin = Pin.objects.get(pin_id=item['pin_id'])
+            target = pin.origin_pin or pin
+            self.assertEqual(item['likes_received'], target.likes_received.count())
+            self.assertEqual(item['is_liked'], Like.objects.filter(user=self.viewer, pin=target).exists())
+            self.assertEqual(item['user']['pin_count'], Pin.objects.filter(user=pin.user).count())
+            self.assertEqual(item['user']['board_count'], Board.objects.filter(owner=pin.user).count())
+            self.assertEqual(item['user']['is_friend'], pin.user == self.owner)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('pager')
+        self.board = Board.objects.create(board_name='board', owner=self.user)
+        self.pins = [make_pin(self.user, self.board) for _ in range(7)]
+        self.client = APIClient()
+
+    def fetch_all(self, url, limit, **extra):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': limit, **extra}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['pin_id'] for item in response.data)
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return seen
+
+    def test_pages_cover_every_pin_once_newest_first(self):
+        expected = [pin.pin_id for pin in sorted(self.pins, key=lambda p: (p.timestamp, p.pin_id), reverse=True)]
+        for url in ('/api/pins/', f'/api/boards/{self.board.board_id}/pins/', f'/api/users/{self.user.id}/pins/'):
+            self.assertEqual(self.fetch_all(url, 3), expected, url)
+
+    def test_inserts_between_pages_do_not_shift_results(self):
+        first = self.client.get('/api/pins/', {'limit': 3})
+        make_pin(self.user, self.board)
+        second = self.client.get('/api/pins/', {'limit': 3, 'cursor': first['X-Next-Cursor']})
+        first_ids = [item['pin_id'] for item in first.data]
+        second_ids = [item['pin_id'] for item in second.data]
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertLess(max(second_ids), min(first_ids))
+
+    def test_page_size_is_bounded_and_bad_cursor_rejected(self):
+        response = self.client.get('/api/pins/', {'limit': 100000})
+        self.assertEqual(len(response.data), 7)
+        self.assertIsNone(response.get('X-Next-Cursor'))
+        self.assertEqual(self.client.get('/api/pins/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def test_search_sorted_by_likes_pages_by_keyset(self):
+        liker = make_user('liker')
+        Like.objects.create(user=liker, pin=self.pins[2])
+        ids = self.fetch_all('/api/search/pins/', 2, q='pin', sort_by='likes')
+        self.assertEqual(ids[0], self.pins[2].pin_id)
+        self.assertEqual(sorted(ids), sorted(pin.pin_id for pin in self.pins))
+
+
+class FollowStreamTimelineTests(TestCase):
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.author = make_user('author')
+        self.board = Board.objects.create(board_name='cold', owner=self.author)
+        self.other = Board.objects.create(board_name='other', owner=self.author)
+        self.stream = FollowStream.objects.create(stream_name='stream', user=self.reader)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def stream_pin_ids(self, **params):
+        response = self.client.get(f'/api/follow-streams/{self.stream.stream_id}/pictures/', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['pin_id'] for item in response.data]
+
+    def expected_ids(self, *boards):
+        return list(
+            Pin.objects.filter(board__in=boards).order_by('-timestamp', '-pin_id').values_list('pin_id', flat=True)
+        )
+
+    def test_entries_follow_pin_and_board_writes(self):
+        existing = make_pin(self.author, self.board)
+        self.client.post(f'/api/follow-streams/{self.stream.stream_id}/boards/', {'board_id': self.board.board_id})
+        self.assertEqual(self.stream.entries.count(), 1)
+
+        fresh = make_pin(self.author, self.board)
+        repinner = make_user('repinner')
+        Pin.objects.create(user=repinner, board=self.board, picture=fresh.picture, origin_pin=fresh)
+        make_pin(self.author, self.other)
+        self.assertEqual(self.stream_pin_ids(), self.expected_ids(self.board))
+
+        existing.delete()
+        self.assertEqual(self.stream.entries.count(), 2)
+
+        self.client.delete(f'/api/boards/{self.board.board_id}/unfollow/')
+        self.assertEqual(self.stream.entries.count(), 0)
+        self.assertEqual(self.stream_pin_ids(), [])
+
+    def test_hot_boards_are_merged_at_read_time(self):
+        with self.settings(PINBOARD_FEED_FANOUT_LIMIT=1):
+            for pin_board in (self.board, self.other):
+                make_pin(self.author, pin_board)
+            self.stream.boards.add(self.board)
+            FollowStream.objects.create(stream_name='crowd', user=self.author).boards.add(self.other)
+            self.stream.boards.add(self.other)  # 第二个关注者，超过阈值
+            self.other.refresh_from_db()
+            self.assertTrue(self.other.fanout_on_read)
+            self.assertFalse(self.stream.entries.filter(board=self.other).exists())
+
+            for _ in range(3):
+                make_pin(self.author, self.board)
+                make_pin(self.author, self.other)
+            self.assertFalse(self.stream.entries.filter(board=self.other).exists())
+
+            expected = self.expected_ids(self.board, self.other)
+            seen, cursor = [], None
+            while True:
+                params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+                response = self.client.get(f'/api/follow-streams/{self.stream.stream_id}/pictures/', params)
+                seen.extend(item['pin_id'] for item in response.data)
+                cursor = response.get('X-Next-Cursor')
+                if not cursor:
+                    break
+            self.assertEqual(seen, expected)
+
+    def test_rebuild_command_restores_timeline(self):
+        self.stream.boards.add(self.board)
+        for _ in range(3):
+            make_pin(self.author, self.board)
+        self.stream.entries.all().delete()
+        call_command('rebuild_follow_feeds', stdout=StringIO())
+        self.assertEqual(self.stream_pin_ids(), self.expected_ids(self.board))
+
+
+    def test_migration_builds_timelines_for_existing_streams(self):
+        # 升级前创建的流：时间线表里还没有行
+        self.stream.boards.add(self.board, self.other)
+        crowd = FollowStream.objects.create(stream_name='crowd', user=self.author)
+        crowd.boards.add(self.other)
+        for pin_board in (self.board, self.other, self.board):
+            make_pin(self.author, pin_board)
+        FollowStreamEntry.objects.all().delete()
+
+        migration = importlib.import_module('pin.migrations.0009_follow_stream_entry')
+        with self.settings(PINBOARD_FEED_FANOUT_LIMIT=1):
+            migration.build_timelines(apps, None)
+        self.other.refresh_from_db()
+        self.assertTrue(self.other.fanout_on_read)
+        self.assertEqual(set(self.stream.entries.values_list('board_id', flat=True)), {self.board.pk})
+        self.assertFalse(crowd.entries.exists())
+        self.assertEqual(self.stream_pin_ids(), self.expected_ids(self.board, self.other))
+
+class DenormalizedCounterTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('owner')
+        self.fan = make_user('fan')
+        Friendship.objects.create(user1=self.fan, user2=self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_counters_follow_api_writes(self):
+        board = Board.objects.create(board_name='board', owner=self.owner)
+        pin = make_pin(self.owner, board)
+        fan_board = self.client.post('/api/boards/', {'board_name': 'mine'}).data
+
+        self.client.post(f'/api/pins/{pin.pin_id}/like/')
+        self.client.post(f'/api/pins/{pin.pin_id}/create-comments/', {'content': 'hi'})
+        repin_id = self.client.post(f'/api/pins/{pin.pin_id}/repin/', {'board': fan_board['board_id']}).data['pin_id']
+        pin.refresh_from_db()
+        self.fan.refresh_from_db()
+        self.assertEqual((pin.like_count, pin.comment_count, pin.repin_count), (1, 1, 1))
+        self.assertEqual((self.fan.board_count, self.fan.pin_count), (1, 1))
+
+        self.client.post(f'/api/pins/{pin.pin_id}/unlike/')
+        self.client.delete(f'/api/pins/{repin_id}/')
+        pin.refresh_from_db()
+        self.fan.refresh_from_db()
+        self.assertEqual((pin.like_count, pin.repin_count, self.fan.pin_count), (0, 0, 0))
+
+    def test_reconcile_command_repairs_drift(self):
+        board = Board.objects.create(board_name='board', owner=self.owner)
+        pin = make_pin(self.owner, board)
+        Like.objects.create(user=self.fan, pin=pin)
+        Pin.objects.filter(pk=pin.pk).update(like_count=7, comment_count=3)
+        CustomUser.objects.filter(pk=self.owner.pk).update(board_count=0)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('Pin.like_count: 1 row(s)', out.getvalue())
+        pin.refresh_from_db()
+        self.assertEqual(pin.like_count, 7)
+
+        call_command('reconcile_counters', stdout=StringIO())
+        pin.refresh_from_db()
+        self.owner.refresh_from_db()
+        self.assertEqual((pin.like_count, pin.comment_count, self.owner.board_count), (1, 0, 1))
+
+    def test_search_sorts_by_counter_columns(self):
+        board = Board.objects.create(board_name='board', owner=self.owner)
+        quiet, busy = make_pin(self.owner, board), make_pin(self.owner, board)
+        for i in range(2):
+            Comment.objects.create(user=self.fan, pin=busy, content=str(i))
+        response = self.client.get('/api/search/pins/', {'q': 'pin', 'sort_by': 'comments'})
+        self.assertEqual([item['pin_id'] for item in response.data], [busy.pin_id, quiet.pin_id])
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user('searcher')
+        self.board = Board.objects.create(board_name='Watercolor studies', owner=self.user)
+        self.client = APIClient()
+
+    def pin_with(self, title, tags):
+        picture = Picture.objects.create(image_file='pictures/test.jpg', tags=tags, uploaded_by=self.user)
+        return Pin.objects.create(user=self.user, board=self.board, picture=picture, title=title)
+
+    def search(self, kind, **params):
+        response = self.client.get(f'/api/search/{kind}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_prefix_match_and_incremental_updates(self):
+        self.assertTrue(search.fts_available())
+        pin = self.pin_with('Sunset', 'watercolor landscape')
+        self.pin_with('Party night', 'people')
+        self.assertEqual([item['pin_id'] for item in self.search('pins', q='water')], [pin.pin_id])
+        # 词前缀匹配，不再是子串匹配
+        self.assertEqual(self.search('tags', q='art'), [])
+
+        pin.picture.tags = 'ink'
+        pin.picture.save()
+        self.assertEqual(self.search('tags', q='water'), [])
+        self.assertEqual(len(self.search('tags', q='ink')), 1)
+
+        pin.delete()
+        self.assertEqual(self.search('pins', q='sunset'), [])
+        self.assertEqual([b['board_id'] for b in self.search('boards', q='stud')], [self.board.board_id])
+        self.assertEqual([u['username'] for u in self.search('users', q='sear')], ['searcher'])
+
+    def test_relevance_sort_ranks_and_pages(self):
+        weak = self.pin_with('Cat', 'animal')
+        strong = self.pin_with('Cat cat cat', 'cat')
+        other = self.pin_with('Dog', 'animal')
+        first = self.client.get('/api/search/pins/', {'q': 'cat', 'sort_by': 'relevance', 'limit': 1})
+        self.assertEqual([item['pin_id'] for item in first.data], [strong.pin_id])
+        second = self.client.get('/api/search/pins/', {
+            'q': 'cat', 'sort_by': 'relevance', 'limit': 1, 'cursor': first['X-Next-Cursor'],
+        })
+        self.assertEqual([item['pin_id'] for item in second.data], [weak.pin_id])
+        self.assertNotIn(other.pin_id, [item['pin_id'] for item in second.data])
+
+    def test_fallback_and_rebuild(self):
+        pin = self.pin_with('Sunset', 'watercolor')
+        with self.settings(PINBOARD_SEARCH_BACKEND='basic'):
+            self.assertEqual([item['pin_id'] for item in self.search('pins', q='ercol')], [pin.pin_id])
+            self.assertEqual(len(self.search('pins', q='sun', sort_by='relevance')), 1)
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM pin_search_pin")
+        self.assertEqual(self.search('pins', q='sunset'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual([item['pin_id'] for item in self.search('pins', q='sunset')], [pin.pin_id])
+
+
+class NormalizedTagTests(TestCase):
+    def setUp(self):
+        self.user = make_user('tagger')
+        self.board = Board.objects.create(board_name='board', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def pin_with(self, tags_text):
+        picture = Picture.objects.create(image_file='pictures/test.jpg', tags=tags_text, uploaded_by=self.user)
+        return Pin.objects.create(user=self.user, board=self.board, picture=picture, title='pin')
+
+    def test_tags_are_split_and_counted(self):
+        self.assertEqual(tags.parse_tags('Art, #Sky  art；水彩'), ['art', 'sky', '水彩'])
+        picture = self.pin_with('Art, sky').picture
+        self.pin_with('art')
+        self.assertEqual(dict(Tag.objects.values_list('name', 'usage_count')), {'art': 2, 'sky': 1})
+
+        picture.tags = 'sky'
+        picture.save()
+        self.assertEqual(Tag.objects.get(name='art').usage_count, 1)
+        picture.delete()
+        self.assertEqual(Tag.objects.get(name='sky').usage_count, 0)
+
+    def test_tag_search_matches_whole_tags(self):
+        art = self.pin_with('art, sky')
+        self.pin_with('party')
+        both = self.pin_with('art')
+        Like.objects.create(user=self.user, pin=both)
+        response = self.client.get('/api/search/tags/', {'q': 'art', 'sort_by': 'likes'})
+        self.assertEqual([item['pin_id'] for item in response.data], [both.pin_id, art.pin_id])
+        response = self.client.get('/api/search/tags/', {'q': 'sky art'})
+        self.assertEqual([item['pin_id'] for item in response.data], [art.pin_id])
+        # 只有分隔符的查询不是“没有条件”
+        for query in (',', ' ; ', '#'):
+            self.assertEqual(self.client.get('/api/search/tags/', {'q': query}).status_code, 400, query)
+
+    def test_autocomplete_by_prefix_and_usage(self):
+        self.pin_with('water')
+        self.pin_with('watercolor')
+        self.pin_with('watercolor, wave')
+        response = self.client.get('/api/search/tag-suggestions/', {'q': 'Wat'})
+        self.assertEqual(
+            [(item['name'], item['usage_count']) for item in response.data],
+            [('watercolor', 2), ('water', 1)],
+        )
+
+
+def image_bytes(size=(1000, 800), color=(200, 30, 30), fmt='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class TempMediaMixin:
+    """把上传文件写到临时目录，不污染仓库里的 media/"""
+
+    def setUp(self):
+        super().setUp()
+        self._media = tempfile.TemporaryDirectory()
+        self._media_override = self.settings(MEDIA_ROOT=self._media.name, PINBOARD_IMAGE_VARIANTS_ASYNC=False)
+        self._media_override.enable()
+
+    def tearDown(self):
+        self._media_override.disable()
+        self._media.cleanup()
+        super().tearDown()
+
+    def upload(self, client, content, name='photo.png', **data):
+        return client.post('/api/pictures/', {
+            'image_file': SimpleUploadedFile(name, content, content_type='image/png'), **data,
+        }, format='multipart')
+
+
+class PictureVariantTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('uploader')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_upload_generates_variants_and_srcset(self):
+        response = self.upload(self.client, image_bytes((1000, 800)))
+        self.assertEqual(response.status_code, 201)
+        picture = Picture.objects.get(pk=response.data['picture_id'])
+        jpeg = picture.blob.variants.filter(format='jpeg').order_by('width')
+        self.assertEqual([(v.width, v.height) for v in jpeg], [(236, 189), (474, 379), (736, 589)])
+        with Image.open(jpeg[0].image_file.path) as thumb:
+            self.assertEqual(thumb.size, (236, 189))
+
+        data = self.client.get(f'/api/pictures/{picture.picture_id}/').data
+        self.assertIn('236w', data['srcset']['jpeg'])
+        self.assertTrue(data['srcset']['jpeg'].startswith('http://testserver/media/pictures/variants/'))
+        if features.check('webp'):
+            self.assertEqual(data['srcset']['webp'].count('w,'), 2)
+
+    def test_small_images_are_not_upscaled_and_backfill_command(self):
+        response = self.upload(self.client, image_bytes((300, 300)))
+        picture = Picture.objects.get(pk=response.data['picture_id'])
+        self.assertEqual(set(picture.blob.variants.values_list('width', flat=True)), {236})
+
+        picture.blob.variants.all().delete()
+        call_command('generate_picture_variants', stdout=StringIO())
+        self.assertEqual(set(picture.blob.variants.values_list('width', flat=True)), {236})
+
+    def test_variant_files_are_deleted_only_after_commit(self):
+        response = self.upload(self.client, image_bytes((300, 300)))
+        variant = Picture.objects.get(pk=response.data['picture_id']).blob.variants.first()
+        variant_id, path = variant.pk, variant.image_file.path
+
+        try:
+            with transaction.atomic():
+                variant.delete()
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        # 回滚后记录还在，文件也必须还在
+        self.assertTrue(PictureVariant.objects.filter(pk=variant_id).exists())
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PictureVariant.objects.get(pk=variant_id).delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_async_mode_defers_work_until_commit(self):
+        with self.settings(PINBOARD_IMAGE_VARIANTS_ASYNC=True):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.upload(self.client, image_bytes())
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(PictureVariant.objects.exists())
+        # 提交后才把生成任务交给线程池（其他回调是缓存失效）
+        with mock.patch.object(imaging, 'executor') as executor:
+            for callback in callbacks:
+                callback()
+        executor.return_value.submit.assert_called_once()
+
+
+class ContentAddressedPictureTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('dedupe')
+        self.other = make_user('dedupe-other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.board = Board.objects.create(board_name='board', owner=self.user)
+
+    def test_identical_uploads_share_file_and_variants(self):
+        content = image_bytes((800, 600))
+        first = Picture.objects.get(pk=self.upload(self.client, content, 'a.png').data['picture_id'])
+        second = Picture.objects.get(pk=self.upload(self.client, content, 'b.png', tags='copy').data['picture_id'])
+        third = Picture.objects.get(pk=self.upload(self.client, image_bytes(color=(0, 0, 255))).data['picture_id'])
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.image_file.name, second.image_file.name)
+        self.assertIn(first.blob.digest, first.image_file.name)
+        self.assertNotEqual(first.blob_id, third.blob_id)
+        self.assertEqual(ImageBlob.objects.get(pk=first.blob_id).ref_count, 2)
+        # 派生尺寸只生成了一套
+        self.assertEqual(PictureVariant.objects.filter(blob=first.blob).count(), first.blob.variants.count())
+        self.assertEqual(PictureVariant.objects.values('blob').distinct().count(), 2)
+
+    def test_replacing_image_moves_blob_reference(self):
+        old_content, new_content = image_bytes(), image_bytes(color=(0, 120, 0))
+        picture, sharing = [
+            Picture.objects.get(pk=self.upload(self.client, new_content if i else old_content).data['picture_id'])
+            for i in range(2)
+        ]
+        old_blob, new_blob = picture.blob, sharing.blob
+
+        with self.captureOnCommitCallbacks(execute=True):
+            picture.image_file = SimpleUploadedFile('replaced.png', new_content, content_type='image/png')
+            picture.save()
+        self.assertEqual(picture.blob_id, new_blob.pk)
+        new_blob.refresh_from_db()
+        self.assertEqual(new_blob.ref_count, 2)
+        # 原来的 blob 没有引用了，随之删除
+        self.assertFalse(ImageBlob.objects.filter(pk=old_blob.pk).exists())
+        self.assertFalse(os.path.exists(old_blob.file.path))
+
+        sharing.delete()
+        new_blob.refresh_from_db()
+        self.assertEqual(new_blob.ref_count, 1)
+        self.assertFalse(any(counters.reconcile(apply=False).values()))
+
+    def test_destroy_pin_keeps_file_while_other_pictures_use_it(self):
+        content = image_bytes()
+        pictures = [
+            Picture.objects.get(pk=self.upload(self.client, content).data['picture_id']) for _ in range(2)
+        ]
+        pins = [
+            Pin.objects.create(user=self.user, board=self.board, picture=picture, title='p')
+            for picture in pictures
+        ]
+        blob = pictures[0].blob
+        path = blob.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/pins/{pins[0].pin_id}/').status_code, 204)
+        self.assertFalse(Picture.objects.filter(pk=pictures[0].pk).exists())
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/pins/{pins[1].pin_id}/').status_code, 204)
+        self.assertFalse(ImageBlob.objects.filter(pk=blob.pk).exists())
+        self.assertFalse(PictureVariant.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_dedupe_command_links_existing_pictures(self):
+        storage = Picture._meta.get_field('image_file').storage
+        content = image_bytes((300, 200))
+        names = [storage.save(f'pictures/legacy{i}.png', BytesIO(content)) for i in range(2)]
+        legacy = [Picture.objects.create(image_file=name, uploaded_by=self.other) for name in names]
+
+        call_command('dedupe_pictures', stdout=StringIO())
+
+        for picture in legacy:
+            picture.refresh_from_db()
+        self.assertEqual(legacy[0].blob_id, legacy[1].blob_id)
+        self.assertEqual(legacy[0].image_file.name, legacy[1].image_file.name)
+        self.assertEqual(legacy[0].blob.ref_count, 2)
+        self.assertEqual(sum(storage.exists(name) for name in names), 1)
+
+
+class StandInOrigin:
+    """测试用的本地源站：images 里的路径返回图片，支持 ETag 条件请求，redirects 里的路径返回 302"""
+
+    def __init__(self):
+        self.images = {}
+        self.redirects = {}
+        self.requests = []
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                origin.requests.append((self.path, self.headers.get('If-None-Match')))
+                if self.path == '/slow.png':
+                    time.sleep(0.5)
+                if self.path == '/page.html':
+                    return self.reply(200, b'<html></html>', 'text/html')
+                if self.path in origin.redirects:
+                    self.send_response(302)
+                    self.send_header('Location', origin.redirects[self.path])
+                    self.send_header('Content-Length', '0')
+                    return self.end_headers()
+                if self.path not in origin.images:
+                    return self.reply(404, b'', 'text/plain')
+                body, etag = origin.images[self.path]
+                if self.headers.get('If-None-Match') == etag:
+                    return self.reply(304, b'', None, etag)
+                self.reply(200, body, 'image/png', etag)
+
+            def reply(self, code, body, content_type, etag=None):
+                self.send_response(code)
+                if content_type:
+                    self.send_header('Content-Type', content_type)
+                if etag:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                try:
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端已经超时断开
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ExternalImageMirrorTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.origin = StandInOrigin()
+        self.addCleanup(self.origin.close)
+        self.origin.images['/a.png'] = (image_bytes((600, 400)), '"a1"')
+        self.origin.images['/b.png'] = (image_bytes((600, 400), color=(0, 90, 0)), '"b1"')
+        self.mirror_settings = self.settings(
+            PINBOARD_MIRROR_EXTERNAL_IMAGES=True, PINBOARD_MIRROR_ASYNC=False,
+            PINBOARD_MIRROR_ALLOW_PRIVATE=True, PINBOARD_MIRROR_TIMEOUT=0.2,
+        )
+        self.mirror_settings.enable()
+        self.addCleanup(self.mirror_settings.disable)
+        self.user = make_user('mirror')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_external(self, path):
+        response = self.client.post('/api/pictures/', {'external_url': self.origin.url(path)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Picture.objects.get(pk=response.data['picture_id'])
+
+    def test_downloaded_once_and_served_locally(self):
+        first = self.post_external('/a.png')
+        second = self.post_external('/a.png')
+        self.assertEqual(len(self.origin.requests), 1)
+        self.assertIsNotNone(first.blob_id)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(ImageBlob.objects.get(pk=first.blob_id).ref_count, 2)
+
+        data = self.client.get(f'/api/pictures/{first.picture_id}/').data
+        self.assertTrue(data['image_url'].startswith('http://testserver/media/pictures/'))
+        self.assertIn('236w', data['srcset']['jpeg'])
+
+        with self.settings(PINBOARD_MIRROR_EXTERNAL_IMAGES=False):
+            data = self.client.get(f'/api/pictures/{first.picture_id}/').data
+        self.assertEqual(data['image_url'], self.origin.url('/a.png'))
+        self.assertEqual(data['srcset'], {})
+
+    def test_revalidation_uses_conditional_requests(self):
+        picture = self.post_external('/a.png')
+        old_blob = picture.blob_id
+        mirror.visit(self.origin.url('/a.png'), force=True)
+        self.assertEqual(self.origin.requests[-1], ('/a.png', '"a1"'))
+        picture.refresh_from_db()
+        self.assertEqual(picture.blob_id, old_blob)
+
+        self.origin.images['/a.png'] = (image_bytes((500, 500), color=(0, 0, 200)), '"a2"')
+        mirror.visit(self.origin.url('/a.png'), force=True)
+        picture.refresh_from_db()
+        self.assertNotEqual(picture.blob_id, old_blob)
+        # 旧内容已经没有引用
+        self.assertFalse(ImageBlob.objects.filter(pk=old_blob).exists())
+
+    def test_rejects_oversized_non_image_slow_and_private_sources(self):
+        with self.settings(PINBOARD_MIRROR_MAX_BYTES=100):
+            self.assertIn('too large', mirror.visit(self.origin.url('/a.png')).error)
+        self.assertIn('Not an image', mirror.visit(self.origin.url('/page.html')).error)
+        self.assertEqual(mirror.visit(self.origin.url('/slow.png')).status, 'failed')
+        with self.settings(PINBOARD_MIRROR_ALLOW_PRIVATE=False):
+            self.assertIn('private', mirror.visit(self.origin.url('/b.png')).error)
+        self.assertFalse(ImageBlob.objects.exists())
+
+        picture = self.post_external('/page.html')
+        self.assertIsNone(picture.blob_id)
+        data = self.client.get(f'/api/pictures/{picture.picture_id}/').data
+        self.assertEqual(data['image_url'], self.origin.url('/page.html'))
+
+    def test_redirects_are_checked_on_every_hop(self):
+        # 把源站（127.0.0.1）当作公网地址，其他回环地址仍然是内网
+        public = ipaddress.ip_address('127.0.0.1')
+        self.origin.redirects['/moved.png'] = self.origin.url('/a.png')
+        self.origin.redirects['/internal.png'] = f'http://127.0.0.2:{self.origin.server.server_port}/a.png'
+        self.origin.redirects['/file.png'] = 'file:///etc/passwd'
+        with self.settings(PINBOARD_MIRROR_ALLOW_PRIVATE=False), \
+                mock.patch.object(mirror, '_allowed', lambda ip: ip == public or ip.is_global):
+            self.assertEqual(mirror.visit(self.origin.url('/moved.png')).status, 'cached')
+            self.assertIn('private', mirror.visit(self.origin.url('/internal.png')).error)
+            self.assertEqual(mirror.visit(self.origin.url('/file.png')).status, 'failed')
+        self.assertEqual([path for path, _ in self.origin.requests], ['/moved.png', '/a.png', '/internal.png', '/file.png'])
+
+    def test_rejects_non_global_addresses_resolved_at_connect_time(self):
+        metadata = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('169.254.169.254', 80))]
+        with self.settings(PINBOARD_MIRROR_ALLOW_PRIVATE=False), \
+                mock.patch('socket.getaddrinfo', return_value=metadata) as resolve, \
+                mock.patch('socket.create_connection') as connect:
+            record = mirror.visit('http://images.example.com/a.png')
+        self.assertIn('private', record.error)
+        resolve.assert_called_once()
+        connect.assert_not_called()
+
+    def test_disk_budget_evicts_least_recently_used(self):
+        a = self.post_external('/a.png')
+        with self.settings(PINBOARD_MIRROR_DISK_BUDGET=a.blob.size + 10):
+            b = self.post_external('/b.png')
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertIsNone(a.blob_id)
+        self.assertEqual(a.image_file.name, '')
+        self.assertIsNotNone(b.blob_id)
+        self.assertEqual(MirroredImage.objects.get(url=self.origin.url('/a.png')).status, 'evicted')
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+        # 被淘汰的图片再次被访问时重新下载
+        call_command('mirror_external_pictures', stdout=StringIO())
+        a.refresh_from_db()
+        self.assertIsNotNone(a.blob_id)
+
+
+class MediaServingTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('media'))
+        self.content = image_bytes((300, 200))
+        data = self.upload(self.client, self.content).data
+        self.path = urllib.parse.urlsplit(data['image_url']).path
+
+    def get(self, path, **headers):
+        response = self.client.get(path, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_content_addressed_urls_are_immutable(self):
+        self.assertRegex(self.path, r'^/media/pictures/../../[0-9a-f]{64}\.png$')
+        response, body = self.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        revalidated, _ = self.get(self.path, if_none_match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        revalidated, _ = self.get(self.path, if_modified_since=response['Last-Modified'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'pictures'), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, 'pictures', 'legacy.png'), 'wb') as legacy:
+            legacy.write(self.content)
+        response, _ = self.get('/media/pictures/legacy.png')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        self.assertEqual(self.get('/media/../pinboard/settings.py')[0].status_code, 404)
+        self.assertEqual(self.get('/media/pictures/missing.png')[0].status_code, 404)
+
+    def test_range_requests(self):
+        size = len(self.content)
+        response, body = self.get(self.path, range='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response, body = self.get(self.path, range='bytes=-5')
+        self.assertEqual((response.status_code, body), (206, self.content[-5:]))
+        response, body = self.get(self.path, range=f'bytes=10-{size * 2}')
+        self.assertEqual((response.status_code, body), (206, self.content[10:]))
+
+        response, _ = self.get(self.path, range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # 多个范围和过期的 If-Range：发送整个文件
+        response, body = self.get(self.path, range='bytes=0-1,5-6')
+        self.assertEqual((response.status_code, body), (200, self.content))
+        response, body = self.get(self.path, range='bytes=0-9', if_range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+        etag = response['ETag']
+        response, body = self.get(self.path, range='bytes=0-9', if_range=etag)
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+
+    def test_sendfile_offload(self):
+        name = self.path[len('/media/'):]
+        with self.settings(PINBOARD_MEDIA_SENDFILE='x-accel-redirect'):
+            response, body = self.get(self.path, range='bytes=0-9')
+        self.assertEqual((response.status_code, body), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + name)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        with self.settings(PINBOARD_MEDIA_SENDFILE='x-sendfile'):
+            response, _ = self.get(self.path)
+        self.assertEqual(response['X-Sendfile'], os.path.join(settings.MEDIA_ROOT, name))
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self._uploads = tempfile.TemporaryDirectory()
+        self.addCleanup(self._uploads.cleanup)
+        upload_override = self.settings(PINBOARD_UPLOAD_DIR=self._uploads.name)
+        upload_override.enable()
+        self.addCleanup(upload_override.disable)
+        self.user = make_user('chunked')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # 随机像素，压缩后仍然有几十 KB，可以分成多块
+        buffer = BytesIO()
+        Image.frombytes('RGB', (160, 120), os.urandom(160 * 120 * 3)).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def start(self, content=None, **data):
+        content = self.content if content is None else content
+        response = self.client.post('/api/uploads/', {'filename': 'big.png', 'size': len(content), **data}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['upload_id']
+
+    def put(self, upload_id, offset, chunk, total=None):
+        total = len(self.content) if total is None else total
+        return self.client.put(
+            f'/api/uploads/{upload_id}/', chunk, content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes {offset}-{offset + len(chunk) - 1}/{total}'},
+        )
+
+    def test_chunks_resume_and_finalize(self):
+        upload_id = self.start(tags='sunset')
+        size = len(self.content)
+        response = self.put(upload_id, 0, self.content[:1000])
+        self.assertEqual(response.status_code, 200)
+        # 文件头在第一块里，格式和尺寸已经知道
+        self.assertEqual((response.data['received'], response.data['format']), (1000, 'PNG'))
+        self.assertEqual((response.data['width'], response.data['height']), (160, 120))
+
+        # 一块没有收全（断线）：不推进 received
+        session = UploadSession.objects.get(pk=upload_id)
+        with self.assertRaises(uploads.UploadError):
+            uploads.write_chunk(session, 1000, 1000, size, BytesIO(self.content[1000:1500]))
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').data['received'], 1000)
+
+        response = self.put(upload_id, 3000, self.content[3000:4000])
+        self.assertEqual((response.status_code, response.data['received']), (409, 1000))
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 409)
+
+        self.assertEqual(self.put(upload_id, 1000, self.content[1000:]).status_code, 200)
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 201)
+        picture = Picture.objects.get(pk=response.data['picture_id'])
+        self.assertEqual(picture.uploaded_by, self.user)
+        self.assertEqual(picture.tags, 'sunset')
+        self.assertEqual(picture.blob.size, size)
+        with picture.image_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertEqual(ImageBlob.objects.get(pk=picture.blob_id).ref_count, 1)
+        self.assertEqual(os.listdir(self._uploads.name), [])
+
+        # 重复 finalize 返回同一张图片
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual((response.status_code, response.data['picture_id']), (200, picture.picture_id))
+        self.assertEqual(Picture.objects.count(), 1)
+        self.assertEqual(self.put(upload_id, 0, self.content[:10]).status_code, 409)
+
+    def test_retried_chunk_does_not_clobber_the_winner(self):
+        upload_id = self.start()
+        size = len(self.content)
+        self.assertEqual(self.put(upload_id, 0, self.content[:1000]).status_code, 200)
+        # 同一块的三个请求都在任何一个写完之前读到了会话
+        first, duplicate, dropped = (UploadSession.objects.get(pk=upload_id) for _ in range(3))
+        uploads.write_chunk(first, 1000, size - 1000, size, BytesIO(self.content[1000:]))
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.write_chunk(duplicate, 1000, size - 1000, size, BytesIO(b'\0' * (size - 1000)))
+        self.assertEqual(raised.exception.status, 409)
+        with self.assertRaises(uploads.UploadError):
+            uploads.write_chunk(dropped, 1000, size - 1000, size, BytesIO(b'\0' * 500))
+
+        with open(uploads.path(first), 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(os.listdir(self._uploads.name), [os.path.basename(uploads.path(first))])
+        self.assertEqual(self.client.post(f'/api/uploads/{upload_id}/finalize/').status_code, 201)
+
+    def test_streaming_validation_rejects_early(self):
+        response = self.client.post('/api/uploads/', {'filename': 'x.png', 'size': 10 ** 9}, format='json')
+        self.assertEqual(response.status_code, 413)
+
+        # 第一块就能发现：不是图片、像素太多；会话和收到的文件都被删除
+        upload_id = self.start(b'%PDF-1.4' + b'0' * 2000)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.put(upload_id, 0, b'%PDF-1.4' + b'0' * 92, total=2008)
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+
+        upload_id = self.start()
+        with self.settings(PINBOARD_UPLOAD_MAX_PIXELS=1000), self.captureOnCommitCallbacks(execute=True):
+            response = self.put(upload_id, 0, self.content[:1000])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(os.listdir(self._uploads.name), [])
+
+        # 文件头正确、内容损坏：finalize 时校验失败，不创建图片
+        corrupt = self.content[:1000] + b'\0' * (len(self.content) - 1000)
+        upload_id = self.start(corrupt)
+        self.assertEqual(self.put(upload_id, 0, corrupt).status_code, 200)
+        response = self.client.post(f'/api/uploads/{upload_id}/finalize/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Picture.objects.exists())
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_sessions_are_private_and_expire(self):
+        upload_id = self.start()
+        other = APIClient()
+        other.force_authenticate(make_user('chunked-other'))
+        self.assertEqual(other.get(f'/api/uploads/{upload_id}/').status_code, 404)
+        self.assertEqual(other.post(f'/api/uploads/{upload_id}/finalize/').status_code, 404)
+
+        UploadSession.objects.filter(pk=upload_id).update(created_time=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/').status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.start()
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+        self.assertEqual(len(os.listdir(self._uploads.name)), 1)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        override = self.settings(PINBOARD_PROFILING=True, PINBOARD_PROFILING_DIR=self._dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        profiling.reset()
+        self.addCleanup(profiling.reset)
+        cache.clear()
+        self.user = make_user('profiled')
+        board = Board.objects.create(board_name='profiled', owner=self.user)
+        for _ in range(3):
+            make_pin(self.user, board)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_rolling_window(self):
+        response = self.client.get('/api/pins/')
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+
+        self.client.get('/api/pins/')
+        self.client.post(f'/api/pins/{Pin.objects.first().pk}/like/')
+        endpoints = profiling.snapshot()
+        self.assertEqual(set(endpoints), {'GET pin-list', 'POST pin-like-pin'})
+        self.assertEqual(endpoints['GET pin-list']['count'], 2)
+        total, db, query_count, serialize, size = endpoints['GET pin-list']['samples'][0]
+        self.assertGreater(query_count, 0)
+        self.assertIn(f'desc="{query_count} queries"', timing)
+        self.assertGreater(serialize, 0)
+        self.assertEqual(size, len(response.content))
+        self.assertGreaterEqual(total, db)
+
+        with self.settings(PINBOARD_PROFILING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/api/pins/'))
+        self.assertEqual(profiling.snapshot()['GET pin-list']['count'], 2)
+
+    def test_queries_from_worker_threads_are_all_counted(self):
+        # 异步视图的几个线程池线程同时往同一个记录里计数
+        record = profiling.Record()
+        token = profiling._current.set(record)
+        self.addCleanup(profiling._current.reset, token)
+        barrier = threading.Barrier(8)
+
+        def work():
+            barrier.wait()
+            for _ in range(2000):
+                profiling._count_query(lambda *args: None, 'SELECT 1', (), False, {})
+
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(work,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(record.queries, 8 * 2000)
+
+    def test_report_merges_flushed_processes(self):
+        self.client.get('/api/pins/')
+        self.client.get('/api/boards/')
+        profiling.flush()
+        # 另一个进程写出的文件
+        with open(os.path.join(self._dir.name, 'other-1.json'), 'w') as file:
+            json.dump({'pid': 1, 'written': time.time(), 'endpoints': {
+                'GET pin-list': {'count': 5, 'samples': [[900.0, 800.0, 50, 10.0, 100]]},
+            }}, file)
+        profiling.reset()
+
+        out = StringIO()
+        call_command('profiling_report', '--json', '--top', '1', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(len(report['slowest']), 1)
+        self.assertEqual(report['slowest'][0]['endpoint'], 'GET pin-list')
+        self.assertEqual(report['slowest'][0]['count'], 6)
+        self.assertEqual(report['slowest'][0]['max_queries'], 50)
+
+        call_command('profiling_report', '--reset', stdout=StringIO())
+        self.assertEqual(os.listdir(self._dir.name), [])
+
+
+class SyntheticDatasetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generated_data_is_consistent(self):
+        dataset = synthetic.generate(30, seed=3)
+        self.assertEqual(dataset['rows']['users'], 30)
+        # 批量写入补上了信号做的维护
+        self.assertFalse(any(counters.reconcile(apply=False).values()))
+        repins = Pin.objects.filter(origin_pin__isnull=False).select_related('origin_pin')
+        self.assertEqual(repins.count(), dataset['rows']['repins'])
+        for repin in repins:
+            self.assertIsNone(repin.origin_pin.origin_pin_id)
+            self.assertNotEqual(repin.user_id, repin.origin_pin.user_id)
+            self.assertEqual(repin.board.owner_id, repin.user_id)
+        timeline = set(FollowStreamEntry.objects.values_list('stream_id', 'pin_id'))
+        self.assertTrue(timeline)
+        call_command('rebuild_follow_feeds', stdout=StringIO())
+        self.assertEqual(set(FollowStreamEntry.objects.values_list('stream_id', 'pin_id')), timeline)
+        self.assertTrue(search.PIN_INDEX.filter(Pin.objects.all(), dataset['words'][0]).exists())
+
+        # 同样的种子生成同样结构的数据
+        self.assertEqual(synthetic.generate(30, seed=3, prefix='again-')['rows'], dataset['rows'])
+        synthetic.delete()
+        self.assertFalse(CustomUser.objects.filter(username__startswith='synth-').exists())
+
+    def test_benchmark_output_and_comparison(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('run_benchmarks', '--scales', '20', '--repeat', '2', '--output', output, stdout=StringIO())
+            with open(output) as file:
+                result = json.load(file)
+            # 数据随事务回滚
+            self.assertFalse(Pin.objects.exists())
+
+            out = StringIO()
+            call_command('run_benchmarks', '--scales', '20', '--repeat', '2', '--compare', output, stdout=out)
+        endpoints = result['scales']['20']['endpoints']
+        self.assertEqual(set(endpoints), {
+            'search_pins', 'stream_pictures', 'board_pins', 'get_friends', 'like_pin', 'repin',
+        })
+        for stats in endpoints.values():
+            self.assertLess(stats['status'], 300)
+            self.assertGreater(stats['queries'], 0)
+        self.assertEqual(result['scales']['20']['rows']['users'], 20)
+        self.assertIn('20 like_pin', out.getvalue())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('cache-owner')
+        self.viewer = make_user('cache-viewer')
+        self.stranger = make_user('cache-stranger')
+        Friendship.objects.create(user1=self.viewer, user2=self.owner)
+        self.board = Board.objects.create(board_name='cached', owner=self.owner)
+        self.pin = make_pin(self.owner, self.board)
+        Like.objects.create(user=self.viewer, pin=self.pin)
+
+    def get(self, url, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(captured)
+
+    def test_shared_body_with_viewer_specific_fields(self):
+        url = f'/api/boards/{self.board.board_id}/'
+        _, cold = self.get(url, self.viewer)
+        data, warm = self.get(url, self.viewer)
+        # 命中时只剩版本戳、点赞和好友关系三次查询
+        self.assertLess(warm, cold)
+        self.assertLessEqual(warm, 3)
+        self.assertTrue(data['pins'][0]['is_liked'])
+        self.assertTrue(data['owner']['is_friend'])
+
+        other, _ = self.get(url, self.stranger)
+        self.assertFalse(other['pins'][0]['is_liked'])
+        self.assertFalse(other['owner']['is_friend'])
+        self.assertEqual(other['pins'][0]['likes_received'], 1)
+
+    def test_stale_body_cached_before_commit_is_invalidated_after_commit(self):
+        pin_url = f'/api/pins/{self.pin.pin_id}/'
+        self.get(pin_url, self.viewer)
+        body_key = f'{response_cache.KEY_PREFIX}:pin:{self.pin.pin_id}:http://testserver'
+        stale = cache.get(body_key)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(user=self.stranger, pin=self.pin, content='hi')
+            # 提交前并发的读取看不到新评论，按旧的行又缓存了响应体和版本号
+            cache.set(body_key, stale)
+            cache.set_many({response_cache._version_key(*dep.split(':', 1)): v for dep, v in stale[0].items()}, None)
+        data, _ = self.get(pin_url, self.viewer)
+        self.assertEqual(len(data['comments']), 1)
+
+    def test_writes_invalidate_only_affected_responses(self):
+        board_url = f'/api/boards/{self.board.board_id}/'
+        pin_url = f'/api/pins/{self.pin.pin_id}/'
+        other_board = Board.objects.create(board_name='other', owner=self.owner)
+        other_url = f'/api/boards/{other_board.board_id}/'
+        for url in (board_url, pin_url, other_url):
+            self.get(url, self.viewer)
+
+        Comment.objects.create(user=self.stranger, pin=self.pin, content='hi')
+        Like.objects.create(user=self.stranger, pin=self.pin)
+        data, _ = self.get(pin_url, self.viewer)
+        self.assertEqual(data['likes_received'], 2)
+        self.assertEqual(len(data['comments']), 1)
+        data, _ = self.get(board_url, self.viewer)
+        self.assertEqual(data['pins'][0]['likes_received'], 2)
+        _, queries = self.get(other_url, self.viewer)
+        self.assertLessEqual(queries, 3)
+
+        # Repin 的响应里包含原始 Pin，原始 Pin 被点赞后一起失效
+        repin = Pin.objects.create(user=self.stranger, board=other_board, picture=self.pin.picture, origin_pin=self.pin)
+        self.get(f'/api/pins/{repin.pin_id}/', self.viewer)
+        Like.objects.create(user=self.owner, pin=self.pin)
+        data, _ = self.get(f'/api/pins/{repin.pin_id}/', self.viewer)
+        self.assertEqual(data['likes_received'], 3)
+
+    def test_user_by_username_tracks_counters_and_profile(self):
+        url = f'/api/users/by-username/{self.owner.username}/'
+        data, _ = self.get(url, self.viewer)
+        self.assertEqual(data['pin_count'], 1)
+        self.assertTrue(data['is_friend'])
+        make_pin(self.owner, self.board)
+        self.owner.refresh_from_db()
+        self.owner.profile_info = 'updated'
+        self.owner.save(update_fields=['profile_info'])
+        data, _ = self.get(url, self.stranger)
+        self.assertEqual((data['pin_count'], data['profile_info'], data['is_friend']), (2, 'updated', False))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('etag-owner')
+        self.board = Board.objects.create(board_name='polled', owner=self.owner)
+        self.pin = make_pin(self.owner, self.board)
+        self.stream = FollowStream.objects.create(stream_name='s', user=self.owner)
+        self.stream.boards.add(self.board)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def revalidate(self, url, response, header='HTTP_IF_NONE_MATCH'):
+        value = response['ETag'] if header == 'HTTP_IF_NONE_MATCH' else response['Last-Modified']
+        with CaptureQueriesContext(connection) as captured:
+            again = self.client.get(url, **{header: value})
+        return again, len(captured)
+
+    def test_not_modified_until_pin_comment_or_like_writes(self):
+        urls = [
+            f'/api/boards/{self.board.board_id}/',
+            f'/api/follow-streams/{self.stream.stream_id}/pictures/',
+            f'/api/pins/{self.pin.pin_id}/get-comments/',
+        ]
+        responses = {url: self.client.get(url) for url in urls}
+        for url, response in responses.items():
+            self.assertEqual(response.status_code, 200, url)
+            again, queries = self.revalidate(url, response)
+            self.assertEqual(again.status_code, 304, url)
+            self.assertEqual(again['ETag'], response['ETag'])
+            # 只查了版本戳，没有序列化
+            self.assertLessEqual(queries, 1, url)
+        board_url, stream_url, comments_url = urls
+
+        # 转存到另一个 Board 上的 Pin 显示同一个点赞数，关注那个 Board 的流也要变
+        other_board = Board.objects.create(board_name='repins', owner=self.owner)
+        Pin.objects.create(user=self.owner, board=other_board, picture=self.pin.picture, origin_pin=self.pin)
+        other_stream = FollowStream.objects.create(stream_name='other', user=self.owner)
+        other_stream.boards.add(other_board)
+        responses.update({
+            url: self.client.get(url)
+            for url in (f'/api/boards/{other_board.pk}/', f'/api/follow-streams/{other_stream.pk}/pictures/')
+        })
+
+        def stamps():
+            return (
+                list(Board.objects.order_by('pk').values_list('version', flat=True)),
+                list(FollowStream.objects.order_by('pk').values_list('version', flat=True)),
+            )
+
+        before = stamps()
+
+        Like.objects.create(user=make_user('etag-fan'), pin=self.pin)
+        for url in (board_url, stream_url, *list(responses)[3:]):
+            self.assertEqual(self.revalidate(url, responses[url])[0].status_code, 200, url)
+        self.assertEqual(self.revalidate(comments_url, responses[comments_url])[0].status_code, 304)
+        self.assertEqual(self.client.get(f'/api/boards/{other_board.pk}/').data['pins'][0]['likes_received'], 1)
+        # 点赞只换缓存里的点赞版本号，不更新 Board / 流的行
+        self.assertEqual(stamps(), before)
+
+        Comment.objects.create(user=self.owner, pin=self.pin, content='new')
+        self.assertEqual(self.revalidate(comments_url, responses[comments_url])[0].status_code, 200)
+
+        stream_response = self.client.get(stream_url)
+        make_pin(self.owner, self.board)
+        self.assertEqual(self.revalidate(stream_url, stream_response)[0].status_code, 200)
+
+    def test_etag_is_per_viewer_and_if_modified_since_is_honoured(self):
+        url = f'/api/boards/{self.board.board_id}/'
+        response = self.client.get(url)
+        other = APIClient()
+        other.force_authenticate(make_user('etag-other'))
+        self.assertEqual(other.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+        again, _ = self.revalidate(url, response, header='HTTP_IF_MODIFIED_SINCE')
+        self.assertEqual(again.status_code, 304)
+
+    def test_friendship_changes_invalidate_etag(self):
+        viewer = make_user('etag-viewer')
+        self.client.force_authenticate(viewer)
+        for url in (f'/api/boards/{self.board.board_id}/', f'/api/pins/{self.pin.pin_id}/get-comments/'):
+            response = self.client.get(url)
+            self.assertEqual(self.revalidate(url, response)[0].status_code, 304, url)
+            friendship = friends.befriend(viewer, self.owner)
+            again, _ = self.revalidate(url, response)
+            self.assertEqual(again.status_code, 200, url)
+            friendship.delete()
+            self.assertEqual(self.revalidate(url, again)[0].status_code, 200, url)
+
+
+class SlimListRepresentationTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('slim-owner')
+        self.boards = [Board.objects.create(board_name=f'b{i}', owner=self.owner) for i in range(4)]
+        for board in self.boards:
+            for _ in range(6):
+                make_pin(self.owner, board, description='x' * 200)
+        self.stream = FollowStream.objects.create(stream_name='s', user=self.owner)
+        self.stream.boards.add(*self.boards)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_board_list_is_a_summary_with_constant_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/boards/my_boards/')
+        self.assertEqual(response.status_code, 200)
+        board = response.data[0]
+        self.assertNotIn('pins', board)
+        self.assertEqual(board['pin_count'], 6)
+        self.assertEqual(board['owner']['username'], 'slim-owner')
+        self.assertLessEqual(len(board['cover_images']), 4)
+        self.assertEqual(board['cover_image'], board['cover_images'][0] if board['cover_images'] else None)
+        # Board + 封面（图片、缩略图），和 Board 数量无关
+        self.assertLessEqual(len(captured), 4)
+
+    def test_expand_and_fields(self):
+        expanded = self.client.get('/api/boards/my_boards/', {'expand': 'pins'})
+        self.assertEqual(len(expanded.data[0]['pins']), 6)
+
+        sparse = self.client.get('/api/boards/my_boards/', {'fields': 'board_id,pin_count'})
+        self.assertEqual(set(sparse.data[0]), {'board_id', 'pin_count'})
+
+        stream = self.client.get(f'/api/follow-streams/{self.stream.stream_id}/').data
+        self.assertEqual(sorted(stream['board_ids']), sorted(b.board_id for b in self.boards))
+        self.assertNotIn('boards', stream)
+        full = self.client.get('/api/follow-streams/', {'expand': 'boards'}).data
+        self.assertEqual(len(full[0]['boards'][0]['pins']), 6)
+
+    def test_pin_count_follows_moves_and_deletes(self):
+        source, target = self.boards[:2]
+        pin = source.pins.first()
+        pin.board = target
+        pin.save()
+        source.refresh_from_db()
+        target.refresh_from_db()
+        self.assertEqual((source.pin_count, target.pin_count), (5, 7))
+        pin.delete()
+        target.refresh_from_db()
+        self.assertEqual(target.pin_count, 6)
+
+
+class FriendGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.carol = make_user('carol')
+
+    def test_pairs_are_stored_once_in_canonical_order(self):
+        friendship = Friendship.objects.create(user1=self.bob, user2=self.alice)
+        self.assertLess(friendship.user1_id, friendship.user2_id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.create(user1=self.alice, user2=self.bob)
+        self.assertEqual(friends.befriend(self.bob, self.alice), friendship)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Friendship.objects.update(user1=self.bob, user2=self.alice)
+
+    def test_membership_is_cached_and_invalidated(self):
+        friends.befriend(self.alice, self.bob)
+        self.assertTrue(friends.are_friends(self.bob.pk, self.alice.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(friends.are_friends(self.bob.pk, self.alice.pk))
+            self.assertFalse(friends.are_friends(self.bob.pk, self.carol.pk))
+
+        Friendship.objects.get().delete()
+        self.assertFalse(friends.are_friends(self.bob.pk, self.alice.pk))
+        self.assertFalse(friends.are_friends(self.alice.pk, self.bob.pk))
+
+    def test_friend_checks_work_in_both_directions(self):
+        board = Board.objects.create(board_name='friends only', owner=self.alice, allow_friends_comment=True)
+        pin = make_pin(self.alice, board)
+        # 好友请求由 alice 发起时，存储的顺序和评论者的方向无关
+        friends.befriend(self.alice, self.carol)
+        client = APIClient()
+        client.force_authenticate(self.carol)
+        response = client.post(f'/api/pins/{pin.pin_id}/create-comments/', {'content': 'hi'})
+        self.assertEqual(response.status_code, 201, response.data)
+        client.force_authenticate(self.bob)
+        response = client.post(f'/api/pins/{pin.pin_id}/create-comments/', {'content': 'hi'})
+        self.assertEqual(response.status_code, 403)
+
+        friends_of_alice = client.get(f'/api/users/{self.alice.pk}/friends/').data
+        self.assertEqual([user['username'] for user in friends_of_alice], ['carol'])
+
+
+class FriendDiscoveryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.me, self.a, self.b, self.c, self.d = (make_user(name) for name in ('me', 'ann', 'ben', 'cat', 'dan'))
+        for x, y in ((self.me, self.a), (self.me, self.b), (self.a, self.c), (self.b, self.c), (self.a, self.d)):
+            friends.befriend(x, y)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def test_people_you_may_know_is_ranked_paginated_and_cached(self):
+        url = '/api/users/people-you-may-know/'
+        first = self.client.get(url, {'limit': 1})
+        self.assertEqual([(u['username'], u['mutual_count']) for u in first.data], [('cat', 2)])
+        second = self.client.get(url, {'limit': 1, 'cursor': first['X-Next-Cursor']})
+        self.assertEqual([(u['username'], u['mutual_count']) for u in second.data], [('dan', 1)])
+        self.assertNotIn('X-Next-Cursor', second)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        # 待处理的好友请求 + 当前页的用户，推荐列表本身来自缓存
+        self.assertLessEqual(len(captured), 2)
+
+        FriendshipRequest.objects.create(sender=self.me, receiver=self.c)
+        self.assertEqual([u['username'] for u in self.client.get(url).data], ['dan'])
+        friends.befriend(self.me, self.d)
+        self.assertEqual(self.client.get(url).data, [])
+
+    def test_mutual_friends(self):
+        response = self.client.get(f'/api/users/{self.c.pk}/mutual-friends/')
+        self.assertEqual([u['username'] for u in response.data], ['ann', 'ben'])
+        response = self.client.get(f'/api/users/{self.d.pk}/mutual-friends/')
+        self.assertEqual([u['username'] for u in response.data], ['ann'])
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        self.author = make_user('bulk-author')
+        self.fan = make_user('bulk-fan')
+        self.board = Board.objects.create(board_name='import', owner=self.author)
+        self.fan_board = Board.objects.create(board_name='saved', owner=self.fan)
+        self.picture = Picture.objects.create(image_file='pictures/test.jpg', tags='sunset', uploaded_by=self.author)
+        self.stream = FollowStream.objects.create(stream_name='s', user=self.fan)
+        self.stream.boards.add(self.board)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_bulk_pins_keep_derived_data_in_sync(self):
+        items = [{'board': self.board.board_id, 'picture': self.picture.picture_id, 'title': f'beach {i}'} for i in range(200)]
+        items += [{'board': 999999, 'picture': self.picture.picture_id}, {'title': 'no board'}]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/pins/bulk/', {'pins': items}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # 查询次数和条目数量无关
+        self.assertLess(len(captured), 40)
+        self.assertEqual(response.data['summary'], {'created': 200, 'invalid': 2})
+        self.assertEqual(response.data['results'][200]['errors']['board'][0], 'Invalid pk "999999" - object does not exist.')
+
+        self.board.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual((self.board.pin_count, self.author.pin_count), (200, 200))
+        self.assertEqual(self.stream.entries.count(), 200)
+        found = self.client.get('/api/search/pins/', {'q': 'beach', 'limit': 5})
+        self.assertEqual(len(found.data), 5)
+
+        too_many = [items[0]] * 3
+        with self.settings(PINBOARD_BULK_MAX_ITEMS=2):
+            self.assertEqual(self.client.post('/api/pins/bulk/', too_many, format='json').status_code, 400)
+
+    def test_bulk_like_and_repin(self):
+        pins = [make_pin(self.author, self.board) for _ in range(3)]
+        fan = APIClient()
+        fan.force_authenticate(self.fan)
+        Like.objects.create(user=self.fan, pin=pins[0])
+        ids = [pin.pin_id for pin in pins]
+        response = fan.post('/api/pins/bulk-like/', {'pins': ids + [ids[1], 'x']}, format='json')
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['already_liked', 'liked', 'liked', 'already_liked', 'invalid'],
+        )
+        self.assertEqual([pin.like_count for pin in Pin.objects.filter(pk__in=ids).order_by('pk')], [1, 1, 1])
+
+        response = fan.post('/api/pins/bulk-repin/', {'board': self.fan_board.board_id, 'pins': [{'pin': pin_id} for pin_id in ids]}, format='json')
+        self.assertEqual(response.data['summary'], {'created': 3})
+        repin = Pin.objects.get(pk=response.data['results'][0]['pin_id'])
+        self.assertEqual((repin.origin_pin_id, repin.board_id), (ids[0], self.fan_board.board_id))
+        self.assertEqual(Pin.objects.get(pk=ids[0]).repin_count, 1)
+        own = self.client.post('/api/pins/bulk-repin/', {'pins': [{'pin': ids[0]}]}, format='json')
+        self.assertEqual(own.data['summary'], {'invalid': 1})
+
+    def test_bulk_stream_boards(self):
+        other = Board.objects.create(board_name='other', owner=self.author)
+        make_pin(self.author, other)
+        fan = APIClient()
+        fan.force_authenticate(self.fan)
+        response = fan.post(
+            f'/api/follow-streams/{self.stream.stream_id}/bulk-boards/',
+            {'board_ids': [self.board.board_id, other.board_id, other.board_id, 424242]}, format='json',
+        )
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['already_in_stream', 'added', 'already_in_stream', 'invalid'],
+        )
+        self.assertEqual(set(self.stream.boards.values_list('pk', flat=True)), {self.board.pk, other.pk})
+        self.assertEqual(self.stream.entries.count(), 1)
+
+
+class IdempotentLikeTests(TestCase):
+    def setUp(self):
+        self.owner = make_user('like-owner')
+        self.fan = make_user('like-fan')
+        board = Board.objects.create(board_name='b', owner=self.owner)
+        self.pin = make_pin(self.owner, board)
+        self.repin = Pin.objects.create(user=self.fan, board=board, picture=self.pin.picture, origin_pin=self.pin)
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def post(self, pin, action):
+        response = self.client.post(f'/api/pins/{pin.pin_id}/{action}/')
+        return response.status_code, response.data
+
+    def test_like_and_unlike_are_idempotent(self):
+        expected = {'pin_id': self.pin.pin_id, 'liked': True, 'like_count': 1}
+        self.assertEqual(self.post(self.pin, 'like'), (201, expected))
+        # 对 repin 点赞记在原始 Pin 上，重复点赞不报错
+        self.assertEqual(self.post(self.repin, 'like'), (200, expected))
+
+        expected = {'pin_id': self.pin.pin_id, 'liked': False, 'like_count': 0}
+        self.assertEqual(self.post(self.pin, 'unlike'), (200, expected))
+        self.assertEqual(self.post(self.pin, 'unlike'), (200, expected))
+        self.pin.refresh_from_db()
+        self.assertEqual((self.pin.like_count, Like.objects.count()), (0, 0))
+
+    def test_toggle(self):
+        self.assertEqual(self.post(self.pin, 'toggle-like')[1]['liked'], True)
+        self.assertEqual(self.post(self.repin, 'toggle-like')[1], {'pin_id': self.pin.pin_id, 'liked': False, 'like_count': 0})
+        self.assertEqual(self.post(self.pin, 'toggle-like')[1]['like_count'], 1)
+
+
+class ConcurrentUnlikeTests(TransactionTestCase):
+    """并发的取消点赞只有一个删到行，计数只减一次"""
+
+    def test_concurrent_unlikes_decrement_once(self):
+        owner = make_user('unlike-owner')
+        pin = make_pin(owner, Board.objects.create(board_name='b', owner=owner))
+        fans = [make_user(f'unlike-fan-{i}') for i in range(3)]
+        for fan in fans:
+            likes.like(fan, pin)
+        deleted, errors = [], []
+        barrier = threading.Barrier(2 * len(fans))
+
+        def unlike(fan):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        deleted.append(likes._delete(fan, pin.pin_id))
+                        break
+                    except OperationalError as e:
+                        # 测试用的内存数据库（共享缓存）不支持 busy_timeout，被锁时自己重试
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.001)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=unlike, args=(fan,)) for fan in fans for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(deleted), [False] * len(fans) + [True] * len(fans))
+        pin.refresh_from_db()
+        self.assertEqual((pin.like_count, Like.objects.count()), (0, 0))
+
+
+@override_settings(PINBOARD_LIKE_BUFFER=True, PINBOARD_LIKE_BUFFER_ASYNC=False)
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user('buffer-owner')
+        self.fans = [make_user(f'buffer-fan{i}') for i in range(3)]
+        self.pin = make_pin(self.owner, Board.objects.create(board_name='viral', owner=self.owner))
+        self.client = APIClient()
+        self.client.force_authenticate(self.fans[0])
+
+    def tearDown(self):
+        like_buffer.flush()
+
+    def test_likes_are_written_in_batches_with_read_your_writes(self):
+        url = f'/api/pins/{self.pin.pin_id}/'
+        response = self.client.post(f'{url}like/')
+        self.assertEqual((response.status_code, response.data['like_count']), (201, 1))
+        for fan in self.fans[1:]:
+            like_buffer.record(fan.pk, self.pin.pin_id, True)
+        # 还没有写入数据库，但操作的用户看到的是自己的最新状态
+        self.assertEqual(Like.objects.count(), 0)
+        detail = self.client.get(url).data
+        self.assertEqual((detail['is_liked'], detail['likes_received']), (True, 3))
+
+        # 同一个用户的多次操作只保留最后的状态
+        self.client.post(f'{url}toggle-like/')
+        self.client.post(f'{url}toggle-like/')
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(like_buffer.flush(), 3)
+        self.assertLess(len(captured), 12)
+        self.pin.refresh_from_db()
+        self.assertEqual((self.pin.like_count, Like.objects.count()), (3, 3))
+
+        self.assertEqual(self.client.post(f'{url}unlike/').data['like_count'], 2)
+        self.assertFalse(self.client.get(url).data['is_liked'])
+        like_buffer.flush()
+        self.pin.refresh_from_db()
+        self.assertEqual((self.pin.like_count, Like.objects.filter(user=self.fans[0]).exists()), (2, False))
+
+
+    def test_buffered_likes_invalidate_cached_bodies_and_etags(self):
+        board_url, pin_url = f'/api/boards/{self.pin.board_id}/', f'/api/pins/{self.pin.pin_id}/'
+        cached = {url: self.client.get(url) for url in (board_url, pin_url)}
+        self.assertEqual(self.client.get(board_url, HTTP_IF_NONE_MATCH=cached[board_url]['ETag']).status_code, 304)
+
+        self.client.post(f'{pin_url}like/')
+        self.assertEqual(Like.objects.count(), 0)
+        response = self.client.get(board_url, HTTP_IF_NONE_MATCH=cached[board_url]['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['pins'][0]['likes_received'], response.data['pins'][0]['is_liked']), (1, True))
+        self.assertEqual(self.client.get(pin_url).data['likes_received'], 1)
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "SQLite 连接配置")
+class SQLiteProfileTests(TestCase):
+    def pragma(self, cursor, name):
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connection(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(self.pragma(cursor, 'busy_timeout'), settings.PINBOARD_SQLITE_PRAGMAS['busy_timeout'])
+            self.assertEqual(self.pragma(cursor, 'synchronous'), 1)  # NORMAL
+            self.assertEqual(self.pragma(cursor, 'temp_store'), 2)  # MEMORY
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+        # 测试数据库在内存里，WAL 在文件数据库上检查：连接本身不改写文件，迁移 0022 切换
+        wal = importlib.import_module('pin.migrations.0022_sqlite_wal')
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = connections['default'].__class__({**connection.settings_dict, 'NAME': os.path.join(directory, 'wal.sqlite3')})
+            try:
+                with wrapper.cursor() as cursor:
+                    self.assertEqual(self.pragma(cursor, 'journal_mode'), 'delete')
+                with wrapper.schema_editor(atomic=False) as schema_editor:
+                    wal.enable_wal(None, schema_editor)
+                with wrapper.cursor() as cursor:
+                    self.assertEqual(self.pragma(cursor, 'journal_mode'), 'wal')
+            finally:
+                wrapper.close()
+
+    def test_trigram_relevance_is_postgres_only(self):
+        self.assertFalse(search.trigram_available())
+
+
+def full_table_scans(queries, tables):
+    """
+    对捕获的每条 SELECT 执行 EXPLAIN QUERY PLAN，返回其中对 tables 做全表扫描
+    （SCAN 且没有使用索引）的 [(表名, SQL)]
+    """
+    scans = []
+    with connection.cursor() as cursor:
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            # 子查询里的表用 Django 生成的别名（"pin_pin" U0）出现在查询计划中
+            aliases = {alias: table for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql)}
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            for *_, detail in cursor.fetchall():
+                match = re.match(r'SCAN (\w+)', detail)
+                table = match and aliases.get(match.group(1), match.group(1))
+                if table in tables and 'INDEX' not in detail:
+                    scans.append((table, sql))
+    return scans
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN 是 SQLite 的语法")
+class QueryPlanTests(TestCase):
+    """热点接口的每条查询都应该走索引，不能对大表全表扫描"""
+
+    TABLES = {
+        'pin_pin', 'pin_comment', 'pin_like', 'pin_picture', 'pin_board',
+        'pin_friendship', 'pin_friendshiprequest', 'pin_followstreamentry',
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('planner')
+        self.friend = make_user('planner-friend')
+        self.stranger = make_user('planner-stranger')
+        friends.befriend(self.user, self.friend)
+        friends.befriend(self.friend, self.stranger)
+        FriendshipRequest.objects.create(sender=self.stranger, receiver=self.user)
+        self.board = Board.objects.create(board_name='plans', owner=self.friend)
+        self.pins = [make_pin(self.friend, self.board) for _ in range(3)]
+        Comment.objects.create(user=self.user, pin=self.pins[0], content='nice')
+        Like.objects.create(user=self.user, pin=self.pins[0])
+        Pin.objects.create(
+            user=self.user, board=Board.objects.create(board_name='mine', owner=self.user),
+            picture=self.pins[1].picture, origin_pin=self.pins[1],
+        )
+        self.stream = FollowStream.objects.create(user=self.user, stream_name='plans')
+        self.stream.boards.add(self.board)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_hot_endpoints_use_indexes(self):
+        pin_id = self.pins[0].pin_id
+        urls = [
+            f'/api/boards/{self.board.pk}/pins/',
+            f'/api/users/{self.friend.pk}/pins/',
+            f'/api/pins/{pin_id}/',
+            f'/api/pins/{pin_id}/get-comments/',
+            f'/api/follow-streams/{self.stream.pk}/pictures/',
+            '/api/friend-requests/list-requests/',
+            '/api/users/people-you-may-know/',
+            f'/api/users/{self.friend.pk}/mutual-friends/',
+            '/api/pictures/search/?q=test',
+            '/api/search/pins/?q=test&sort_by=likes',
+            '/api/search/pins/?q=test&sort_by=repins',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as captured:
+                    self.assertEqual(self.client.get(url).status_code, 200)
+                self.assertEqual(full_table_scans(captured.captured_queries, self.TABLES), [])
+
+    def test_harness_reports_full_scans(self):
+        with CaptureQueriesContext(connection) as captured:
+            list(Pin.objects.filter(title='pin'))
+            list(Board.objects.filter(pk__in=Pin.objects.filter(description='x').values('board')))
+        self.assertEqual([table for table, _ in full_table_scans(captured.captured_queries, self.TABLES)], ['pin_pin', 'pin_pin'])
+
+
+class CachedTokenAuthTests(TestCase):
+    def setUp(self):
+        auth.clear()
+        self.user = CustomUser.objects.create_user(username='token-user', password='old-password')
+        self.client = APIClient()
+
+    def login(self, password='old-password'):
+        response = self.client.post('/api/users/login/', {'username': 'token-user', 'password': password})
+        self.assertEqual(response.status_code, 200)
+        return response.data['token']
+
+    def get(self, key, url='/api/follow-streams/'):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        token_queries = [query for query in captured if 'authtoken_token' in query['sql']]
+        return response.status_code, len(token_queries)
+
+    def test_token_lookup_is_cached_and_invalidated(self):
+        key = self.login()
+        self.assertEqual(self.get(key), (200, 1))
+        self.assertEqual(self.get(key), (200, 0))
+        self.assertEqual(self.login(), key)
+
+        # 轮换：旧 token 立即失效
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        rotated = self.client.post('/api/users/rotate-token/').data['token']
+        self.assertEqual(self.get(key)[0], 401)
+        self.assertEqual(self.get(rotated), (200, 1))
+
+        # 修改密码：返回新的 token，旧的失效
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {rotated}')
+        response = self.client.patch('/api/users/me/', {'password': 'new-password'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get(rotated)[0], 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-password'))
+
+        # 登出
+        key = response.data['token']
+        self.assertEqual(self.get(key), (200, 1))
+        self.client.post('/api/users/logout/')
+        self.assertEqual(self.get(key)[0], 401)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+    def test_revocation_reaches_other_workers_and_user_is_fresh(self):
+        key = self.login()
+        self.assertEqual(self.get(key), (200, 1))
+        # 另一个 worker 进程：本地条目还在，作废只通过共享缓存里的版本号传过来
+        other_worker = dict(auth._entries)
+        Token.objects.filter(key=key).delete()
+        auth._entries.update(other_worker)
+        self.assertEqual(self.get(key)[0], 401)
+
+        key = self.login()
+        self.get(key)
+        # 不发信号的更新（例如计数）也能立即读到，缓存里没有用户对象
+        CustomUser.objects.filter(pk=self.user.pk).update(first_name='Fresh')
+        with self.assertNumQueries(0):
+            user, _ = auth.CachedTokenAuthentication().authenticate_credentials(key)
+            self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.first_name, 'Fresh')
+
+    def test_write_endpoints_do_not_reload_the_cached_user(self):
+        key = self.login()
+        self.get(key)
+        board = Board.objects.create(board_name='cached', owner=make_user('cached-owner'))
+        pin = make_pin(board.owner, board)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        user_table = CustomUser._meta.db_table
+        # (请求, 重新读当前用户的查询数)：外键赋值、按用户过滤和权限检查都用缓存的字段，
+        # 响应里要序列化当前用户的接口读一次剩下的字段
+        for url, data, expected in [
+            (f'/api/pins/{pin.pk}/like/', None, 0),
+            (f'/api/pins/{pin.pk}/unlike/', None, 0),
+            ('/api/follow-streams/', {'stream_name': 'mine'}, 1),
+            ('/api/boards/', {'board_name': 'mine', 'descriptor': ''}, 1),
+        ]:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.post(url, data, format='json')
+            self.assertIn(response.status_code, (200, 201), url)
+            self.assertFalse([q for q in captured if 'authtoken_token' in q['sql']], url)
+            reloads = [q for q in captured if f'FROM "{user_table}"' in q['sql'] and str(self.user.pk) in q['sql']]
+            self.assertEqual(len(reloads), expected, url)
+        self.assertEqual(Board.objects.get(board_name='mine').owner, self.user)
+
+    @override_settings(PINBOARD_TOKEN_TTL=60)
+    def test_expired_tokens_are_rejected_and_reissued(self):
+        key = self.login()
+        Token.objects.filter(key=key).update(created=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(self.get(key)[0], 401)
+        self.assertFalse(Token.objects.filter(key=key).exists())
+        self.assertNotEqual(self.login(), key)
+
+
+class AsyncReadEndpointMixin:
+    def create_data(self):
+        self.owner = make_user('async-owner')
+        self.viewer = make_user('async-viewer')
+        friends.befriend(self.owner, self.viewer)
+        self.board = Board.objects.create(board_name='async', owner=self.owner)
+        self.pins = [make_pin(self.owner, self.board) for _ in range(5)]
+        Like.objects.create(user=self.viewer, pin=self.pins[0])
+        Comment.objects.create(user=self.viewer, pin=self.pins[1], content='hi')
+        self.stream = FollowStream.objects.create(user=self.viewer, stream_name='async')
+        self.stream.boards.add(self.board)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def assertSameResponses(self, path):
+        expected, actual = self.client.get(f'/api/{path}'), self.client.get(f'/api/async/{path}')
+        self.assertEqual((actual.status_code, actual.json()), (expected.status_code, expected.json()))
+        self.assertEqual(actual.get('X-Next-Cursor'), expected.get('X-Next-Cursor'))
+        return actual
+
+
+@override_settings(PINBOARD_ASYNC_CONCURRENT_QUERIES=False)
+class AsyncReadEndpointTests(AsyncReadEndpointMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_data()
+
+    def test_async_endpoints_match_sync_responses(self):
+        for path in (
+            f'boards/{self.board.pk}/pins/?limit=2',
+            f'follow-streams/{self.stream.pk}/pictures/?limit=2',
+            'search/pins/?q=pin&limit=2',
+            'search/pins/?q=pin&sort_by=likes',
+            'search/pins/',
+        ):
+            with self.subTest(path=path):
+                self.assertSameResponses(path)
+        # 第二页
+        cursor = self.client.get(f'/api/async/boards/{self.board.pk}/pins/?limit=2')['X-Next-Cursor']
+        self.assertSameResponses(f'boards/{self.board.pk}/pins/?limit=2&cursor={cursor}')
+
+        # 条件 GET
+        url = f'/api/async/follow-streams/{self.stream.pk}/pictures/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # 错误响应
+        self.assertSameResponses('boards/999999/pins/')
+        self.assertEqual(self.client.get('/api/async/boards/x/pins/').status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    async def test_token_authenticated_requests(self):
+        # 真实的 token 头走认证缓存（force_authenticate 跳过了它）：第一次未命中，第二次命中
+        auth.clear()
+        key = (await async_db.run(auth.issue, self.viewer)).key
+        client, headers = AsyncClient(), {'Authorization': f'Token {key}'}
+        for path in (
+            f'follow-streams/{self.stream.pk}/pictures/',
+            f'boards/{self.board.pk}/pins/',
+            'search/pins/?q=pin',
+        ):
+            for attempt in ('miss', 'hit'):
+                with self.subTest(path=path, attempt=attempt):
+                    response = await client.get(f'/api/async/{path}', headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.json()), 5)
+            auth.clear()
+        response = await client.get(
+            f'/api/async/follow-streams/{self.stream.pk}/pictures/', headers={'Authorization': 'Token invalid'},
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_same_queries_as_sync_endpoint(self):
+        counts = []
+        for prefix in ('/api/', '/api/async/'):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(f'{prefix}boards/{self.board.pk}/pins/')
+            counts.append(len(captured))
+        self.assertEqual(counts[1], counts[0])
+
+
+class ConcurrentAsyncReadTests(AsyncReadEndpointMixin, TransactionTestCase):
+    """子查询在线程池里各自使用连接，数据需要提交后才能看到"""
+
+    def setUp(self):
+        cache.clear()
+        self.create_data()
+
+    def test_concurrent_subqueries_match_sync_responses(self):
+        self.assertSameResponses(f'follow-streams/{self.stream.pk}/pictures/')
+        data = self.assertSameResponses(f'boards/{self.board.pk}/pins/').json()
+        self.assertEqual([item['is_liked'] for item in data][-1], True)
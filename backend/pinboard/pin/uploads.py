@@ -0,0 +1,263 @@
+"""
+可续传的分块图片上传
+
+    POST   /api/uploads/                   {"filename", "size", "tags"} 创建会话
+    PUT    /api/uploads/<id>/              请求体是一块原始字节，Content-Range: bytes 起-止/总长
+    GET    /api/uploads/<id>/              查询已经收到的字节数（received），断线后从这里继续
+    POST   /api/uploads/<id>/finalize/     校验完整文件，创建 Picture
+    DELETE /api/uploads/<id>/              放弃上传
+
+每块从请求流按 BLOCK_SIZE 读出，先写到这个请求自己的临时文件，认领偏移成功后再拷到
+PINBOARD_UPLOAD_DIR 下会话文件的对应偏移，不经过 Django 的上传处理（内存 / 临时文件）。
+收到文件头后立即按魔数嗅探格式、读出宽高（Pillow 只解析文件头），不支持的格式和超过
+PINBOARD_UPLOAD_MAX_PIXELS 的图片在第一块就被拒绝，不用等整个文件传完。finalize 先对完整文件做一次 verify，再按内容去重存储（pin/blobs.py），
+在一个事务里创建 Picture 并把会话标记为完成；重复 finalize 返回同一张图片。
+
+会话创建 PINBOARD_UPLOAD_SESSION_TTL 秒后过期，过期的会话连同文件在创建新会话时清理。
+"""
+import os
+import re
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import blobs
+from .models import Picture, UploadSession
+
+# 从请求流每次读取、写入的块大小
+BLOCK_SIZE = 64 * 1024
+# 嗅探格式需要的字节数
+SNIFF_BYTES = 12
+# 收到这么多字节还读不出宽高时拒绝（JPEG 的 EXIF 等可能在尺寸信息之前）
+HEADER_LIMIT = 1024 * 1024
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+]
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """上传不合法，返回 status 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_dir():
+    return getattr(settings, 'PINBOARD_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'upload_sessions'))
+
+
+def max_bytes():
+    return getattr(settings, 'PINBOARD_UPLOAD_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'PINBOARD_UPLOAD_MAX_PIXELS', 50 * 1000 * 1000)
+
+
+def session_ttl():
+    return timedelta(seconds=getattr(settings, 'PINBOARD_UPLOAD_SESSION_TTL', 24 * 60 * 60))
+
+
+def path(session):
+    return os.path.join(upload_dir(), f'{session.upload_id.hex}.part')
+
+
+def active_sessions(user):
+    return UploadSession.objects.filter(user=user, created_time__gt=timezone.now() - session_ttl())
+
+
+def remove_file(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired():
+    # 逐行删除，post_delete 信号删除文件
+    UploadSession.objects.filter(created_time__lte=timezone.now() - session_ttl()).delete()
+
+
+def start(user, filename, size, tags=None):
+    if size <= 0:
+        raise UploadError("size must be positive")
+    if size > max_bytes():
+        raise UploadError(f"Images larger than {max_bytes()} bytes are not accepted", status=413)
+    purge_expired()
+    session = UploadSession.objects.create(user=user, filename=os.path.basename(filename), size=size, tags=tags)
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(path(session), 'wb').close()
+    return session
+
+
+# --- 写入 -------------------------------------------------------------------
+
+def parse_content_range(header):
+    """'bytes 起-止/总长' -> (偏移, 长度, 总长)"""
+    match = _CONTENT_RANGE.match((header or '').strip())
+    if match is None:
+        raise UploadError("Content-Range: bytes <start>-<end>/<size> is required")
+    start, end, total = map(int, match.groups())
+    if end < start:
+        raise UploadError("Invalid Content-Range")
+    return start, end - start + 1, total
+
+
+def sniff(head):
+    """按魔数判断格式（Pillow 的格式名），不支持的格式返回 None"""
+    for signature, fmt in SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def inspect(session):
+    """
+    根据已经收到的文件头补上 format / width / height，头部还不完整时留空；
+    不支持的格式、读不出尺寸或尺寸超限时抛出 UploadError
+    """
+    with open(path(session), 'rb') as file:
+        if not session.format:
+            if session.received < SNIFF_BYTES:
+                return
+            session.format = sniff(file.read(SNIFF_BYTES)) or ''
+            if not session.format:
+                raise UploadError("Unsupported image format", status=415)
+            file.seek(0)
+        try:
+            # 只解析文件头，不解码像素
+            with Image.open(file, formats=[session.format]) as image:
+                session.width, session.height = image.size
+        except Exception:
+            if session.received >= min(HEADER_LIMIT, session.size):
+                raise UploadError("Could not read image dimensions")
+            return
+    if session.width * session.height > max_pixels():
+        raise UploadError(f"Images with more than {max_pixels()} pixels are not accepted", status=413)
+
+
+def _receive(session, length, stream):
+    """把请求流里的 length 个字节写到这个请求自己的临时文件，返回文件名；没有收全时删除并报错"""
+    filename = f'{path(session)}.{uuid.uuid4().hex}.chunk'
+    written = 0
+    try:
+        with open(filename, 'wb') as file:
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                file.write(block)
+                written += len(block)
+    except BaseException:
+        remove_file(filename)
+        raise
+    if written < length:
+        remove_file(filename)
+        raise UploadError(f"Chunk is incomplete: received {written} of {length} bytes")
+    return filename
+
+
+def write_chunk(session, offset, length, total, stream):
+    """
+    把请求流里的 length 个字节写到 offset，返回更新后的会话。
+    offset 必须等于已经收到的字节数；一块没有收全（客户端断线）时不推进 received，
+    客户端从 received 重发。文件头校验失败时会话被删除。
+
+    每个请求先把整块收到自己的临时文件里，再用条件 UPDATE 认领这个偏移，只有认领成功的
+    请求才写会话文件（和 UPDATE 在同一个事务里，写失败时 received 不前进）。同一块被并发重发时，
+    输掉的请求不会碰会话文件，断线的重发也不会截掉别人已经写好的字节
+    """
+    if session.status != 'uploading':
+        raise UploadError("Upload is already finalized", status=409)
+    if total != session.size or offset + length > session.size:
+        raise UploadError("Content-Range does not match the upload size")
+    if offset != session.received:
+        raise UploadError(f"Expected offset {session.received}", status=409)
+
+    chunk = _receive(session, length, stream)
+    try:
+        with transaction.atomic():
+            if not UploadSession.objects.filter(pk=session.pk, received=offset).update(received=offset + length):
+                session.refresh_from_db()
+                raise UploadError(f"Expected offset {session.received}", status=409)
+            with open(chunk, 'rb') as source, open(path(session), 'r+b') as file:
+                file.seek(offset)
+                shutil.copyfileobj(source, file, BLOCK_SIZE)
+                file.truncate(offset + length)
+    finally:
+        remove_file(chunk)
+    session.received = offset + length
+
+    if session.width is None:
+        try:
+            inspect(session)
+        except UploadError:
+            session.delete()
+            raise
+        UploadSession.objects.filter(pk=session.pk).update(
+            format=session.format, width=session.width, height=session.height,
+        )
+    return session
+
+
+# --- 完成 -------------------------------------------------------------------
+
+def verify(session):
+    """完整文件的校验：文件头里读到过尺寸，Pillow 按块读完整个文件检查结构"""
+    if session.width is None:
+        raise UploadError("Could not read image dimensions")
+    try:
+        with Image.open(path(session), formats=[session.format]) as image:
+            image.verify()
+    except Exception:
+        raise UploadError("Image file is corrupt")
+
+
+def finalize(session):
+    """返回 (Picture, 是否新建)；Picture 和会话状态在同一个事务里写入"""
+    if session.status == 'complete' and session.picture_id is not None:
+        return session.picture, False
+    if session.received != session.size:
+        raise UploadError(f"Upload is incomplete: received {session.received} of {session.size} bytes", status=409)
+    if not UploadSession.objects.filter(pk=session.pk, status='uploading').update(status='finalizing'):
+        session.refresh_from_db()
+        if session.status == 'complete' and session.picture_id is not None:
+            return session.picture, False
+        raise UploadError("Upload is already being finalized", status=409)
+
+    blob = None
+    try:
+        verify(session)
+        # 哈希和写入存储都在事务之外，不长时间占着写锁
+        with open(path(session), 'rb') as file:
+            blob = blobs.store(File(file, name=session.filename))
+        with transaction.atomic():
+            picture = Picture.objects.create(
+                uploaded_by_id=session.user_id, tags=session.tags, image_file=blob.file.name, blob=blob,
+            )
+            UploadSession.objects.filter(pk=session.pk).update(status='complete', picture=picture)
+    except UploadError:
+        session.delete()
+        raise
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(status='uploading')
+        if blob is not None:
+            blobs.release(blob.pk)
+        raise
+
+    session.status, session.picture = 'complete', picture
+    remove_file(path(session))
+    return picture, True
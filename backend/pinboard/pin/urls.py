@@ -1,15 +1,18 @@
 # core/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+
+from . import async_views
 from .views import (
     UserViewSet, BoardViewSet, PictureViewSet, PinViewSet,
-    FriendshipRequestViewSet, FollowStreamViewSet, LikeViewSet, SearchViewSet
+    FriendshipRequestViewSet, FollowStreamViewSet, LikeViewSet, SearchViewSet, UploadSessionViewSet
 )
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
 router.register(r'boards', BoardViewSet)
 router.register(r'pictures', PictureViewSet)
+router.register(r'uploads', UploadSessionViewSet)
 router.register(r'pins', PinViewSet)
 router.register(r'friend-requests', FriendshipRequestViewSet)
 router.register(r'follow-streams', FollowStreamViewSet)
@@ -19,4 +22,8 @@ router.register(r'search', SearchViewSet, basename='search')
 
 urlpatterns = [
     path('', include(router.urls)),
+    # 异步版本的热点读接口，在 ASGI 下运行（见 pin/async_views.py）
+    path('async/follow-streams/<int:pk>/pictures/', async_views.stream_pictures),
+    path('async/search/pins/', async_views.search_pins),
+    path('async/boards/<int:pk>/pins/', async_views.board_pins),
 ]
\ No newline at end of file
@@ -1,20 +1,62 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.generics import get_object_or_404
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from rest_framework.authtoken.models import Token
 from django.utils import timezone
 from .models import (
     CustomUser, FriendshipRequest, Friendship, Board, Picture,
-    Pin, FollowStream, Like, Comment
+    Pin, FollowStream, Like, Comment, UploadSession
 )
 from .serializers import (
     UserSerializer, FriendshipRequestSerializer, FriendshipSerializer,
-    BoardSerializer, PictureSerializer, PinSerializer,
-    FollowStreamSerializer, LikeSerializer, CommentSerializer
+    BoardSerializer, BoardSummarySerializer, PictureSerializer, PinSerializer,
+    FollowStreamSerializer, FollowStreamSummarySerializer, LikeSerializer, CommentSerializer, TagSerializer,
+    UploadSessionSerializer
 )
-from django.db.models import Q # For complex lookups
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects # For complex lookups
+from . import auth, bulk, conditional, feed, friends, likes, response_cache, search, tags, uploads
+from .pagination import (
+    BOARD_ORDERING, PIN_ORDERING, USER_ORDERING, KeysetPagination, PinCursorPagination
+)
+
+
+def boards_with_pins(queryset):
+    """BoardSerializer 会嵌套序列化全部 Pin，这里一次性预取"""
+    return queryset.select_related('owner').prefetch_related(
+        Prefetch('pins', queryset=Pin.objects.with_related())
+    )
+
+
+def query_list(request, param):
+    """逗号分隔的查询参数，例如 ?expand=pins 或 ?fields=board_id,board_name"""
+    value = request.query_params.get(param, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def serialize_boards(request, queryset):
+    """
+    Board 列表默认返回摘要（Pin 数量和封面缩略图）；?expand=pins 时才返回完整的
+    Pin / 评论树。?fields= 只返回指定的字段
+    """
+    fields = query_list(request, 'fields') or None
+    context = {'request': request}
+    if 'pins' in query_list(request, 'expand'):
+        return BoardSerializer(boards_with_pins(queryset), many=True, context=context, fields=fields).data
+    return BoardSummarySerializer(queryset.select_related('owner'), many=True, context=context, fields=fields).data
+
+
+def serialize_streams(request, streams):
+    """关注流默认只返回关注的 Board id；?expand=boards 时返回完整的 Board 树"""
+    fields = query_list(request, 'fields') or None
+    context = {'request': request}
+    if 'boards' in query_list(request, 'expand'):
+        prefetch_related_objects(streams, 'user', Prefetch('boards', queryset=boards_with_pins(Board.objects.all())))
+        return FollowStreamSerializer(streams, many=True, context=context, fields=fields).data
+    prefetch_related_objects(streams, Prefetch('boards', queryset=Board.objects.only('board_id')))
+    return FollowStreamSummarySerializer(streams, many=True, context=context, fields=fields).data
 
 # Example: UserViewSet for signup (you'd expand this)
 class UserViewSet(viewsets.ModelViewSet):
@@ -22,7 +64,8 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny] # 注册时允许任何人
 
-    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], url_path='login')
+    # 请求里带着过期的 token 也可以重新登录
+    @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], authentication_classes=[], url_path='login')
     def login(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
@@ -32,11 +75,21 @@ class UserViewSet(viewsets.ModelViewSet):
 
         user = authenticate(username=username, password=password)
         if user:
-            # 创建或获取用户的 Token
-            token, _ = Token.objects.get_or_create(user=user)
+            # 获取用户有效的 Token，没有或已过期时签发新的（见 pin/auth.py）
+            token = auth.issue(user)
             return Response({'token': token.key, 'user_id': user.id, 'username': user.username})
         return Response({'error': '用户名或密码错误'}, status=status.HTTP_401_UNAUTHORIZED)
 
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated], url_path='logout')
+    def logout(self, request):
+        auth.revoke(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated], url_path='rotate-token')
+    def rotate_token(self, request):
+        token = auth.rotate(request.user)
+        return Response({'token': token.key})
+
     # 注册用户的action
     @action(detail=False, methods=['post'], permission_classes=[permissions.AllowAny], url_path='register')
     def register(self, request):
@@ -51,9 +104,12 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='by-username/(?P<username>[^/.]+)')
     def get_by_username(self, request, username=None):
         try:
-            user = CustomUser.objects.get(username=username)
-            serializer = self.get_serializer(user)
-            return Response(serializer.data)
+            # 共享的响应体缓存，is_friend 在读取时按当前用户填回（见 pin/response_cache.py）
+            data = response_cache.cached_response(
+                'user', username, request,
+                lambda: self.get_serializer(CustomUser.objects.get(username=username)).data,
+            )
+            return Response(data)
         except CustomUser.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -62,9 +118,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_user_boards(self, request, pk=None):
         try:
             user = self.get_object()
-            boards = Board.objects.filter(owner=user)
-            serializer = BoardSerializer(boards, many=True)
-            return Response(serializer.data)
+            return Response(serialize_boards(request, Board.objects.filter(owner=user)))
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -73,16 +127,19 @@ class UserViewSet(viewsets.ModelViewSet):
     def get_user_pins(self, request, pk=None):
         try:
             user = self.get_object()
-            pins = Pin.objects.filter(user=user)
-            serializer = PinSerializer(pins, many=True, context={'request': request})
-            return Response(serializer.data)
+            pins = Pin.objects.filter(user=user).with_related()
+            paginator = PinCursorPagination()
+            page = paginator.paginate_queryset(pins, request, view=self)
+            serializer = PinSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     # 获取/更新当前登录用户信息的action
     @action(detail=False, methods=['get', 'put', 'patch'], permission_classes=[permissions.IsAuthenticated], url_path='me')
     def me(self, request):
-        user = request.user # 获取当前登录的用户
+        # request.user 来自认证缓存，只加载了几个字段，读完整的用户用于序列化和保存
+        user = CustomUser.objects.get(pk=request.user.pk)
         if request.method == 'GET':
             serializer = self.get_serializer(user)
             return Response(serializer.data)
@@ -92,6 +149,9 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(user, data=request.data, partial=(request.method == 'PATCH'))
             if serializer.is_valid():
                 serializer.save() # UserSerializer 会处理字段的更新，包括 profile_info
+                if 'password' in serializer.validated_data:
+                    # 修改密码后旧的 token 作废，返回新签发的 token
+                    return Response({**serializer.data, 'token': auth.rotate(user).key})
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -101,25 +161,42 @@ class UserViewSet(viewsets.ModelViewSet):
         """获取用户的好友列表"""
         try:
             user = self.get_object()
-
-            # 查找该用户参与的所有好友关系
-            # Friendship 表中记录了 user1 和 user2 之间的好友关系
-            # 需要查找所有 user1=user 或 user2=user 的记录
-            friendships = Friendship.objects.filter(
-                Q(user1=user) | Q(user2=user)
-            )
-
-            # 提取好友用户对象
-            friends = []
-            for friendship in friendships:
-                friend = friendship.user2 if friendship.user1 == user else friendship.user1
-                friends.append(friend)
-
-            serializer = UserSerializer(friends, many=True, context={'request': request})
+            # 好友 id 集合有缓存（pin/friends.py），好友列表一次查询
+            friend_list = CustomUser.objects.filter(pk__in=friends.friend_ids(user.pk)).order_by('username')
+            serializer = UserSerializer(friend_list, many=True, context={'request': request})
             return Response(serializer.data)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated], url_path='mutual-friends')
+    def mutual_friends(self, request, pk=None):
+        """当前用户和这个用户的共同好友，两个好友子查询的交集，按用户名分页"""
+        user = self.get_object()
+        mutual = CustomUser.objects.filter(friends.mutual_friends_q(request.user.pk, user.pk))
+        paginator = KeysetPagination(ordering=USER_ORDERING)
+        page = paginator.paginate_queryset(mutual, request, view=self)
+        serializer = UserSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated], url_path='people-you-may-know')
+    def people_you_may_know(self, request):
+        """可能认识的人，按共同好友数量排序；已经有待处理好友请求的用户不再推荐"""
+        pending = FriendshipRequest.objects.filter(
+            Q(sender=request.user) | Q(receiver=request.user), status='pending'
+        ).values_list('sender_id', 'receiver_id')
+        requested = {user_id for pair in pending for user_id in pair}
+        candidates = [item for item in friends.suggestions(request.user.pk) if item.id not in requested]
+
+        paginator = KeysetPagination(ordering=('-mutual_count', 'id'))
+        page = paginator.paginate_list(candidates, request)
+        users = CustomUser.objects.in_bulk([item.id for item in page])
+        page = [item for item in page if item.id in users]
+        serializer = UserSerializer([users[item.id] for item in page], many=True, context={'request': request})
+        data = serializer.data
+        for user_data, item in zip(data, page):
+            user_data['mutual_count'] = item.mutual_count
+        return paginator.get_paginated_response(data)
+
 
     # 其他 UserViewSet 的方法，例如 list, retrieve, update, destroy
     # 你可能需要调整这些方法的权限，例如：
@@ -141,6 +218,31 @@ class BoardViewSet(viewsets.ModelViewSet):
     serializer_class = BoardSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly] # Basic permission
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = boards_with_pins(queryset)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # 列表默认返回摘要，?expand=pins 返回完整的 Pin 树
+        return Response(serialize_boards(request, self.filter_queryset(self.get_queryset())))
+
+    def retrieve(self, request, *args, **kwargs):
+        # 先只查版本戳，客户端缓存仍然有效时直接 304（见 pin/conditional.py）
+        stamp = get_object_or_404(Board.objects.values('version', 'updated_at'), pk=kwargs['pk'])
+        # Board 详情嵌套了所有 Pin，使用共享的响应体缓存（见 pin/response_cache.py）
+        return conditional.conditional_response(
+            request,
+            conditional.etag(
+                request, 'board', kwargs['pk'], stamp['version'], conditional.likes_version('board', kwargs['pk']),
+            ),
+            stamp['updated_at'],
+            lambda: Response(response_cache.cached_response(
+                'board', kwargs['pk'], request, lambda: self.get_serializer(self.get_object()).data
+            )),
+        )
+
     def perform_create(self, serializer):
         # Set owner to the currently logged-in user [cite: 21]
         serializer.save(owner=self.request.user)
@@ -148,17 +250,18 @@ class BoardViewSet(viewsets.ModelViewSet):
     # Custom action to get boards for the current user
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def my_boards(self, request):
-        user_boards = Board.objects.filter(owner=request.user)
-        serializer = self.get_serializer(user_boards, many=True)
-        return Response(serializer.data)
+        user_boards = self.get_queryset().filter(owner=request.user)
+        return Response(serialize_boards(request, user_boards))
     
     @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticatedOrReadOnly], url_path='pins')
     def pins(self, request, pk=None):
         try:
             board = self.get_object()  # 获取当前的 Board 对象
-            pins = Pin.objects.filter(board=board)  # 查询与该 Board 关联的所有 Pin
-            serializer = PinSerializer(pins, many=True, context={'request': request})
-            return Response(serializer.data)
+            pins = Pin.objects.filter(board=board).with_related()  # 查询与该 Board 关联的所有 Pin
+            paginator = PinCursorPagination()
+            page = paginator.paginate_queryset(pins, request, view=self)
+            serializer = PinSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
         except Board.DoesNotExist:
             return Response({"error": "Board not found"}, status=status.HTTP_404_NOT_FOUND)
         
@@ -195,7 +298,7 @@ class BoardViewSet(viewsets.ModelViewSet):
             )
 
 class PictureViewSet(viewsets.ModelViewSet):
-    queryset = Picture.objects.all()
+    queryset = Picture.objects.select_related('uploaded_by', 'blob').prefetch_related('blob__variants')
     serializer_class = PictureSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
@@ -203,6 +306,7 @@ class PictureViewSet(viewsets.ModelViewSet):
         # 处理图片上传 - 可以是文件上传或URL
         external_url = self.request.data.get('external_url')
 
+        # tags 字符串会在 Picture 保存时拆分成规范化标签（见 pin/signals.py）
         if external_url:
             # 如果提供了外部URL，使用URL保存图片
             serializer.save(
@@ -221,12 +325,13 @@ class PictureViewSet(viewsets.ModelViewSet):
             # Example: simple 'contains' search on tags.
             # For more advanced search, consider Django's search features or dedicated libraries.
             # The project mentions "contain operator" [cite: 53]
-            pictures = Picture.objects.filter(tags__icontains=query) # Case-insensitive contains
+            pictures = search.PICTURE_INDEX.filter(self.get_queryset(), query)
 
             # Sorting [cite: 27]
             sort_by = request.query_params.get('sort_by', 'time') # Default sort by time
-            if sort_by == 'relevance': # Relevance is tricky without more definition
-                pass # Implement relevance sorting if defined
+            ranked = search.PICTURE_INDEX.annotate_relevance(pictures, query) if sort_by == 'relevance' else None
+            if ranked is not None: # bm25 relevance from the full-text index
+                pictures = ranked.order_by('relevance', '-upload_time')
             elif sort_by == 'likes':
                 # This requires a more complex query to count likes on pins associated with these pictures
                 # and then ordering. For simplicity, we'll order by upload_time here.
@@ -240,10 +345,75 @@ class PictureViewSet(viewsets.ModelViewSet):
         return Response({"error": "Query parameter 'q' is required for search."}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UploadSessionViewSet(viewsets.GenericViewSet):
+    """大图的分块、可续传上传（见 pin/uploads.py）"""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = UploadSession.objects.all()
+
+    def get_queryset(self):
+        # 只能访问自己没有过期的会话
+        return uploads.active_sessions(self.request.user)
+
+    def _error(self, e):
+        return Response({"error": str(e)}, status=e.status)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = uploads.start(request.user, **serializer.validated_data)
+        except uploads.UploadError as e:
+            return self._error(e)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def update(self, request, pk=None):
+        """请求体是一块原始字节，Content-Range 给出它在文件中的位置"""
+        session = self.get_object()
+        try:
+            offset, length, total = uploads.parse_content_range(request.headers.get('Content-Range'))
+            if int(request.headers.get('Content-Length') or 0) != length:
+                raise uploads.UploadError("Content-Length does not match Content-Range")
+            # 直接读原始请求流，不经过 DRF 的解析器
+            session = uploads.write_chunk(session, offset, length, total, request.stream)
+        except uploads.UploadError as e:
+            response = self._error(e)
+            if e.status == status.HTTP_409_CONFLICT:
+                response.data['received'] = session.received
+            return response
+        return Response(self.get_serializer(session).data)
+
+    def destroy(self, request, pk=None):
+        self.get_object().delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        try:
+            picture, created = uploads.finalize(session)
+        except uploads.UploadError as e:
+            return self._error(e)
+        return Response(
+            PictureSerializer(picture, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
 class PinViewSet(viewsets.ModelViewSet):
     queryset = Pin.objects.all()
     serializer_class = PinSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = PinCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.with_related()
+        return queryset
 
     def get_serializer_context(self):
         # 将 request 添加到序列化器上下文
@@ -251,6 +421,13 @@ class PinViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    def retrieve(self, request, *args, **kwargs):
+        # 共享的响应体缓存，is_liked 等字段在读取时按当前用户填回（见 pin/response_cache.py）
+        data = response_cache.cached_response(
+            'pin', kwargs['pk'], request, lambda: self.get_serializer(self.get_object()).data
+        )
+        return Response(data)
+
     def perform_create(self, serializer):
         # Set user to the currently logged-in user [cite: 3]
         # Ensure picture is created or exists before pinning
@@ -260,9 +437,16 @@ class PinViewSet(viewsets.ModelViewSet):
     def get_comments(self, request, pk=None):
         try:
             pin = self.get_object()  # 获取当前的 Pin 对象
-            comments = Comment.objects.filter(pin=pin).order_by('-timestamp')  # 按时间倒序排列
-            serializer = CommentSerializer(comments, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+
+            def render():
+                comments = Comment.objects.filter(pin=pin).select_related('user').order_by('-timestamp')  # 按时间倒序排列
+                serializer = CommentSerializer(comments, many=True, context={'request': request})
+                return Response(serializer.data, status=status.HTTP_200_OK)
+
+            # 评论没有变化时直接 304（见 pin/conditional.py）
+            return conditional.conditional_response(
+                request, conditional.etag(request, 'comments', pin.pk, pin.version), pin.updated_at, render
+            )
         except Pin.DoesNotExist:
             return Response({"error": "Pin not found"}, status=status.HTTP_404_NOT_FOUND)
         
@@ -275,7 +459,7 @@ class PinViewSet(viewsets.ModelViewSet):
 
            # 检查是否仅允许好友评论
             if allow_friends_comment:
-                is_friend = Friendship.objects.filter(user1=request.user, user2=pin.user).exists()
+                is_friend = friends.are_friends(request.user.pk, pin.user_id)
                 is_owner = pin.board.owner == request.user  # 检查当前用户是否是 Board 的 owner
                 if not (is_friend or is_owner):
                     return Response({"error": "You are not allowed to comment on this pin. Only friends are allowed to comment on this board."}, status=status.HTTP_403_FORBIDDEN)
@@ -298,49 +482,21 @@ class PinViewSet(viewsets.ModelViewSet):
             return Response({"error": "Pin not found."}, status=status.HTTP_404_NOT_FOUND)
         
     @action(detail=True, methods=['post'], url_path='like', permission_classes=[permissions.IsAuthenticated])
-    def like_pin(self, request, pk=None):   
-        try:
-            pin = self.get_object()  # 获取当前的 Pin 对象
-            # 获取原始pin对象
-            if pin.origin_pin:
-                pin = pin.origin_pin  # 如果是 Repin，获取原始 Pin 对象
-            user = request.user
-
-            # 检查用户是否已经喜欢过这个 Pin
-            if Like.objects.filter(user=user, pin=pin).exists():
-                return Response({"error": "You have already liked this pin."}, status=status.HTTP_400_BAD_REQUEST)
-
-            # 创建新的 Like 对象
-            like = Like.objects.create(user=user, pin=pin)
-
-            # 序列化并返回新创建的 Like
-            serializer = LikeSerializer(like)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+    def like_pin(self, request, pk=None):
+        # 幂等：已经点过赞时返回 200 和当前状态（见 pin/likes.py）
+        pin = self.get_object()
+        data, created = likes.like(request.user, pin)
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
-        except Pin.DoesNotExist:
-            return Response({"error": "Pin not found."}, status=status.HTTP_404_NOT_FOUND)
-        
     @action(detail=True, methods=['post'], url_path='unlike', permission_classes=[permissions.IsAuthenticated])
     def unlike_pin(self, request, pk=None):
-        try:
-            pin = self.get_object()  # 获取当前的 Pin 对象
-            # 获取原始pin对象
-            if pin.origin_pin:
-                pin = pin.origin_pin  # 如果是 Repin，获取原始 Pin 对象
-            user = request.user
-
-            # 检查用户是否已经喜欢过这个 Pin
-            like = Like.objects.filter(user=user, pin=pin)
-            if not like.exists():
-                return Response({"error": "You have not liked this pin."}, status=status.HTTP_400_BAD_REQUEST)
+        # 幂等：没有点过赞时同样返回当前状态
+        return Response(likes.unlike(request.user, self.get_object()))
 
-            # 删除 Like 对象
-            like.delete()
+    @action(detail=True, methods=['post'], url_path='toggle-like', permission_classes=[permissions.IsAuthenticated])
+    def toggle_like(self, request, pk=None):
+        return Response(likes.toggle(request.user, self.get_object()))
 
-            return Response({"message": "Like removed successfully."}, status=status.HTTP_204_NO_CONTENT)
-        except Pin.DoesNotExist:
-            return Response({"error": "Pin not found."}, status=status.HTTP_404_NOT_FOUND)
-        
     @action(detail=True, methods=['post'], url_path='repin', permission_classes=[permissions.IsAuthenticated])
     def repin(self, request, pk=None):
         try:
@@ -370,6 +526,34 @@ class PinViewSet(viewsets.ModelViewSet):
         except Pin.DoesNotExist:
             return Response({"error": "Pin not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[permissions.IsAuthenticated])
+    def bulk_create(self, request):
+        """批量创建 Pin：{"pins": [{"board": 1, "picture": 2, "title": "..."}, ...]}"""
+        try:
+            return Response(bulk.create_pins(request.user, bulk.items(request.data, 'pins')))
+        except bulk.BulkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk-like', permission_classes=[permissions.IsAuthenticated])
+    def bulk_like(self, request):
+        """批量点赞：{"pins": [1, 2, 3]}"""
+        try:
+            return Response(bulk.like_pins(request.user, bulk.items(request.data, 'pins')))
+        except bulk.BulkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk-repin', permission_classes=[permissions.IsAuthenticated])
+    def bulk_repin(self, request):
+        """批量转存：{"board": 5, "pins": [{"pin": 1}, {"pin": 2, "board": 6, "title": "..."}]}"""
+        try:
+            values = bulk.items(request.data, 'pins')
+            board = request.data.get('board') if isinstance(request.data, dict) else None
+            if board is not None and not str(board).isdigit():
+                return Response({"error": "board must be a board id"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(bulk.repin_pins(request.user, values, int(board) if board is not None else None))
+        except bulk.BulkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     def destroy(self, request, *args, **kwargs):
         try:
             pin = self.get_object()
@@ -381,12 +565,14 @@ class PinViewSet(viewsets.ModelViewSet):
                 )
             # 获取关联的图片
             picture = pin.picture
-            # 执行Pin删除
-            response = super().destroy(request, *args, **kwargs)
-            # 检查图片是否还被其他Pin引用
-            if picture and not Pin.objects.filter(picture=picture).exists():
-                # 如果没有其他Pin引用此图片，则删除图片
-                picture.delete()
+            with transaction.atomic():
+                # 执行Pin删除
+                response = super().destroy(request, *args, **kwargs)
+                # 检查图片是否还被其他Pin引用
+                if picture and not Pin.objects.filter(picture=picture).exists():
+                    # 如果没有其他Pin引用此图片，则删除图片；
+                    # 文件按内容共享，其他图片还在使用时保留（见 pin/blobs.py）
+                    picture.delete()
             return response
 
         except Exception as e:
@@ -449,7 +635,7 @@ class FriendshipRequestViewSet(viewsets.ModelViewSet):
             friend_request.save()
 
             # 创建 Friendship 记录
-            Friendship.objects.create(user1=friend_request.sender, user2=friend_request.receiver)
+            friends.befriend(friend_request.sender, friend_request.receiver)
 
             return Response({'status': 'friend request accepted'})
         return Response({'status': 'failed'}, status=status.HTTP_400_BAD_REQUEST)
@@ -475,24 +661,39 @@ class FollowStreamViewSet(viewsets.ModelViewSet):
         # Users should only see their own follow streams (private) [cite: 1]
         return FollowStream.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        # 默认只返回关注的 Board id，?expand=boards 返回完整的 Board 树
+        return Response(serialize_streams(request, list(self.filter_queryset(self.get_queryset()))))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(serialize_streams(request, [self.get_object()])[0])
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user) # [cite: 49]
 
     @action(detail=True, methods=['get'])
     def pictures(self, request, pk=None): # [cite: 50]
         follow_stream = self.get_object()
-        # Get all pins from all boards in this stream
-        # This needs to be efficient.
-        board_ids = follow_stream.boards.values_list('board_id', flat=True)
-        # Get pictures associated with pins on these boards
-        # Pins contain pictures and timestamps. Order by pin timestamp.
-        pins_in_stream = Pin.objects.filter(board_id__in=board_ids).order_by('-timestamp')
+        # Pins come from the stream's precomputed timeline (see pin/feed.py),
+        # merged with live pins of boards too popular to fan out on write.
         # We need pictures, not pins directly in the response as per "displays all pictures"
         # However, the order is on the pin.
-        # This might be complex if you need unique pictures ordered by their latest pin time in the stream.
-        # For simplicity, let's serialize the pins:
-        serializer = PinSerializer(pins_in_stream, many=True, context={'request': request})
-        return Response(serializer.data)
+        # For simplicity, let's serialize the pins (newest first, keyset-paginated):
+        def render():
+            paginator = PinCursorPagination()
+            page = feed.paginate_stream(follow_stream, paginator, request)
+            serializer = PinSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
+        # 流的版本戳没变时直接 304；ETag 包含游标和页大小（见 pin/conditional.py）
+        return conditional.conditional_response(
+            request,
+            conditional.etag(
+                request, 'stream', follow_stream.pk, follow_stream.version,
+                conditional.likes_version('stream', follow_stream.pk), request.get_full_path(),
+            ),
+            follow_stream.updated_at, render,
+        )
 
     @action(detail=True, methods=['get', 'post'], url_path='boards')
     def handle_boards(self, request, pk=None):
@@ -500,9 +701,7 @@ class FollowStreamViewSet(viewsets.ModelViewSet):
         # if method is GET, return the content list as response
         if request.method == 'GET':
             # 获取面板列表
-            boards = stream.boards.all()
-            serializer = BoardSerializer(boards, many=True)
-            return Response(serializer.data)
+            return Response(serialize_boards(request, stream.boards.all()))
         # else add board in stream and return the response
         elif request.method == 'POST':
             # 添加面板
@@ -517,7 +716,7 @@ class FollowStreamViewSet(viewsets.ModelViewSet):
                     return Response({"error": "Board not found"},
                                     status=status.HTTP_404_NOT_FOUND)
 
-                if board in stream.boards.all():
+                if stream.boards.filter(pk=board.pk).exists():
                     return Response({"message": "Board is already in this stream"},
                                     status=status.HTTP_200_OK)
 
@@ -538,6 +737,15 @@ class FollowStreamViewSet(viewsets.ModelViewSet):
                     "error": "Failed to add board to stream. Please try again later."
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=True, methods=['post'], url_path='bulk-boards')
+    def bulk_add_boards(self, request, pk=None):
+        """一次把多个 Board 加入关注流：{"board_ids": [1, 2, 3]}"""
+        stream = self.get_object()
+        try:
+            return Response(bulk.add_stream_boards(stream, bulk.items(request.data, 'board_ids')))
+        except bulk.BulkError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['delete'], url_path='boards/(?P<board_id>[^/.]+)')
     def remove_board(self, request, pk=None, board_id=None):
         try:
@@ -604,118 +812,111 @@ class CommentViewSet(viewsets.ModelViewSet):
 
 
 class SearchViewSet(viewsets.ViewSet):
+    # 各种排序方式对应的 keyset 排序键（最后一个字段唯一，保证游标稳定）
+    # 计数来自 Pin 上的冗余计数列，排序直接走索引，不需要 annotate(Count(...))
+    PIN_SORT_ORDERINGS = {
+        'likes': ('-like_count', '-pin_id'),
+        'comments': ('-comment_count', '-pin_id'),
+        'repins': ('-repin_count', '-pin_id'),
+    }
+
+    def _rank(self, index, queryset, query, sort_by, ordering, columns=None):
+        """sort_by=relevance 时按全文索引的 bm25 排序，没有索引时保持原排序"""
+        if sort_by == 'relevance':
+            ranked = index.annotate_relevance(queryset, query, columns)
+            if ranked is not None:
+                pk_name = index.model._meta.pk.name
+                return ranked, ('relevance', f'-{pk_name}')
+        return queryset, ordering
+
+    def _paginate_pins(self, request, pins, sort_by, query, columns=None):
+        # 游标分页，page 参数不再使用；默认按时间排序
+        pins, ordering = self._rank(
+            search.PIN_INDEX, pins, query, sort_by,
+            self.PIN_SORT_ORDERINGS.get(sort_by, PIN_ORDERING), columns,
+        )
+        paginator = KeysetPagination(ordering=ordering)
+        page = paginator.paginate_queryset(pins, request, view=self)
+        serializer = PinSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='pins')
     def search_pins(self, request):
-        from django.db.models import Count  # 在方法内导入Count
-
         query = request.query_params.get('q', '').strip()
-        page = int(request.query_params.get('page', 1))
-        limit = int(request.query_params.get('limit', 20))
         sort_by = request.query_params.get('sort_by', 'timestamp')
 
         if not query:
             return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 搜索 Pin（通过标题或图片标签）
-        pins = Pin.objects.filter(
-            Q(picture__tags__icontains=query) | Q(title__icontains=query)
-        ).distinct()
-
-        # 添加排序逻辑
-        if sort_by == 'likes':
-            # 按点赞数量排序（从高到低）
-            # 使用 annotate 来计算每个 Pin 的点赞数量
-            pins = pins.annotate(likes_count=Count('likes_received')).order_by('-likes_count')
-        elif sort_by == 'comments':
-            # 按评论数量排序
-            pins = pins.annotate(comments_count=Count('comments')).order_by('-comments_count')
-        elif sort_by == 'repins':
-            # 按转存次数排序
-            pins = pins.annotate(repin_count=Count('repins')).order_by('-repin_count')
-        else:  # 默认按时间排序
-            pins = pins.order_by('-timestamp')
+        # 搜索 Pin（通过标题或图片标签，走全文索引）
+        pins = search.PIN_INDEX.filter(Pin.objects.with_related(), query)
 
-        # 分页
-        start = (page - 1) * limit
-        end = start + limit
-        serializer = PinSerializer(pins[start:end], many=True, context={'request': request})
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self._paginate_pins(request, pins, sort_by, query)
 
     @action(detail=False, methods=['get'], url_path='boards')
     def search_boards(self, request):
         query = request.query_params.get('q', '').strip()
-        page = int(request.query_params.get('page', 1))
-        limit = int(request.query_params.get('limit', 20))
+        sort_by = request.query_params.get('sort_by', 'timestamp')
 
         if not query:
             return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 搜索 Board
-        boards = Board.objects.filter(
-            Q(board_name__icontains=query) | Q(descriptor__icontains=query)  # 使用正确的字段名称
-        )
+        # 搜索 Board（名称或描述）
+        boards = search.BOARD_INDEX.filter(Board.objects.all(), query)
+        boards, ordering = self._rank(search.BOARD_INDEX, boards, query, sort_by, BOARD_ORDERING)
 
         # 分页
-        start = (page - 1) * limit
-        end = start + limit
-        serializer = BoardSerializer(boards[start:end], many=True)
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination(ordering=ordering)
+        page = paginator.paginate_queryset(boards_with_pins(boards), request, view=self)
+        serializer = BoardSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='users')
     def search_users(self, request):
         query = request.query_params.get('q', '').strip()
-        page = int(request.query_params.get('page', 1))
-        limit = int(request.query_params.get('limit', 20))
+        sort_by = request.query_params.get('sort_by', 'username')
 
         if not query:
             return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         # 搜索用户
-        users = CustomUser.objects.filter(username__icontains=query)
+        users = search.USER_INDEX.filter(CustomUser.objects.all(), query)
+        users, ordering = self._rank(search.USER_INDEX, users, query, sort_by, USER_ORDERING)
 
         # 分页
-        start = (page - 1) * limit
-        end = start + limit
-        serializer = UserSerializer(users[start:end], many=True, context={'request': request})
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = KeysetPagination(ordering=ordering)
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UserSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'], url_path='tags')
     def search_tags(self, request):
-        from django.db.models import Count  # 在方法内导入Count
-
         query = request.query_params.get('q', '').strip()
-        page = int(request.query_params.get('page', 1))
-        limit = int(request.query_params.get('limit', 20))
         sort_by = request.query_params.get('sort_by', 'timestamp')
 
         if not query:
             return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 搜索 Tags（通过图片的 tag）
-        pins = Pin.objects.filter(picture__tags__icontains=query).distinct()
-
-        # 添加排序逻辑
-        if sort_by == 'likes':
-            # 按点赞数量排序（从高到低）
-            pins = pins.annotate(likes_count=Count('likes_received')).order_by('-likes_count')
-        elif sort_by == 'comments':
-            # 按评论数量排序
-            pins = pins.annotate(comments_count=Count('comments')).order_by('-comments_count')
-        elif sort_by == 'repins':
-            # 按转存次数排序
-            pins = pins.annotate(repin_count=Count('repins')).order_by('-repin_count')
-        else:  # 默认按时间排序
-            pins = pins.order_by('-timestamp')
-
-        # 分页
-        start = (page - 1) * limit
-        end = start + limit
-        serializer = PinSerializer(pins[start:end], many=True, context={'request': request})
-
+        # 搜索 Tags：查询拆成规范化标签，图片必须包含所有标签（走 PictureTag 索引）
+        names = tags.parse_tags(query)
+        if not names:
+            # 只有分隔符（例如 "q=,"）时没有任何条件，不能返回全部 Pin
+            return Response({"error": "Query parameter 'q' must contain a tag."}, status=status.HTTP_400_BAD_REQUEST)
+        pins = Pin.objects.with_related()
+        for name in names:
+            pins = pins.filter(picture__picture_tags__tag__name=name)
+
+        return self._paginate_pins(request, pins, sort_by, query, columns=('tags',))
+
+    @action(detail=False, methods=['get'], url_path='tag-suggestions')
+    def tag_suggestions(self, request):
+        """标签自动补全：按前缀匹配，使用次数多的排在前面"""
+        prefix = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+        serializer = TagSerializer(tags.suggest(prefix, limit), many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 # You would also need views for Friendship if you want to list/delete them directly.
 # Often friendships are managed through the accept/reject actions on FriendshipRequest.
\ No newline at end of file
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'pin.CustomUser'
 
 MIDDLEWARE = [
+    # 按接口统计查询和序列化开销，PINBOARD_PROFILING 打开时生效（见 pin/profiling.py）
+    'pin.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -63,6 +65,8 @@ MIDDLEWARE = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+# 游标分页把下一页游标放在响应头里，条件 GET 用 ETag / Last-Modified，前端需要能读到
+CORS_EXPOSE_HEADERS = ['Link', 'X-Next-Cursor', 'ETag', 'Last-Modified', 'Server-Timing']
 
 ROOT_URLCONF = 'pinboard.urls'
 
@@ -88,13 +92,60 @@ WSGI_APPLICATION = 'pinboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# 用环境变量 PINBOARD_DB_ENGINE 选择数据库：sqlite（默认）或 postgresql。
+#
+# SQLite 的数据库文件由迁移 0022 切换到 WAL 日志（读不阻塞写、写不阻塞读，切换一次一直有效，
+# 只是连接数据库不会改写文件）；每个连接建立时执行 PINBOARD_SQLITE_PRAGMAS：
+# busy_timeout 让并发写入排队等待而不是立即报 "database is locked"；
+# 事务用 BEGIN IMMEDIATE 开始，避免两个事务都从读锁升级为写锁时其中一个失败。
+#
+# PostgreSQL 需要安装 psycopg（pip install "psycopg[binary]"），默认使用持久连接
+# （PINBOARD_DB_CONN_MAX_AGE 秒）；PINBOARD_DB_POOL=1 时改用 psycopg 连接池
+# （需要 "psycopg[pool]"，和持久连接不能同时使用）。搜索使用 pg_trgm 三元组索引（0019 迁移）。
+PINBOARD_DB_ENGINE = os.environ.get('PINBOARD_DB_ENGINE', 'sqlite')
+
+PINBOARD_SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',  # WAL 模式下只在检查点时 fsync，断电最多丢失最近的事务
+    'busy_timeout': int(os.environ.get('PINBOARD_SQLITE_BUSY_TIMEOUT', 5000)),  # 毫秒
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # 负数的单位是 KiB
+    'temp_store': 'MEMORY',
 }
 
+if PINBOARD_DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PINBOARD_DB_NAME', 'pinboard'),
+            'USER': os.environ.get('PINBOARD_DB_USER', ''),
+            'PASSWORD': os.environ.get('PINBOARD_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PINBOARD_DB_HOST', ''),
+            'PORT': os.environ.get('PINBOARD_DB_PORT', ''),
+            'CONN_MAX_AGE': int(os.environ.get('PINBOARD_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('PINBOARD_DB_POOL'):
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('PINBOARD_DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('PINBOARD_DB_POOL_MAX_SIZE', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('PINBOARD_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(
+                    f'PRAGMA {name} = {value}' for name, value in PINBOARD_SQLITE_PRAGMAS.items()
+                ),
+            },
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -141,9 +192,97 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'pin.auth.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-}
\ No newline at end of file
+}
+
+
+# 响应缓存（见 pin/response_cache.py）。locmem 只在单个进程内有效，
+# 多个 worker 进程时改用 FileBasedCache 或其他共享后端，例如：
+# {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/var/tmp/pinboard_cache'}
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pinboard',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Pinboard settings
+# 被超过这么多关注流关注的 Board 不做写扩散，读关注流时实时合并（见 pin/feed.py）
+PINBOARD_FEED_FANOUT_LIMIT = 1000
+
+# 上传图片生成的派生宽度（px），以及生成任务使用的线程数（见 pin/imaging.py）
+PINBOARD_IMAGE_VARIANT_WIDTHS = [236, 474, 736]
+PINBOARD_IMAGE_WORKERS = 2
+PINBOARD_IMAGE_VARIANTS_ASYNC = True
+
+# external_url 图片的本地镜像（见 pin/mirror.py），默认关闭
+PINBOARD_MIRROR_EXTERNAL_IMAGES = False
+PINBOARD_MIRROR_TIMEOUT = 10  # 秒，连接和整个下载的时间上限
+PINBOARD_MIRROR_MAX_BYTES = 10 * 1024 * 1024
+PINBOARD_MIRROR_DISK_BUDGET = 1024 * 1024 * 1024  # 超出后按最近访问时间淘汰
+PINBOARD_MIRROR_REVALIDATE_AFTER = 24 * 60 * 60  # 秒
+PINBOARD_MIRROR_WORKERS = 2
+PINBOARD_MIRROR_QUEUE_LIMIT = 100
+PINBOARD_MIRROR_ASYNC = True
+# 是否允许抓取内网 / 回环地址（防止 SSRF，只在测试和内网部署时打开）
+PINBOARD_MIRROR_ALLOW_PRIVATE = False
+
+# 共享响应体缓存：Board / Pin 详情和按用户名查用户（见 pin/response_cache.py）
+PINBOARD_RESPONSE_CACHE = True
+PINBOARD_RESPONSE_CACHE_ALIAS = 'default'
+PINBOARD_RESPONSE_CACHE_TIMEOUT = 300  # 秒，失效信号之外的兜底过期时间
+
+# 每个用户的好友 id 集合缓存（见 pin/friends.py），好友关系变化时失效
+PINBOARD_FRIEND_CACHE_ALIAS = 'default'
+PINBOARD_FRIEND_CACHE_TIMEOUT = 60 * 60  # 秒
+# 可能认识的人：每个用户最多计算这么多推荐，结果缓存的秒数
+PINBOARD_FRIEND_SUGGESTION_LIMIT = 500
+PINBOARD_FRIEND_SUGGESTION_TIMEOUT = 10 * 60
+
+# 批量写入接口（pins/bulk、bulk-like、bulk-repin、follow-streams/<id>/bulk-boards）每个请求的条目上限
+PINBOARD_BULK_MAX_ITEMS = 5000
+
+# 点赞写缓冲（见 pin/like_buffer.py），默认关闭：打开后点赞先记在进程内，按间隔批量写入
+PINBOARD_LIKE_BUFFER = False
+PINBOARD_LIKE_BUFFER_INTERVAL = 1.0  # 秒
+PINBOARD_LIKE_BUFFER_MAX_PENDING = 10000
+PINBOARD_LIKE_BUFFER_ASYNC = True
+
+# Token 认证（见 pin/auth.py）：token 签发后的有效期（秒，None 表示不过期），
+# 以及进程内 token -> 用户 缓存的大小和重新查库的间隔（秒）
+PINBOARD_TOKEN_TTL = 14 * 24 * 60 * 60
+PINBOARD_TOKEN_CACHE_SIZE = 10000
+PINBOARD_TOKEN_CACHE_TIMEOUT = 60
+# 保存每个用户的作废版本号的缓存，多个 worker 进程时必须是共享后端（见上面的 CACHES）
+PINBOARD_TOKEN_CACHE_ALIAS = 'default'
+
+# 异步读接口（见 pin/async_views.py）：序列化前互不依赖的查询是否在线程池里并发执行
+PINBOARD_ASYNC_CONCURRENT_QUERIES = True
+
+# 上传图片的发送（见 pin/media.py）：None 由 Django 发送（FileResponse，支持 Range），
+# 'x-accel-redirect'（nginx，internal location 为 PINBOARD_MEDIA_ACCEL_PREFIX）或
+# 'x-sendfile'（Apache / lighttpd）交给前端代理发送；按内容摘要命名的文件永久缓存，
+# 其他文件缓存 PINBOARD_MEDIA_MAX_AGE 秒
+PINBOARD_MEDIA_SENDFILE = None
+PINBOARD_MEDIA_ACCEL_PREFIX = '/protected-media/'
+PINBOARD_MEDIA_MAX_AGE = 60 * 60
+PINBOARD_MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# 分块上传（见 pin/uploads.py）：收到一半的文件放在 PINBOARD_UPLOAD_DIR（不在 MEDIA_ROOT 下，
+# 不会被公开访问），单张图片的字节数和像素数上限，会话的有效期（秒）
+PINBOARD_UPLOAD_DIR = os.path.join(BASE_DIR, 'upload_sessions')
+PINBOARD_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+PINBOARD_UPLOAD_MAX_PIXELS = 50 * 1000 * 1000
+PINBOARD_UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# 按接口的查询 / 序列化统计（见 pin/profiling.py）：每个接口保留的最近请求数，
+# 写到 PINBOARD_PROFILING_DIR 供 `manage.py profiling_report` 汇总的间隔（秒）
+PINBOARD_PROFILING = os.environ.get('PINBOARD_PROFILING') == '1'
+PINBOARD_PROFILING_WINDOW = 500
+PINBOARD_PROFILING_FLUSH_INTERVAL = 10
+PINBOARD_PROFILING_DIR = os.path.join(BASE_DIR, 'profiling')
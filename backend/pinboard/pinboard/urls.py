@@ -1,8 +1,12 @@
 # pinterest_clone/urls.py
+import re
+import urllib.parse
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from pin import media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -12,6 +16,9 @@ urlpatterns = [
     # path('api/auth/registration/', include('dj_rest_auth.registration.urls')),
 ]
 
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# 上传的图片：长期缓存头、范围请求，可以交给前端代理发送（见 pin/media.py）；
+# MEDIA_URL 是 CDN 等外部地址时不经过 Django
+if not urllib.parse.urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve),
+    ]
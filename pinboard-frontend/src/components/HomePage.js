@@ -24,7 +24,7 @@ const EndMessage = styled.div`
 
 const HomePage = () => {
   const [pins, setPins] = useState([]);
-  const [page, setPage] = useState(1);
+  const [cursor, setCursor] = useState(null);
   const [hasMore, setHasMore] = useState(true);
   const [loading, setLoading] = useState(true);
   const [fetchingMore, setFetchingMore] = useState(false);
@@ -33,15 +33,13 @@ const HomePage = () => {
   const fetchPins = async () => {
     try {
       setFetchingMore(true);
-      const response = await getPins(page);
+      const response = await getPins(cursor);
       const newPins = response.data;
+      const nextCursor = response.headers['x-next-cursor'];
 
-      if (newPins.length === 0) {
-        setHasMore(false);
-      } else {
-        setPins(prevPins => [...prevPins, ...newPins]);
-        setPage(prevPage => prevPage + 1);
-      }
+      setPins(prevPins => [...prevPins, ...newPins]);
+      setCursor(nextCursor || null);
+      setHasMore(Boolean(nextCursor));
 
       setLoading(false);
       setFetchingMore(false);
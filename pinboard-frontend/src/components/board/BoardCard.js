@@ -83,8 +83,8 @@ const BoardCard = ({ board }) => {
       }
 
       try {
-        // 获取pins
-        const response = await getBoardPins(board.board_id);
+        // 封面只需要第一个 pin
+        const response = await getBoardPins(board.board_id, null, 1);
         const pins = response.data;
         
         if (pins && pins.length > 0) {
@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useMemo } from 'react';
 import { useParams, Link, useNavigate } from 'react-router-dom';
+import InfiniteScroll from 'react-infinite-scroll-component';
 import { useAuth } from '../../context/AuthContext';
 import { getBoard, deleteBoard } from '../../services/boardService';
 import { getBoardPins } from '../../services/pinService';
@@ -23,7 +24,8 @@ import {
   StatItem,
   EmptyState,
   EmptyStateTitle,
-  EmptyStateMessage
+  EmptyStateMessage,
+  LoadingMessage
 } from './BoardPage.styles';
 
 const BoardPage = () => {
@@ -33,6 +35,9 @@ const BoardPage = () => {
 
   const [board, setBoard] = useState(null);
   const [pins, setPins] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [hasMore, setHasMore] = useState(false);
+  const [fetchingMore, setFetchingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [successMessage, setSuccessMessage] = useState('');
@@ -74,10 +79,12 @@ const BoardPage = () => {
       setBoard(boardResponse.data);
       setFollowerCount(boardResponse.data.follower_count || 0);
 
-      // 获取 pins
+      // 只取第一页 pins，后面的页滚动时再取
       const pinsResponse = await getBoardPins(boardId);
-      console.log('Pins:', pinsResponse.data);
+      const nextCursor = pinsResponse.headers['x-next-cursor'];
       setPins(pinsResponse.data);
+      setCursor(nextCursor || null);
+      setHasMore(Boolean(nextCursor));
 
       // 检查关注状态
       if (currentUser) {
@@ -93,6 +100,24 @@ const BoardPage = () => {
     }
   };
 
+  // 顺着 X-Next-Cursor 取下一页 pins
+  const fetchMorePins = async () => {
+    if (!cursor || fetchingMore) return;
+    try {
+      setFetchingMore(true);
+      const response = await getBoardPins(boardId, cursor);
+      const nextCursor = response.headers['x-next-cursor'];
+      setPins(prevPins => [...prevPins, ...response.data]);
+      setCursor(nextCursor || null);
+      setHasMore(Boolean(nextCursor));
+    } catch (err) {
+      console.error('Failed to fetch more pins:', err);
+      setHasMore(false);
+    } finally {
+      setFetchingMore(false);
+    }
+  };
+
   const handleFollowToggle = () => {
     if (!currentUser) {
       navigate('/login');
@@ -252,13 +277,20 @@ const BoardPage = () => {
         </UserInfo>
 
         <Stats>
-          <StatItem>{pins.length} Pins</StatItem>
+          <StatItem>{board.pin_count ?? pins.length} Pins</StatItem>
           <StatItem>{followerCount} Followers</StatItem>
         </Stats>
       </BoardHeader>
 
       {pins.length > 0 ? (
-        <PinGrid pins={pins} />
+        <InfiniteScroll
+          dataLength={pins.length}
+          next={fetchMorePins}
+          hasMore={hasMore}
+          loader={fetchingMore && <LoadingMessage>Loading more pins...</LoadingMessage>}
+        >
+          <PinGrid pins={pins} />
+        </InfiniteScroll>
       ) : (
         <EmptyState>
           <EmptyStateTitle>This board has no pins yet</EmptyStateTitle>
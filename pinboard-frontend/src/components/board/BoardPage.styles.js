@@ -127,4 +127,9 @@ export const EmptyStateTitle = styled.h3`
 export const EmptyStateMessage = styled.p`
   color: var(--text-secondary);
   margin-bottom: var(--spacing-lg);
-`;
\ No newline at end of file
+`;
+export const LoadingMessage = styled.div`
+  text-align: center;
+  padding: var(--spacing-lg);
+  color: var(--text-secondary);
+`;
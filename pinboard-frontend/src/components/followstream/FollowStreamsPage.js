@@ -407,7 +407,7 @@ const FollowStreamsPage = () => {
           if (stream.stream_id === streamId) {
             return {
               ...stream,
-              boards: stream.boards.filter(board => board.board_id !== boardId)
+              boards: (stream.boards || []).filter(board => board.board_id !== boardId)
             };
           }
           return stream;
@@ -587,7 +587,7 @@ const FollowStreamsPage = () => {
                     stream.boards.map(board => (
                       <BoardCard key={board.board_id} to={`/board/${board.board_id}`}>
                         <BoardName>{board.board_name}</BoardName>
-                        <BoardStats>{board.pins?.length || 0} pins</BoardStats>
+                        <BoardStats>{board.pin_count ?? board.pins?.length ?? 0} pins</BoardStats>
                         <RemoveButton
                           onClick={(e) => {
                             e.preventDefault();
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
+import InfiniteScroll from 'react-infinite-scroll-component';
 import { getFollowStream, getStreamPins } from '../../services/followService';
 import PinGrid from '../pin/PinGrid';
 import Spinner from '../common/Spinner';
@@ -64,6 +65,12 @@ const PinsContainer = styled.div`
   margin-top: 1rem;
 `;
 
+const LoadingMessage = styled.div`
+  text-align: center;
+  padding: 2rem;
+  color: #666;
+`;
+
 const EmptyState = styled.div`
   padding: 3rem;
   text-align: center;
@@ -101,6 +108,9 @@ const StreamPinsPage = () => {
   
   const [stream, setStream] = useState(null);
   const [pins, setPins] = useState([]);
+  const [cursor, setCursor] = useState(null);
+  const [hasMore, setHasMore] = useState(false);
+  const [fetchingMore, setFetchingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   
@@ -114,9 +124,12 @@ const StreamPinsPage = () => {
         const streamResponse = await getFollowStream(streamId);
         setStream(streamResponse.data);
         
-        // Fetch all pins from stream
+        // 只取第一页 pins，后面的页滚动时再取
         const pinsResponse = await getStreamPins(streamId);
+        const nextCursor = pinsResponse.headers['x-next-cursor'];
         setPins(pinsResponse.data);
+        setCursor(nextCursor || null);
+        setHasMore(Boolean(nextCursor));
         
         setLoading(false);
       } catch (err) {
@@ -129,6 +142,24 @@ const StreamPinsPage = () => {
     fetchData();
   }, [streamId]);
   
+  // 顺着 X-Next-Cursor 取下一页 pins
+  const fetchMorePins = async () => {
+    if (!cursor || fetchingMore) return;
+    try {
+      setFetchingMore(true);
+      const response = await getStreamPins(streamId, cursor);
+      const nextCursor = response.headers['x-next-cursor'];
+      setPins(prevPins => [...prevPins, ...response.data]);
+      setCursor(nextCursor || null);
+      setHasMore(Boolean(nextCursor));
+    } catch (err) {
+      console.error('Failed to fetch more stream pins:', err);
+      setHasMore(false);
+    } finally {
+      setFetchingMore(false);
+    }
+  };
+  
   const handleBackClick = () => {
     navigate('/follow-streams');
   };
@@ -159,7 +190,7 @@ const StreamPinsPage = () => {
         <StreamInfo>
           <StreamName>{stream?.stream_name || 'Stream'}</StreamName>
           <BoardCount>
-            {stream?.boards?.length || 0} boards • {pins.length} pins
+            {(stream?.board_ids || stream?.boards || []).length} boards
           </BoardCount>
         </StreamInfo>
         
@@ -173,7 +204,14 @@ const StreamPinsPage = () => {
       
       <PinsContainer>
         {pins.length > 0 ? (
-          <PinGrid pins={pins} />
+          <InfiniteScroll
+            dataLength={pins.length}
+            next={fetchMorePins}
+            hasMore={hasMore}
+            loader={fetchingMore && <LoadingMessage>Loading more pins...</LoadingMessage>}
+          >
+            <PinGrid pins={pins} />
+          </InfiniteScroll>
         ) : (
           <EmptyState>
             <EmptyStateTitle>No pins in this stream</EmptyStateTitle>
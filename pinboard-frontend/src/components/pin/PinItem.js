@@ -182,6 +182,8 @@ const PinItem = ({ pin }) => {
   };
 
   const imageUrl = pin.picture_detail?.image_url || pin.picture_detail?.image_file;
+  // 服务端生成的缩略图，网格里不需要下载原图
+  const imageSrcSet = pin.picture_detail?.srcset?.jpeg;
   const imageAlt = pin.picture_detail?.tags ?? pin.title ?? 'Pin image';
   const pinTitle = pin.title ?? 'Untitled';
   const pinUsername = pin.user?.username || 'User';
@@ -192,6 +194,8 @@ const PinItem = ({ pin }) => {
         {!imageError && imageUrl ? (
           <PinImage
             src={imageUrl}
+            srcSet={imageSrcSet || undefined}
+            sizes="(max-width: 768px) 50vw, 25vw"
             alt={imageAlt}
             loading="lazy"
             onError={() => setImageError(true)}
@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, Link, useNavigate } from 'react-router-dom';
+import InfiniteScroll from 'react-infinite-scroll-component';
 import { useAuth } from '../../context/AuthContext';
 import { getUserProfile, getCurrentUserProfile } from '../../services/userService';
 import { getBoards } from '../../services/boardService';
@@ -29,6 +30,7 @@ import {
   Tab,
   BoardsGrid,
   PinGridWrapper,
+  LoadingMessage,
   EmptyState,
   EmptyStateTitle,
   EmptyStateMessage,
@@ -45,6 +47,9 @@ const ProfilePage = () => {
   const [profile, setProfile] = useState(null);
   const [boards, setBoards] = useState([]);
   const [pins, setPins] = useState([]);
+  const [pinsCursor, setPinsCursor] = useState(null);
+  const [hasMorePins, setHasMorePins] = useState(false);
+  const [fetchingMorePins, setFetchingMorePins] = useState(false);
   const [activeTab, setActiveTab] = useState('boards');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
@@ -107,11 +112,12 @@ const ProfilePage = () => {
       
       try {
         const pinsResponse = await getUserPins(userId);
-        setPins(Array.isArray(pinsResponse.data) ? pinsResponse.data : []);
+        receivePins(pinsResponse, false);
         setPinsLoaded(true);
       } catch (err) {
         console.error('Failed to fetch pins:', err);
         setPins([]);
+        setHasMorePins(false);
       }
       
       if (currentUser && currentUser.username !== username) {
@@ -143,6 +149,29 @@ const ProfilePage = () => {
     }
   };
   
+  // 记下一页 pins 和 X-Next-Cursor，append 为 true 时接在已有的 pins 后面
+  const receivePins = (response, append) => {
+    const newPins = Array.isArray(response.data) ? response.data : [];
+    const nextCursor = response.headers['x-next-cursor'];
+    setPins(prevPins => (append ? [...prevPins, ...newPins] : newPins));
+    setPinsCursor(nextCursor || null);
+    setHasMorePins(Boolean(nextCursor));
+  };
+  
+  const fetchMorePins = async () => {
+    if (!pinsCursor || fetchingMorePins || !profile) return;
+    try {
+      setFetchingMorePins(true);
+      const pinsResponse = await getUserPins(profile.user_id || profile.id, pinsCursor);
+      receivePins(pinsResponse, true);
+    } catch (err) {
+      console.error('Failed to fetch more pins:', err);
+      setHasMorePins(false);
+    } finally {
+      setFetchingMorePins(false);
+    }
+  };
+  
   const handleTabChange = (tab) => {
     setActiveTab(tab);
     
@@ -152,11 +181,12 @@ const ProfilePage = () => {
       const loadPins = async () => {
         try {
           const pinsResponse = await getUserPins(userId);
-          setPins(Array.isArray(pinsResponse.data) ? pinsResponse.data : []);
+          receivePins(pinsResponse, false);
           setPinsLoaded(true);
         } catch (err) {
           console.error('Failed to fetch pins after tab switch:', err);
           setPins([]);
+          setHasMorePins(false);
         }
       };
       
@@ -230,7 +260,7 @@ const ProfilePage = () => {
               <StatLabel>Boards</StatLabel>
             </StatItem>
             <StatItem>
-              <StatValue>{pins.length || profile.pin_count || 0}</StatValue>
+              <StatValue>{profile.pin_count ?? pins.length}</StatValue>
               <StatLabel>Pins</StatLabel>
             </StatItem>
             <StatItem>
@@ -316,7 +346,14 @@ const ProfilePage = () => {
           <TabContent>
             {pins.length > 0 ? (
               <PinGridWrapper>
-                <PinGrid pins={pins} />
+                <InfiniteScroll
+                  dataLength={pins.length}
+                  next={fetchMorePins}
+                  hasMore={hasMorePins}
+                  loader={fetchingMorePins && <LoadingMessage>Loading more pins...</LoadingMessage>}
+                >
+                  <PinGrid pins={pins} />
+                </InfiniteScroll>
               </PinGridWrapper>
             ) : (
               <EmptyState>
@@ -255,4 +255,10 @@ export const PinGridWrapper = styled.div`
   max-width: 1200px;
   padding-right: 16px; // 补偿PinGrid的负边距
   box-sizing: border-box;
-`;
\ No newline at end of file
+`;
+
+export const LoadingMessage = styled.div`
+  text-align: center;
+  padding: 2rem;
+  color: #666;
+`;
@@ -1,5 +1,5 @@
 import React, { createContext, useState, useEffect, useContext } from 'react';
-import { getCurrentUser } from '../services/authService';
+import { getCurrentUser, logout as logoutRequest } from '../services/authService';
 
 // 创建认证上下文
 const AuthContext = createContext();
@@ -25,8 +25,8 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
-    localStorage.removeItem('user');
-    localStorage.removeItem('token');
+    // 作废服务端 token 并清除本地存储
+    logoutRequest();
     setCurrentUser(null);
   };
 
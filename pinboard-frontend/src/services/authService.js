@@ -19,6 +19,11 @@ export const register = async (userData) => {
 };
 
 export const logout = () => {
+  // 通知后端作废 token；拦截器读取 localStorage 时 token 已被清除，所以显式带上
+  const token = localStorage.getItem('token');
+  if (token) {
+    api.post('/users/logout/', null, { headers: { Authorization: `Token ${token}` } }).catch(() => {});
+  }
   localStorage.removeItem('token');
   localStorage.removeItem('user');
 };
@@ -30,9 +30,11 @@ export const getStreamBoards = async (streamId) => {
   return await api.get(`/follow-streams/${streamId}/boards/`);
 };
 
-// 获取关注流中的所有图钉
-export const getStreamPins = async (streamId) => {
-  return await api.get(`/follow-streams/${streamId}/pictures/`);
+// 获取关注流中的一页图钉（游标分页）
+export const getStreamPins = async (streamId, cursor = null, limit = 20) => {
+  return await api.get(`/follow-streams/${streamId}/pictures/`, {
+    params: { cursor, limit }
+  });
 };
 
 // 在这个实现中，followBoard 必须通过 addBoardToStream 来关注面板
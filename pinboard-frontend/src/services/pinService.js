@@ -1,9 +1,9 @@
 import api from './api';
 
-// 获取所有图钉（分页）
-export const getPins = async (page = 1, limit = 20) => {
+// 获取所有图钉（游标分页，下一页游标在 X-Next-Cursor 响应头里）
+export const getPins = async (cursor = null, limit = 20) => {
   return await api.get('/pins/', {
-    params: { page, limit }
+    params: { cursor, limit }
   });
 };
 
@@ -12,17 +12,17 @@ export const getPin = async (pinId) => {
   return await api.get(`/pins/${pinId}/`);
 };
 
-// 获取指定面板的所有图钉
-export const getBoardPins = async (boardId, page = 1, limit = 20) => {
+// 获取指定面板的一页图钉（游标分页，下一页游标在 X-Next-Cursor 响应头里）
+export const getBoardPins = async (boardId, cursor = null, limit = 20) => {
   return await api.get(`/boards/${boardId}/pins/`, {
-    params: { page, limit }
+    params: { cursor, limit }
   });
 };
 
-// 获取用户的所有图钉
-export const getUserPins = async (userId, page = 1, limit = 20) => {
+// 获取用户的一页图钉（游标分页）
+export const getUserPins = async (userId, cursor = null, limit = 20) => {
   return await api.get(`/users/${userId}/pins/`, {
-    params: { page, limit }
+    params: { cursor, limit }
   });
 };
 
@@ -45,12 +45,12 @@ export const checkFriendshipStatus = async (userId) => {
 
 // 获取共同好友
 export const getMutualFriends = async (userId) => {
-  return await api.get(`/users/${userId}/mutual-friends`);
+  return await api.get(`/users/${userId}/mutual-friends/`);
 };
 
 // 获取好友推荐
 export const getFriendRecommendations = async () => {
-  return await api.get('/friends/recommendations');
+  return await api.get('/users/people-you-may-know/');
 };
 
 // 获取好友动态